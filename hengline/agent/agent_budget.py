@@ -0,0 +1,155 @@
+"""@FileName: agent_budget.py
+@Description: 智能体单次请求的预算控制：工具迭代次数、token总量和截止时间
+@Author: HengLine
+@Time: 2025/10/10 10:40
+"""
+import os
+import sys
+import time
+from typing import Dict, Any, Optional, List
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import warning
+
+# 预算耗尽原因
+REASON_ITERATIONS = "max_tool_iterations"
+REASON_TOKENS = "max_total_tokens"
+REASON_DEADLINE = "deadline"
+
+# 预算耗尽且没有可用回答时的提示
+BUDGET_EXHAUSTED_ANSWER = "抱歉，问题处理超出了本次请求的资源限制，未能生成完整回答，请简化问题后重试。"
+
+
+class AgentBudget:
+    """智能体预算配置"""
+
+    def __init__(self, budget_config: Dict[str, Any] = None):
+        budget_config = budget_config or {}
+        self.max_tool_iterations = budget_config.get("max_tool_iterations", 4)
+        self.max_total_tokens = budget_config.get("max_total_tokens", 8000)
+        self.timeout_seconds = budget_config.get("timeout_seconds", 60)
+
+    def new_tracker(self) -> "BudgetTracker":
+        """为一次请求创建预算跟踪器"""
+        return BudgetTracker(self)
+
+
+class BudgetTracker:
+    """单次请求的预算跟踪器，通过LangGraph的configurable传入图中的节点"""
+
+    def __init__(self, budget: AgentBudget):
+        self.budget = budget
+        self.start_time = time.perf_counter()
+        self.tool_iterations = 0
+        self.llm_calls = 0
+        self.total_tokens = 0
+        self.tokens_estimated = False
+        self.exhausted_reason = None
+
+    @property
+    def recursion_limit(self) -> int:
+        """LangGraph递归上限，作为迭代预算之外的兜底"""
+        # 每轮工具迭代占用智能体和工具两个节点，另留出收尾的一步
+        return self.budget.max_tool_iterations * 2 + 3
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def remaining_time(self) -> Optional[float]:
+        """距离截止时间的剩余秒数，未配置截止时间时返回None"""
+        if not self.budget.timeout_seconds:
+            return None
+        return max(0.0, self.budget.timeout_seconds - self.elapsed())
+
+    def record_llm_response(self, messages: List[Any], response: Any):
+        """记录一次模型调用消耗的token，优先使用模型返回的用量"""
+        self.llm_calls += 1
+
+        tokens = self._get_usage_tokens(response)
+        if tokens is None:
+            # 模型未返回用量时按字符数粗略估算
+            self.tokens_estimated = True
+            tokens = sum(len(str(getattr(message, "content", message))) for message in messages)
+            tokens += len(str(getattr(response, "content", "")))
+        self.total_tokens += tokens
+
+        if getattr(response, "tool_calls", None):
+            self.tool_iterations += 1
+
+    @staticmethod
+    def _get_usage_tokens(response) -> Optional[int]:
+        usage = getattr(response, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            return usage["total_tokens"]
+
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        if token_usage.get("total_tokens"):
+            return token_usage["total_tokens"]
+        return None
+
+    def check(self) -> Optional[str]:
+        """检查预算，返回耗尽原因，未耗尽时返回None"""
+        if self.budget.timeout_seconds and self.elapsed() >= self.budget.timeout_seconds:
+            return REASON_DEADLINE
+        if self.budget.max_total_tokens and self.total_tokens >= self.budget.max_total_tokens:
+            return REASON_TOKENS
+        if self.tool_iterations >= self.budget.max_tool_iterations:
+            return REASON_ITERATIONS
+        return None
+
+    def mark_exhausted(self, reason: str):
+        if self.exhausted_reason is None:
+            self.exhausted_reason = reason
+            warning(f"智能体预算耗尽({reason})，提前结束: 工具迭代 {self.tool_iterations} 次, "
+                    f"token {self.total_tokens}, 耗时 {self.elapsed():.1f}s")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """本次请求的预算消耗情况"""
+        return {
+            "tool_iterations": self.tool_iterations,
+            "max_tool_iterations": self.budget.max_tool_iterations,
+            "llm_calls": self.llm_calls,
+            "total_tokens": self.total_tokens,
+            "max_total_tokens": self.budget.max_total_tokens,
+            "tokens_estimated": self.tokens_estimated,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "timeout_seconds": self.budget.timeout_seconds,
+            "exhausted": self.exhausted_reason
+        }
+
+
+def get_budget_tracker(config) -> Optional[BudgetTracker]:
+    """从LangGraph节点的config中取出预算跟踪器"""
+    if not config:
+        return None
+    return (config.get("configurable") or {}).get("budget_tracker")
+
+
+def best_answer_so_far(messages: List[Any]) -> str:
+    """预算耗尽时从已有消息中提取目前最好的回答
+
+    优先使用模型最近一次给出的文本，其次使用工具返回的结果。
+    只考虑最后一条用户消息之后的内容，避免把会话中之前的回答当作本轮回答。
+    """
+    current_turn = []
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        current_turn.insert(0, message)
+
+    for message in reversed(current_turn):
+        if isinstance(message, AIMessage) and isinstance(message.content, str) and message.content.strip():
+            return message.content
+
+    tool_outputs = [message.content for message in current_turn
+                    if isinstance(message, ToolMessage) and getattr(message, "status", "success") == "success"
+                    and isinstance(message.content, str) and message.content.strip()]
+    if tool_outputs:
+        return "根据目前检索到的信息：\n\n" + "\n\n".join(tool_outputs)
+
+    return BUDGET_EXHAUSTED_ANSWER
@@ -14,10 +14,14 @@ from hengline.logger import logger
 
 # 从基类导入
 from hengline.agent.base_agent import BaseMedicalAgent
+from hengline.agent.tracing import TimedEmbeddings
+from hengline.agent.http_clients import http_client_factory
 
 # 导入OpenAI特定的库
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
+DEFAULT_OPENAI_API_URL = "https://api.openai.com/v1"
+
 
 class OpenAIBaseAgent(BaseMedicalAgent):
     """OpenAI API的基础智能体类，提供OpenAI模型的通用初始化和配置功能"""
@@ -59,14 +63,20 @@ class OpenAIBaseAgent(BaseMedicalAgent):
                 logger.error("未提供API密钥，请在配置文件中设置或设置环境变量OPENAI_API_KEY")
                 return None
 
-            # 初始化ChatOpenAI客户端
+            # 初始化ChatOpenAI客户端，与嵌入模型及其他智能体共用同一地址的连接池
+            http_client, http_async_client = http_client_factory.get_clients(
+                openai_config.get("api_url") or DEFAULT_OPENAI_API_URL)
             llm = ChatOpenAI(
                 api_key=api_key,
                 model=openai_config.get("model", "gpt-4o"),
                 temperature=openai_config.get("temperature", 0.1),
                 streaming=openai_config.get("streaming", True),
+                # 流式调用时让服务端在最后一个片段返回token用量
+                stream_usage=True,
                 max_tokens=openai_config.get("max_tokens", 2048),
-                base_url=openai_config.get("api_url", None)  # 如果使用自定义API端点
+                base_url=openai_config.get("api_url", None),  # 如果使用自定义API端点
+                http_client=http_client,
+                http_async_client=http_async_client
             )
 
             logger.info(f"OpenAI API模型初始化成功: {openai_config.get('model', 'gpt-4o')}")
@@ -89,10 +99,15 @@ class OpenAIBaseAgent(BaseMedicalAgent):
             try:
                 if api_key:
                     # 使用OpenAI的嵌入模型
+                    api_url = api_config.get("api_url") or DEFAULT_OPENAI_API_URL
+                    http_client, http_async_client = http_client_factory.get_clients(api_url)
                     embeddings = OpenAIEmbeddings(
                         api_key=api_key,
+                        base_url=api_url,
                         model=embeddings_config.get("model_name", "text-embedding-3-small"),
-                        model_kwargs=embeddings_config.get("model_kwargs", {})
+                        model_kwargs=embeddings_config.get("model_kwargs", {}),
+                        http_client=http_client,
+                        http_async_client=http_async_client
                     )
                 else:
                     # 如果没有API密钥，使用开源的嵌入模型作为备选
@@ -109,6 +124,9 @@ class OpenAIBaseAgent(BaseMedicalAgent):
                 from langchain_community.embeddings import FakeEmbeddings
                 embeddings = FakeEmbeddings(size=768)
 
+            # 记录查询嵌入和文档嵌入的耗时
+            embeddings = TimedEmbeddings(embeddings, agent_type)
+
             # 使用基类的文档加载和处理逻辑
             from langchain.text_splitter import CharacterTextSplitter
             from langchain_community.document_loaders import TextLoader
@@ -41,70 +41,87 @@ class OpenAIGenerativeAgent(OpenAIBaseAgent):
             return {}
         
         try:
-            # 定义提示模板
+            # 定义提示模板：生成要求作为固定的系统消息，主题放在最后的用户消息中
             prompt_templates = {
-                "general_info": ChatPromptTemplate.from_template(
-                    "你是一位经验丰富的医学专家。请提供关于{topic}的一般医学信息，包括定义、常见症状和基本预防措施。"
-                    "回答应简洁明了，适合一般读者理解。"
-                ),
-                "detailed_explanation": ChatPromptTemplate.from_template(
-                    "你是一位经验丰富的医学专家。请提供关于{topic}的详细医学解释，包括病理机制、临床表现、诊断标准、治疗方案和预后评估。"
-                    "回答应包含专业医学术语，适合医疗专业人员或有医学背景的读者。"
-                ),
-                "patient_education": ChatPromptTemplate.from_template(
-                    "你是一位经验丰富的医学专家。请为患者创建关于{topic}的教育材料，以简单易懂的语言解释该主题。"
-                    "包括：什么是该病症、为什么会发生、患者可能有什么感觉、如何治疗、日常生活中如何管理、何时需要就医等内容。"
-                    "请使用友好、支持性的语气。"
-                ),
-                "medical_case": ChatPromptTemplate.from_template(
-                    "你是一位经验丰富的医学专家。请创建一个关于{topic}的临床案例，包括患者基本信息、主诉、现病史、既往史、体格检查、辅助检查、诊断过程、治疗方案和随访建议。"
-                    "案例应尽可能真实，包含详细的医学信息和临床推理过程。"
-                )
+                "general_info": ChatPromptTemplate.from_messages([
+                    ("system", "你是一位经验丰富的医学专家。请提供关于用户给定主题的一般医学信息，包括定义、常见症状和基本预防措施。"
+                               "回答应简洁明了，适合一般读者理解。"),
+                    ("human", "主题: {topic}")
+                ]),
+                "detailed_explanation": ChatPromptTemplate.from_messages([
+                    ("system", "你是一位经验丰富的医学专家。请提供关于用户给定主题的详细医学解释，包括病理机制、临床表现、诊断标准、治疗方案和预后评估。"
+                               "回答应包含专业医学术语，适合医疗专业人员或有医学背景的读者。"),
+                    ("human", "主题: {topic}")
+                ]),
+                "patient_education": ChatPromptTemplate.from_messages([
+                    ("system", "你是一位经验丰富的医学专家。请为患者创建关于用户给定主题的教育材料，以简单易懂的语言解释该主题。"
+                               "包括：什么是该病症、为什么会发生、患者可能有什么感觉、如何治疗、日常生活中如何管理、何时需要就医等内容。"
+                               "请使用友好、支持性的语气。"),
+                    ("human", "主题: {topic}")
+                ]),
+                "medical_case": ChatPromptTemplate.from_messages([
+                    ("system", "你是一位经验丰富的医学专家。请创建一个关于用户给定主题的临床案例，包括患者基本信息、主诉、现病史、既往史、体格检查、辅助检查、诊断过程、治疗方案和随访建议。"
+                               "案例应尽可能真实，包含详细的医学信息和临床推理过程。"),
+                    ("human", "主题: {topic}")
+                ])
             }
-            
-            # 创建生成链
+
+            # 创建生成链，统一登记到提示链注册表以记录调用次数和耗时
             generative_chains = {}
             for gen_type, prompt_template in prompt_templates.items():
-                generative_chains[gen_type] = prompt_template | self.llm | StrOutputParser()
-            
+                generative_chains[gen_type] = self.prompts.register(
+                    f"generate.{gen_type}", prompt_template, self.llm, StrOutputParser())
+
             return generative_chains
         except Exception as e:
             error(f"创建生成链时出错: {str(e)}")
             return {}
         
-    def generate_content(self, topic, generation_type="general_info"):
-        """生成指定主题的医疗内容
-        
-        Args:
-            topic: 要生成内容的主题
-            generation_type: 生成类型，支持general_info、detailed_explanation、patient_education、medical_case
+    def _resolve_generation_chain(self, topic, generation_type):
+        """校验生成参数并返回对应的生成链
         
         Returns:
-            str: 生成的医疗内容
+            tuple: (生成链, 输入数据, 错误信息)，校验失败时生成链为None
         """
         # 验证生成类型
         if generation_type not in self.supported_generation_types:
             valid_types = ", ".join(self.supported_generation_types)
-            return f"不支持的生成类型: {generation_type}。支持的类型: {valid_types}"
+            return None, None, f"不支持的生成类型: {generation_type}。支持的类型: {valid_types}"
         
         # 验证主题
         if not topic or topic.strip() == "":
-            return "主题不能为空"
+            return None, None, "主题不能为空"
+        
+        # 获取相应的生成链
+        if generation_type not in self.generative_chains:
+            return None, None, f"生成链 {generation_type} 未初始化"
+        
+        # 确保生成链不为None
+        chain = self.generative_chains[generation_type]
+        if chain is None:
+            return None, None, f"生成链 {generation_type} 初始化失败"
+        
+        # 准备输入
+        input_data = {
+            "topic": topic.strip()
+        }
         
+        return chain, input_data, None
+        
+    def generate_content(self, topic, generation_type="general_info"):
+        """生成指定主题的医疗内容
+        
+        Args:
+            topic: 要生成内容的主题
+            generation_type: 生成类型，支持general_info、detailed_explanation、patient_education、medical_case
+        
+        Returns:
+            str: 生成的医疗内容
+        """
         try:
-            # 获取相应的生成链
-            if generation_type not in self.generative_chains:
-                return f"生成链 {generation_type} 未初始化"
-            
-            # 准备输入
-            input_data = {
-                "topic": topic.strip()
-            }
-            
-            # 确保生成链不为None
-            chain = self.generative_chains[generation_type]
+            chain, input_data, error_message = self._resolve_generation_chain(topic, generation_type)
             if chain is None:
-                return f"生成链 {generation_type} 初始化失败"
+                return error_message
 
             # 调用生成链
             generated_content = chain.invoke(input_data)
@@ -114,6 +131,33 @@ class OpenAIGenerativeAgent(OpenAIBaseAgent):
             error(f"生成内容时出错: {str(e)}")
             return f"生成内容时出错: {str(e)}"
         
+    async def agenerate_content(self, topic, generation_type="general_info"):
+        """异步生成指定主题的医疗内容，参数与generate_content一致"""
+        try:
+            chain, input_data, error_message = self._resolve_generation_chain(topic, generation_type)
+            if chain is None:
+                return error_message
+
+            # 异步调用生成链
+            return await chain.ainvoke(input_data)
+        except Exception as e:
+            error(f"生成内容时出错: {str(e)}")
+            return f"生成内容时出错: {str(e)}"
+        
+    async def astream_content(self, topic, generation_type="general_info"):
+        """流式生成指定主题的医疗内容，逐token产生事件"""
+        try:
+            chain, input_data, error_message = self._resolve_generation_chain(topic, generation_type)
+            if chain is None:
+                yield {"event": "error", "data": {"message": error_message}}
+                return
+
+            async for event in self._astream_chain(chain, input_data):
+                yield event
+        except Exception as e:
+            error(f"流式生成内容时出错: {str(e)}")
+            yield {"event": "error", "data": {"message": f"生成内容时出错: {str(e)}"}}
+        
     def _determine_generation_type(self, question):
         """根据问题确定生成类型"""
         question_lower = question.lower()
@@ -149,6 +193,28 @@ class OpenAIGenerativeAgent(OpenAIBaseAgent):
         
         return result
 
+    async def arun(self, question, generate_extra_content=False):
+        """异步运行智能体回答问题，可选择是否生成额外内容"""
+        # 调用基类的arun方法获取基本回答
+        result = await super().arun(question)
+
+        # 如果需要生成额外内容
+        if generate_extra_content:
+            try:
+                # 确定生成类型
+                gen_type = self._determine_generation_type(question)
+
+                # 异步生成额外内容
+                extra_content = await self.agenerate_content(question, gen_type)
+
+                # 组合回答
+                result = f"{result}\n\n\n===== 额外生成内容 ({gen_type}) =====\n{extra_content}"
+            except Exception as e:
+                error(f"生成额外内容时出错: {str(e)}")
+                # 不影响基本回答
+
+        return result
+
 
 if __name__ == "__main__":
     # 创建基于OpenAI的生成式医疗智能体实例
@@ -52,19 +52,6 @@ class OpenAIMedicalAgent(OpenAIBaseAgent):
             # 回退到基类的实现
             return super()._create_retrieval_chain()
 
-    def run(self, question):
-        """运行智能体回答问题，针对远程API进行优化"""
-        # 增加API调用计数
-        self.api_call_count += 1
-
-        # 调用基类的run方法
-        result = super().run(question)
-
-        # 如果结果包含token使用信息，可以更新统计
-        # 这里可以根据实际的API响应格式进行调整
-
-        return result
-
     def get_api_stats(self) -> Dict[str, Any]:
         """获取API调用统计信息"""
         return {
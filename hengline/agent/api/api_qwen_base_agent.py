@@ -14,9 +14,12 @@ from hengline.logger import logger
 
 # 从基类导入
 from hengline.agent.base_agent import BaseMedicalAgent
+from hengline.agent.tracing import TimedEmbeddings
+from hengline.agent.http_clients import http_client_factory
 from utils.log_utils import print_log_exception
 
 # 导入Qwen特定的库
+import dashscope
 from langchain_community.chat_models import ChatTongyi
 
 
@@ -57,7 +60,8 @@ class QwenBaseAgent(BaseMedicalAgent):
             # 获取API密钥
             api_key = self.config_reader.get_qwen_api_key()
 
-            # 初始化通义千问模型
+            # 初始化通义千问模型；DashScope SDK基于requests，传入共享会话以复用连接
+            session = http_client_factory.get_session(dashscope.base_http_api_url)
             llm = ChatTongyi(
                 model=model_name,
                 dashscope_api_key=api_key,
@@ -66,7 +70,8 @@ class QwenBaseAgent(BaseMedicalAgent):
                 model_kwargs={
                     "base_url": api_url,
                     "temperature": temperature,
-                    "max_tokens": max_tokens
+                    "max_tokens": max_tokens,
+                    "session": session
                 },
             )
 
@@ -133,6 +138,9 @@ class QwenBaseAgent(BaseMedicalAgent):
                 from langchain_community.embeddings import FakeEmbeddings
                 embeddings = FakeEmbeddings(size=768)
 
+            # 记录查询嵌入和文档嵌入的耗时
+            embeddings = TimedEmbeddings(embeddings, agent_type)
+
             # 使用基类的文档加载和处理逻辑
             from langchain.text_splitter import CharacterTextSplitter
             from langchain_community.document_loaders import TextLoader
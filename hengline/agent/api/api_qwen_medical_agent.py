@@ -14,14 +14,18 @@ from hengline.logger import info, warning, error, debug
 from utils.log_utils import print_log_exception
 
 # 从基类导入
-from hengline.agent.base_agent import MedicalAgentState
 from hengline.agent.api.api_qwen_base_agent import QwenBaseAgent
 
 # 导入LangChain相关库
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langgraph.prebuilt import ToolNode
-from langgraph.graph import StateGraph, END
+
+# 提示模板：固定的系统指令在前，用户输入在后，使各次调用共享相同的前缀
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "你是一位经验丰富的医学专家。请回答用户的问题，并提供准确、专业的医学建议。\n"
+               "请记住，你的回答仅供参考，不能替代专业医生的诊断和治疗建议。"),
+    ("human", "问题: {question}")
+])
 
 
 class QwenMedicalAgent(QwenBaseAgent):
@@ -40,45 +44,8 @@ class QwenMedicalAgent(QwenBaseAgent):
             warning("当前模型不支持工具调用，将跳过工具定义")
             return []
 
-        # 定义工具列表
-        tools = [
-            self.query_medical_knowledge_tool,
-            self.web_search_tool,
-            self.extract_symptoms_tool,
-            self.assess_severity_tool
-        ]
-
-        return tools
-
-    def _initialize_langgraph_agent(self):
-        """初始化LangGraph智能体"""
-        # 定义状态图
-        workflow = StateGraph(MedicalAgentState)
-
-        # 添加节点
-        workflow.add_node("agent", self._agent_node)
-        workflow.add_node("tools", ToolNode(self._define_tools()))
-
-        # 设置边
-        workflow.set_entry_point("agent")
-        workflow.add_edge("tools", "agent")
-
-        # 如果模型支持工具调用，设置条件边
-        if self.model_supports_tools:
-            workflow.add_conditional_edges(
-                "agent",
-                self._should_continue,
-                {
-                    "continue": "tools",
-                    "end": END
-                }
-            )
-        else:
-            # 否则直接结束
-            workflow.add_edge("agent", END)
-
-        # 编译工作流
-        self.agent = workflow.compile()
+        # 工具注册表中当前后端启用且可用的工具
+        return super()._define_tools()
 
     def query_medical_knowledge(self, query, top_k=3):
         """查询医疗知识库
@@ -115,105 +82,16 @@ class QwenMedicalAgent(QwenBaseAgent):
             print_log_exception()
             return f"查询知识库时出错: {str(e)}"
 
-    def extract_symptoms(self, text):
-        """从文本中提取症状
-        
-        Args:
-            text: 包含症状的文本
-        
-        Returns:
-            str: 提取出的症状列表
-        """
-        try:
-            # 创建症状提取提示
-            extract_prompt = ChatPromptTemplate.from_template(
-                "你是一位经验丰富的医学专家。请从以下文本中提取出所有症状，并以列表形式返回。\n\n"
-                "文本: {text}\n\n"
-                "请只返回提取出的症状列表，不要添加任何额外的解释或说明。"
-            )
+    def _register_prompts(self):
+        """注册提示链，简化问答链在初始化时编译一次
 
-            # 创建症状提取链
-            extract_chain = extract_prompt | self.llm | StrOutputParser()
-
-            # 执行症状提取
-            symptoms = extract_chain.invoke({"text": text})
-
-            return symptoms
-        except Exception as e:
-            error(f"提取症状时出错: {str(e)}")
-            print_log_exception()
-            return f"提取症状时出错: {str(e)}"
-
-    def assess_severity(self, symptoms):
-        """评估症状严重程度
-        
-        Args:
-            symptoms: 症状列表
-        
-        Returns:
-            str: 严重程度评估结果
+        症状提取和严重程度评估使用基类的本地分诊引擎，不再调用模型
         """
-        try:
-            # 创建严重程度评估提示
-            assess_prompt = ChatPromptTemplate.from_template(
-                "你是一位经验丰富的急诊医学专家。请根据以下症状评估患者的病情严重程度，并提供相应的建议。\n\n"
-                "症状: {symptoms}\n\n"
-                "评估应包括以下几个方面:\n"
-                "1. 总体严重程度评级（轻度、中度、重度、紧急）\n"
-                "2. 主要风险点\n"
-                "3. 建议的行动（如休息、观察、就医等）\n"
-                "4. 就医时机建议（如立即、24小时内、非紧急等）"
-            )
-
-            # 创建严重程度评估链
-            assess_chain = assess_prompt | self.llm | StrOutputParser()
-
-            # 执行严重程度评估
-            assessment = assess_chain.invoke({"symptoms": symptoms})
-
-            return assessment
-        except Exception as e:
-            error(f"评估症状严重程度时出错: {str(e)}")
-            return f"评估症状严重程度时出错: {str(e)}"
-
-    def _agent_node(self, state: MedicalAgentState):
-        """代理节点，用于处理输入并决定下一步行动"""
-        # 创建代理提示
-        agent_prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一位经验丰富的医学专家助手。你的任务是回答用户的医疗问题，提供准确、专业的医学建议。\n" \
-                       "请基于你所掌握的医学知识和可用的工具来回答用户的问题。\n" \
-                       "如果需要更多信息来回答问题，请使用提供的工具。\n" \
-                       "请记住，你的回答仅供参考，不能替代专业医生的诊断和治疗建议。"),
-            MessagesPlaceholder(variable_name="messages")
-        ])
-
-        # 创建代理链
-        agent_chain = agent_prompt | self.llm
-
-        # 执行代理链
-        result = agent_chain.invoke({
-            "messages": state["messages"]
-        })
-
-        # 更新API调用统计
-        self.api_call_count += 1
-
-        # 返回结果
-        return {"messages": [result]}
-
-    def _should_continue(self, state: MedicalAgentState):
-        """决定是否继续执行（使用工具）或结束对话"""
-        # 获取最后的消息
-        last_message = state["messages"][-1]
-
-        # 检查是否有工具调用请求
-        if hasattr(last_message, "tool_calls") and last_message.tool_calls:
-            return "continue"
-        else:
-            return "end"
-
-    def run(self, question):
-        """运行智能体回答问题
+        super()._register_prompts()
+        self.prompts.register("qa", QA_PROMPT, self.llm, StrOutputParser())
+
+    def _run_agent(self, question, tracker=None, session_id=None):
+        """使用智能体循环回答问题，不支持工具调用时使用简化的问答链
         
         Args:
             question: 用户的问题
@@ -232,9 +110,7 @@ class QwenMedicalAgent(QwenBaseAgent):
 
                 debug(f"LangGraph智能体配置: {self.agent}")
                 # 执行智能体
-                result = self.agent.invoke({
-                    "messages": [{"role": "user", "content": question}]
-                })
+                result = self._invoke_agent(question, tracker, session_id)
 
                 # 提取回答
                 if "messages" in result and len(result["messages"]) > 0:
@@ -245,25 +121,62 @@ class QwenMedicalAgent(QwenBaseAgent):
                 # 否则使用简化的问答链
                 info(f"使用简化的问答链回答问题: {question}")
 
-                # 创建问答提示
-                qa_prompt = ChatPromptTemplate.from_template(
-                    "你是一位经验丰富的医学专家。请回答以下问题，并提供准确、专业的医学建议。\n\n"
-                    "问题: {question}\n\n"
-                    "请记住，你的回答仅供参考，不能替代专业医生的诊断和治疗建议。"
-                )
+                # 执行问答链
+                return self.prompts.get("qa").invoke({"question": question})
+        except Exception as e:
+            error(f"运行智能体时出错: {str(e)}")
+            print_log_exception()
+            return f"运行智能体时出错: {str(e)}"
 
-                # 创建问答链
-                qa_chain = qa_prompt | self.llm | StrOutputParser()
+    async def _arun_agent(self, question, tracker=None, session_id=None):
+        """使用智能体循环异步回答问题，不支持工具调用时使用简化的问答链
 
-                # 执行问答链
-                answer = qa_chain.invoke({"question": question})
+        Args:
+            question: 用户的问题
+
+        Returns:
+            str: 智能体的回答
+        """
+        try:
+            # 检查是否初始化成功
+            if not self.llm:
+                return "智能体初始化失败，请检查配置"
+
+            # 如果模型支持工具调用，使用LangGraph智能体
+            if self.model_supports_tools and hasattr(self, "agent") and self.agent is not None:
+                info(f"使用支持工具调用的LangGraph智能体异步回答问题: {question}")
+
+                result = await self._ainvoke_agent(question, tracker, session_id)
 
-                return answer
+                # 提取回答
+                if "messages" in result and len(result["messages"]) > 0:
+                    return result["messages"][-1].content
+                else:
+                    return "无法获取智能体的回答"
+            else:
+                # 否则使用简化的问答链
+                info(f"使用简化的问答链异步回答问题: {question}")
+                return await self.prompts.get("qa").ainvoke({"question": question})
         except Exception as e:
             error(f"运行智能体时出错: {str(e)}")
             print_log_exception()
             return f"运行智能体时出错: {str(e)}"
 
+    async def _astream_agent_events(self, question, tracker=None, session_id=None):
+        """流式执行智能体循环，不支持工具调用时流式执行简化的问答链"""
+        if self.model_supports_tools and getattr(self, "agent", None) is not None:
+            async for event in super()._astream_agent_events(question, tracker, session_id):
+                yield event
+            return
+
+        if not self.llm:
+            yield {"event": "error", "data": {"message": "智能体初始化失败，请检查配置"}}
+            return
+
+        info(f"使用简化的问答链流式回答问题: {question}")
+        async for event in self._astream_chain(self.prompts.get("qa"), {"question": question}):
+            yield event
+
 
 if __name__ == "__main__":
     # 创建基于通义千问的医疗智能体实例
@@ -0,0 +1,153 @@
+"""@FileName: async_retriever.py
+@Description: 异步多查询检索器，对同一问题的多个查询变体并发检索向量库并合并结果
+@Author: HengLine
+@Time: 2025/10/8 10:30
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import List, Tuple, Dict, Any, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug, warning
+
+from hengline.tools.medical_tools import MedicalTools
+from hengline.agent.tracing import stage
+
+
+class AsyncMultiQueryRetriever:
+    """异步多查询检索器
+
+    对原始问题、提取出的症状和同义词扩展后的问题分别检索，
+    各变体并发执行，最后按文档去重并合并相关性得分。
+    """
+
+    def __init__(self, vectorstore, search_kwargs: Dict[str, Any] = None, max_variants: int = 3, max_workers: int = 4,
+                 backend: Optional[str] = None):
+        self.vectorstore = vectorstore
+        # 所属的模型后端，用于区分耗时指标
+        self.backend = backend
+        self.search_kwargs = search_kwargs or {"k": 3}
+        self.k = self.search_kwargs.get("k", 3)
+        self.max_variants = max(1, max_variants)
+
+        # 同步检索的线程池，每个检索器按各自配置的max_workers创建，各请求共用，避免每次请求都创建线程
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                            thread_name_prefix=f"retrieval-{backend}" if backend else "retrieval")
+
+    def build_query_variants(self, question: str) -> List[str]:
+        """构建查询变体：原始问题、症状关键词、同义词扩展形式"""
+        question = (question or "").strip()
+        if not question:
+            return []
+
+        variants = [question]
+
+        # 提取出的症状组成的关键词查询
+        symptoms = MedicalTools.extract_symptoms(question)
+        if symptoms:
+            variants.append(" ".join(sorted(symptoms)))
+
+        # 同义词扩展后的查询
+        expanded = MedicalTools.expand_synonyms(question)
+        if expanded:
+            variants.append(expanded)
+
+        # 去重并保持顺序
+        unique_variants = []
+        for variant in variants:
+            if variant and variant not in unique_variants:
+                unique_variants.append(variant)
+
+        return unique_variants[:self.max_variants]
+
+    async def aretrieve(self, queries: List[str], k: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """并发检索多个查询变体并合并结果
+
+        Args:
+            queries: 查询变体列表
+            k: 合并后返回的文档数量
+
+        Returns:
+            List[Tuple[Document, float]]: 按相关性排序的(文档, 得分)列表
+        """
+        if not self.vectorstore or not queries:
+            return []
+
+        k = k or self.k
+        results = await asyncio.gather(
+            *[self._asearch(query, k) for query in queries],
+            return_exceptions=True
+        )
+        return self._merge_results(queries, results, k)
+
+    def retrieve(self, queries: List[str], k: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """同步版本的多查询检索，各变体在检索器的线程池中并发执行"""
+        if not self.vectorstore or not queries:
+            return []
+
+        k = k or self.k
+        # 复制请求上下文，线程中的检索耗时同样记入本次请求
+        futures = [self._executor.submit(copy_context().run, self._search, query, k) for query in queries]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return self._merge_results(queries, results, k)
+
+    async def _asearch(self, query: str, k: int):
+        """单个查询变体的异步检索，耗时包含查询嵌入"""
+        with stage("vector_search", self.backend):
+            return await self.vectorstore.asimilarity_search_with_relevance_scores(query, k=k)
+
+    def _search(self, query: str, k: int):
+        """单个查询变体的同步检索，耗时包含查询嵌入"""
+        with stage("vector_search", self.backend):
+            return self.vectorstore.similarity_search_with_relevance_scores(query, k=k)
+
+    # 倒数排名融合的平滑常数，取常用值60，使排名靠前的几个文档之间的差距不至于过大
+    RRF_K = 60
+
+    @classmethod
+    def _merge_results(cls, queries, results, k: int) -> List[Tuple[Any, float]]:
+        """按文档内容去重，并用倒数排名融合（RRF）排序
+
+        每个变体中排名为r的文档得 1/(RRF_K + r) 分，各变体的得分相加，因此被多个变体命中的文档排在
+        只被一个变体命中的文档之前；融合得分相同时按最高相关度排序。返回的得分仍为文档的最高相关度。
+        """
+        merged = {}
+        for query, result in zip(queries, results):
+            if isinstance(result, Exception):
+                warning(f"查询变体检索失败: {query[:30]}... - {str(result)}")
+                continue
+
+            ranked_result = sorted(result, key=lambda item: item[1], reverse=True)
+            for rank, (doc, score) in enumerate(ranked_result, start=1):
+                key = (doc.metadata.get("source"), doc.page_content)
+                fused = 1.0 / (cls.RRF_K + rank)
+                if key in merged:
+                    best_doc, best_score, fused_score = merged[key]
+                    merged[key] = (best_doc, max(best_score, score), fused_score + fused)
+                else:
+                    merged[key] = (doc, score, fused)
+
+        ranked = sorted(merged.values(), key=lambda item: (item[2], item[1]), reverse=True)
+        debug(f"多查询检索完成: {len(queries)} 个变体, 合并后 {len(ranked)} 个文档")
+        return [(doc, score) for doc, score, _ in ranked[:k]]
+
+
+def top_relevance_score(docs_and_scores: List[Tuple[Any, float]]) -> Optional[float]:
+    """检索结果中的最高相关度
+
+    合并后的结果按融合排名排序，第一个文档不一定相关度最高，判断检索质量时应使用最高相关度。
+    """
+    if not docs_and_scores:
+        return None
+    return max(score for _, score in docs_and_scores)
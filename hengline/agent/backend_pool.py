@@ -0,0 +1,388 @@
+"""@FileName: backend_pool.py
+@Description: 模型后端池，按优先级在ollama、vllm、openai、qwen后端之间路由请求，按滚动健康度熔断和故障转移
+@Author: HengLine
+@Time: 2025/10/13 10:20
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import info, warning, error
+
+# 熔断器状态
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# 智能体吞掉异常后返回的错误信息前缀，出现时视为后端调用失败
+FAILURE_MARKERS = (
+    "处理问题时出错",
+    "运行智能体时出错",
+    "智能体初始化失败",
+    "智能体未正确初始化",
+    "生成内容时出错",
+    "无法创建生成链",
+    "无法连接到Ollama服务",
+    "抱歉，VLLM医学智能模型处理请求时出错"
+)
+
+# 所有后端都不可用时的提示
+NO_BACKEND_ANSWER = "当前没有可用的模型后端，请稍后再试"
+
+
+class BackendHealth:
+    """单个后端的健康状态：滚动窗口内的耗时和错误率，以及熔断器
+
+    - 连续失败次数达到上限，或窗口内错误率超过阈值时熔断器打开，冷却期内不再路由请求；
+    - 冷却期结束后进入半开状态，只放行一个试探请求，成功则关闭熔断器，失败则重新打开；
+    - 成功请求的耗时另按指数加权移动平均（EWMA）累计，与错误率一起作为同一优先级内选择后端的健康度。
+    """
+
+    def __init__(self, name: str, window_size: int = 20, failure_threshold: int = 3,
+                 error_rate_threshold: float = 0.5, min_samples: int = 5, cooldown_seconds: float = 30,
+                 latency_ewma_alpha: float = 0.2):
+        self.name = name
+        self.latency_ewma_alpha = latency_ewma_alpha
+        self.latency_ewma = None
+        self.failure_threshold = max(1, failure_threshold)
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+
+        # (耗时, 是否成功)
+        self._samples = deque(maxlen=max(1, window_size))
+        self._lock = threading.Lock()
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = None
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+        self._trial_in_flight = False
+
+    def try_acquire(self) -> bool:
+        """判断当前是否可以向该后端发送请求，半开状态下只放行一个试探请求"""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+
+            if self.state == CIRCUIT_OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown_seconds:
+                    return False
+                self.state = CIRCUIT_HALF_OPEN
+                info(f"后端 {self.name} 熔断冷却结束，进入半开状态")
+
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release(self):
+        """请求被取消、没有结果时释放试探名额"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def is_available(self) -> bool:
+        """不占用试探名额地判断后端是否可用"""
+        with self._lock:
+            if self.state == CIRCUIT_OPEN:
+                return time.monotonic() - self.opened_at >= self.cooldown_seconds
+            return self.state == CIRCUIT_CLOSED or not self._trial_in_flight
+
+    def record(self, latency: float, success: bool):
+        """记录一次请求结果并更新熔断器状态"""
+        with self._lock:
+            self._trial_in_flight = False
+            self._samples.append((latency, success))
+            self.total_requests += 1
+
+            if success:
+                self.consecutive_failures = 0
+                self.latency_ewma = latency if self.latency_ewma is None else \
+                    self.latency_ewma_alpha * latency + (1 - self.latency_ewma_alpha) * self.latency_ewma
+                if self.state != CIRCUIT_CLOSED:
+                    info(f"后端 {self.name} 试探请求成功，关闭熔断器")
+                self.state = CIRCUIT_CLOSED
+                return
+
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold \
+                    or self._error_rate() > self.error_rate_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    warning(f"后端 {self.name} 熔断器打开: 连续失败 {self.consecutive_failures} 次, "
+                            f"错误率 {self._error_rate():.2f}")
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+
+    def _error_rate(self) -> float:
+        """窗口内的错误率，样本不足时返回0，调用方需持有锁"""
+        if len(self._samples) < self.min_samples:
+            return 0.0
+        return sum(1 for _, success in self._samples if not success) / len(self._samples)
+
+    def health_score(self) -> Tuple[float, float]:
+        """健康度，越小越健康：先比较窗口内的错误率，再比较耗时EWMA
+
+        还没有请求记录的后端排在前面，使同一优先级内的每个后端都至少被尝试一次、取得耗时数据；
+        有过请求但都失败的后端错误率为1，排在后面。
+        """
+        with self._lock:
+            error_rate = sum(1 for _, success in self._samples if not success) / len(self._samples) \
+                if self._samples else 0.0
+            return error_rate, self.latency_ewma if self.latency_ewma is not None else 0.0
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """窗口内成功请求耗时的百分位数（秒），没有样本时返回None"""
+        with self._lock:
+            latencies = sorted(latency for latency, success in self._samples if success)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "error_rate": round(sum(1 for _, success in self._samples if not success) / len(self._samples), 4)
+                if self._samples else 0.0,
+                "p50_latency_ms": round(p50 * 1000, 2) if p50 is not None else None,
+                "p95_latency_ms": round(p95 * 1000, 2) if p95 is not None else None,
+                "latency_ewma_ms": round(self.latency_ewma * 1000, 2) if self.latency_ewma is not None else None,
+                "total_requests": self.total_requests,
+                "total_failures": self.total_failures
+            }
+
+
+class BackendPool:
+    """模型后端池
+
+    按优先级持有多个后端的智能体（医疗智能体和生成式智能体），智能体在首次路由到该后端时才创建。
+    配置的backends中，列表项为同一优先级的一组后端。每次请求按优先级从高到低、同一优先级内按健康度
+    （错误率，其次耗时EWMA）排序，选择第一个熔断器未打开的后端；调用失败（抛出异常或返回错误信息）时
+    记录到该后端的健康状态并转移到下一个后端。
+    """
+
+    # 智能体在(医疗智能体, 生成式智能体)中的位置
+    MEDICAL = 0
+    GENERATIVE = 1
+
+    def __init__(self, pool_config: Dict[str, Any], factory: Callable[[str], Tuple[Any, Any]],
+                 primary: Optional[str] = None):
+        pool_config = pool_config or {}
+        self.factory = factory
+
+        # 启动时指定的后端单独作为最高优先级，其余按配置顺序，列表项为同一优先级的一组后端
+        self.tiers: List[List[str]] = [[primary]] if primary else []
+        seen = {primary} if primary else set()
+        for entry in pool_config.get("backends", []):
+            tier = [name for name in ([entry] if isinstance(entry, str) else entry) if name not in seen]
+            seen.update(tier)
+            if tier:
+                self.tiers.append(tier)
+        self.backends: List[str] = [name for tier in self.tiers for name in tier]
+
+        self._health_config = {
+            "window_size": pool_config.get("window_size", 20),
+            "failure_threshold": pool_config.get("failure_threshold", 3),
+            "error_rate_threshold": pool_config.get("error_rate_threshold", 0.5),
+            "min_samples": pool_config.get("min_samples", 5),
+            "cooldown_seconds": pool_config.get("cooldown_seconds", 30),
+            "latency_ewma_alpha": pool_config.get("latency_ewma_alpha", 0.2)
+        }
+        self.health = {name: BackendHealth(name, **self._health_config) for name in self.backends}
+
+        self._agents: Dict[str, Tuple[Any, Any]] = {}
+        self._create_lock = threading.Lock()
+
+        # 对外提供与单个智能体相同接口的代理
+        self.medical_agent = PooledAgent(self, self.MEDICAL)
+        self.generative_agent = PooledAgent(self, self.GENERATIVE)
+
+    def warm_up(self):
+        """启动时按优先级创建第一个可用后端的智能体"""
+        for name in self.backends:
+            try:
+                self._get_agents(name)
+                return name
+            except Exception as e:
+                self.health[name].record(0.0, False)
+                error(f"后端 {name} 初始化失败: {str(e)}")
+        return None
+
+    def _get_agents(self, name: str) -> Tuple[Any, Any]:
+        """获取后端的智能体，首次使用时创建"""
+        agents = self._agents.get(name)
+        if agents is None:
+            with self._create_lock:
+                agents = self._agents.get(name)
+                if agents is None:
+                    info(f"正在初始化后端 {name} 的智能体...")
+                    agents = self.factory(name)
+                    self._agents[name] = agents
+        return agents
+
+    async def _aget_agents(self, name: str) -> Tuple[Any, Any]:
+        """异步获取后端的智能体，创建过程较慢，放到线程中执行"""
+        agents = self._agents.get(name)
+        if agents is None:
+            agents = await asyncio.to_thread(self._get_agents, name)
+        return agents
+
+    def ordered_backends(self) -> List[str]:
+        """本次请求尝试后端的顺序：按优先级，同一优先级内按健康度"""
+        ordered = []
+        for tier in self.tiers:
+            ordered.extend(sorted(tier, key=lambda name: self.health[name].health_score()) if len(tier) > 1 else tier)
+        return ordered
+
+    def current_agent(self, index: int):
+        """当前优先使用的已创建智能体"""
+        loaded = [name for name in self.ordered_backends() if name in self._agents]
+        for name in loaded:
+            if self.health[name].is_available():
+                return self._agents[name][index]
+        return self._agents[loaded[0]][index] if loaded else None
+
+    def reset(self, name: str):
+        """丢弃后端已创建的智能体（如配置更新后），下次使用时重新创建"""
+        with self._create_lock:
+            self._agents.pop(name, None)
+        if name in self.health:
+            self.health[name] = BackendHealth(name, **self._health_config)
+
+    @staticmethod
+    def is_failure(result) -> bool:
+        """智能体返回的结果是否为后端错误信息"""
+        return isinstance(result, str) and result.startswith(FAILURE_MARKERS)
+
+    async def acall(self, index: int, method: str, *args, **kwargs):
+        """按优先级和健康度调用后端智能体的异步方法，失败时转移到下一个后端"""
+        last_result = None
+        last_error = None
+        for name in self.ordered_backends():
+            health = self.health[name]
+            if not health.try_acquire():
+                continue
+
+            start_time = time.perf_counter()
+            try:
+                agent = (await self._aget_agents(name))[index]
+                result = await getattr(agent, method)(*args, **kwargs)
+            except Exception as e:
+                health.record(time.perf_counter() - start_time, False)
+                warning(f"后端 {name} 调用失败，尝试下一个后端: {str(e)}")
+                last_error = e
+                continue
+            except BaseException:
+                health.release()
+                raise
+
+            if self.is_failure(result):
+                health.record(time.perf_counter() - start_time, False)
+                warning(f"后端 {name} 返回错误，尝试下一个后端: {result[:100]}")
+                last_result = result
+                continue
+
+            health.record(time.perf_counter() - start_time, True)
+            return result
+
+        if last_result is not None:
+            return last_result
+        if last_error is not None:
+            raise last_error
+        return NO_BACKEND_ANSWER
+
+    async def astream(self, index: int, method: str, *args, **kwargs):
+        """按优先级和健康度流式调用后端智能体，尚未产生任何事件前出错时转移到下一个后端"""
+        last_error_event = None
+        for name in self.ordered_backends():
+            health = self.health[name]
+            if not health.try_acquire():
+                continue
+
+            start_time = time.perf_counter()
+            emitted = False
+            events = None
+            try:
+                agent = (await self._aget_agents(name))[index]
+                events = getattr(agent, method)(*args, **kwargs)
+                async for event in events:
+                    if event["event"] == "error" and self.is_failure(event["data"].get("message")):
+                        health.record(time.perf_counter() - start_time, False)
+                        if emitted:
+                            # 已经向客户端输出了内容，不再转移
+                            yield event
+                            return
+                        warning(f"后端 {name} 流式调用失败，尝试下一个后端")
+                        last_error_event = event
+                        break
+                    emitted = True
+                    yield event
+                else:
+                    health.record(time.perf_counter() - start_time, True)
+                    return
+            except Exception as e:
+                health.record(time.perf_counter() - start_time, False)
+                if emitted:
+                    raise
+                warning(f"后端 {name} 流式调用失败，尝试下一个后端: {str(e)}")
+                last_error_event = {"event": "error", "data": {"message": f"处理问题时出错: {str(e)}"}}
+            except BaseException:
+                health.release()
+                raise
+            finally:
+                if events is not None:
+                    await events.aclose()
+
+        yield last_error_event or {"event": "error", "data": {"message": NO_BACKEND_ANSWER}}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各后端的熔断器状态、错误率和耗时"""
+        stats = {}
+        for priority, tier in enumerate(self.tiers):
+            for name in tier:
+                stats[name] = dict(self.health[name].to_dict(), priority=priority, loaded=name in self._agents)
+        return stats
+
+
+class PooledAgent:
+    """后端池的智能体代理，接口与单个智能体相同
+
+    异步问答和生成方法经后端池路由和故障转移，其余属性（路由统计、提示链等）取自当前优先使用的后端。
+    """
+
+    def __init__(self, pool: BackendPool, index: int):
+        self._pool = pool
+        self._index = index
+
+    async def arun(self, question, session_id=None):
+        return await self._pool.acall(self._index, "arun", question, session_id=session_id)
+
+    async def astream_run(self, question, session_id=None):
+        async for event in self._pool.astream(self._index, "astream_run", question, session_id=session_id):
+            yield event
+
+    async def agenerate_content(self, topic, generation_type="general_info"):
+        return await self._pool.acall(self._index, "agenerate_content", topic, generation_type)
+
+    async def astream_content(self, topic, generation_type="general_info"):
+        async for event in self._pool.astream(self._index, "astream_content", topic, generation_type):
+            yield event
+
+    def __getattr__(self, name):
+        agent = self._pool.current_agent(self._index)
+        if agent is None:
+            raise AttributeError(name)
+        return getattr(agent, name)
@@ -1,18 +1,23 @@
+import asyncio
+import hashlib
+import json
 import os
 import sys
+import time
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Annotated, TypedDict
 
 # LangChain和LangGraph相关导入
 from langchain.chains import RetrievalQA
 from langchain.text_splitter import CharacterTextSplitter
-from langchain.tools import tool
 from langchain_chroma import Chroma
 from langchain_community.document_loaders import TextLoader
 from langchain_community.embeddings import FakeEmbeddings
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import create_react_agent
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
@@ -23,15 +28,62 @@ from utils.log_utils import print_log_exception
 
 # 导入工具和配置
 from hengline.tools.medical_tools import MedicalTools
+from hengline.tools.web_search import web_search_service, SEARCH_UNAVAILABLE
 from hengline.config import config_reader
-
-
-class MedicalAgentState:
+from hengline.agent.async_retriever import AsyncMultiQueryRetriever, top_relevance_score
+from hengline.agent.query_router import QueryRouter, RouteDecision
+from hengline.agent.parallel_tool_node import ParallelToolNode
+from hengline.agent.tool_registry import ToolRegistry
+from hengline.agent.agent_budget import (AgentBudget, get_budget_tracker, best_answer_so_far,
+                                         REASON_ITERATIONS, REASON_DEADLINE)
+from hengline.agent.request_context import set_request_value
+from hengline.agent.session_manager import session_manager, SUMMARY_PROMPT
+from hengline.agent.prompt_registry import PromptRegistry
+from hengline.agent.retrieval_prefetch import RetrievalPrefetcher, get_retrieval_prefetch
+from hengline.agent.tracing import TracingCallbackHandler, stage
+
+# 基于检索结果回答问题的提示模板
+KNOWLEDGE_QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "你是一位经验丰富的医学专家。请仅根据提供的参考资料回答用户的问题，"
+               "资料不足时请如实说明，不要编造。"),
+    ("human", "参考资料:\n{context}\n\n问题: {question}")
+])
+
+# 工具迭代次数用尽时要求模型直接作答的提示
+FINALIZE_INSTRUCTION = "工具调用次数已达上限，请根据以上已获得的信息直接给出最终回答，不要再调用工具。"
+
+# 智能体的系统提示，作为每次模型调用的固定前缀
+AGENT_SYSTEM_PROMPT = ("你是一位经验丰富的医学专家助手。你的任务是回答用户的医疗问题，提供准确、专业的医学建议。\n"
+                       "请基于你所掌握的医学知识和可用的工具来回答用户的问题。\n"
+                       "如果需要更多信息来回答问题，请使用提供的工具。\n"
+                       "请记住，你的回答仅供参考，不能替代专业医生的诊断和治疗建议。")
+
+# 智能体节点的提示模板：固定的系统提示在前，对话消息在后。会话摘要追加在系统提示末尾，
+# 只使用一条系统消息（Qwen、Ollama等模型不接受多条系统消息），固定前缀保持不变
+AGENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", AGENT_SYSTEM_PROMPT + "{summary}"),
+    MessagesPlaceholder(variable_name="messages")
+]).partial(summary="")
+
+# 工具迭代次数用尽时的收尾提示模板，与智能体节点共享系统前缀
+FINALIZE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", AGENT_SYSTEM_PROMPT + "{summary}"),
+    MessagesPlaceholder(variable_name="messages"),
+    ("human", FINALIZE_INSTRUCTION)
+]).partial(summary="")
+
+
+class MedicalAgentState(TypedDict):
     """定义智能体的状态结构"""
-    messages: List[BaseMessage] = add_messages()
+    messages: Annotated[List[BaseMessage], add_messages]
     # 可以添加其他状态字段，如思考过程、使用的工具等
 
 
+class SessionAgentState(MedicalAgentState):
+    """会话智能体的状态结构，额外保存早期对话的滚动摘要"""
+    summary: str
+
+
 class BaseMedicalAgent(ABC):
     """医疗智能体基类，定义通用接口和共享功能"""
 
@@ -53,21 +105,45 @@ class BaseMedicalAgent(ABC):
         # 加载RAG数据
         self.vectorstore = self.load_medical_knowledge(self.agent_type)
 
-        # 创建网络搜索工具
-        try:
-            from langchain_community.tools import DuckDuckGoSearchRun
-            self.search = DuckDuckGoSearchRun()
-        except ImportError:
-            self.search = None
-            warning("未能导入DuckDuckGoSearchRun，网络搜索功能将不可用")
+        # 知识库索引版本，知识库工具的缓存结果按版本区分
+        self.index_version = self._compute_index_version()
+
+        # 网络搜索服务由所有智能体共享，未启用时不注册网络搜索工具
+        self.search = web_search_service if web_search_service.enabled else None
 
         # 初始化语言模型
         self.llm = self._initialize_llm()
 
+        # 分阶段计时：记录图节点、工具和模型调用的耗时及token数
+        self.tracing = TracingCallbackHandler(self.agent_type, on_usage=self._record_token_usage)
+
+        # 提示链在初始化时编译一次，调用时不再重复构建
+        self.prompts = PromptRegistry(self.agent_type, callbacks=[self.tracing])
+        self._register_prompts()
+
         # 创建检索链
         self.retrieval_chain = self._create_retrieval_chain()
 
-        # 定义工具列表
+        # 创建异步多查询检索器
+        self.retriever = self._create_async_retriever()
+
+        # 检索预取：进入智能体循环时即在后台检索，与第一轮模型推理并发
+        self.prefetcher = RetrievalPrefetcher(self.aretrieve if self.retriever else None,
+                                              self.config_reader.get_module_config("prefetch"))
+
+        # 创建查询路由器，简单知识问题绕过智能体循环
+        self.router = QueryRouter(self.config_reader.get_module_config("router"))
+
+        # 单次请求的预算：工具迭代次数、token总量和截止时间
+        self.budget = AgentBudget(self.config_reader.get_module_config("agent_budget"))
+
+        # 会话管理：带session_id的请求使用带检查点的会话智能体
+        self.session_manager = session_manager
+        self.session_agent = None
+        self._async_session_agent = None
+
+        # 创建工具并定义工具列表
+        self._create_tools()
         self.tools = self._define_tools()
 
         # 初始化LangGraph智能体
@@ -78,6 +154,25 @@ class BaseMedicalAgent(ABC):
         """初始化语言模型，由子类实现"""
         pass
 
+    def _record_token_usage(self, input_tokens, output_tokens):
+        """累计模型调用次数和消耗的token数，由计时回调在每次模型调用结束时调用"""
+        self.update_api_call_stats(input_tokens + output_tokens)
+
+    def update_api_call_stats(self, tokens_used=0):
+        """更新模型调用统计信息
+
+        Args:
+            tokens_used: 使用的tokens数量
+        """
+        self.api_call_count = getattr(self, "api_call_count", 0) + 1
+        self.total_tokens_used = getattr(self, "total_tokens_used", 0) + tokens_used
+
+    def _register_prompts(self):
+        """注册智能体使用的提示链，子类可扩展以注册自己的提示链"""
+        self.prompts.register("knowledge_qa", KNOWLEDGE_QA_PROMPT, self.llm)
+        self.prompts.register("finalize", FINALIZE_PROMPT, self.llm)
+        self.prompts.register("summary", SUMMARY_PROMPT, self.llm)
+
     def _create_retrieval_chain(self):
         """创建检索链"""
         if not self.llm or not self.vectorstore:
@@ -101,42 +196,259 @@ class BaseMedicalAgent(ABC):
             error(f"创建检索链时出错: {str(e)}")
             return None
 
-    def _define_tools(self):
-        """定义智能体可用的工具"""
-        tools = []
-
-        # 添加查询医疗知识库的工具
-        if self.retrieval_chain:
-            tools.append(self.query_medical_knowledge_tool)
-
-        # 添加网络搜索工具
-        if self.search:
-            tools.append(self.web_search_tool)
-
-        # 添加症状提取工具
-        tools.append(self.extract_symptoms_tool)
+    def _create_async_retriever(self):
+        """创建异步多查询检索器"""
+        if not self.vectorstore:
+            return None
 
-        # 添加症状评估工具
-        tools.append(self.assess_severity_tool)
+        try:
+            retrieval_config = self.config_reader.get_retrieval_config()
+            multi_query_config = retrieval_config.get("multi_query", {})
+
+            return AsyncMultiQueryRetriever(
+                self.vectorstore,
+                search_kwargs=retrieval_config.get("search_kwargs", {"k": 3}),
+                max_variants=multi_query_config.get("max_variants", 3) if multi_query_config.get("enabled", True) else 1,
+                max_workers=multi_query_config.get("max_workers", 4),
+                backend=self.agent_type
+            )
+        except Exception as e:
+            error(f"创建异步检索器时出错: {str(e)}")
+            return None
 
-        return tools
+    def _define_tools(self):
+        """定义智能体可用的工具：工具注册表中当前后端启用且可用的工具"""
+        return self.tool_registry.get_tools()
 
     def _initialize_langgraph_agent(self):
-        """初始化LangGraph智能体"""
+        """初始化LangGraph智能体：模型节点与并行工具节点交替执行"""
         if not self.llm or not self.tools:
             return None
 
         try:
-            # 创建React Agent
-            agent_executor = create_react_agent(
-                self.llm,
-                self.tools
-            )
-            return agent_executor
+            # 绑定工具后的模型，由智能体节点调用
+            self.llm_with_tools = self.llm.bind_tools(self.tools)
+            self.prompts.register("agent", AGENT_PROMPT, self.llm_with_tools)
+
+            # 工具节点：同一步中的多个工具调用并发执行
+            tool_config = self.config_reader.get_module_config("tool_execution")
+            self.tool_node = ParallelToolNode(self.tool_registry, max_concurrency=tool_config.get("max_concurrency", 4))
+
+            # 会话智能体与无状态智能体结构相同，额外在入口压缩历史并由检查点保存状态
+            if self.session_manager.enabled:
+                self.session_agent = self._build_workflow(with_history=True).compile(
+                    checkpointer=self.session_manager.checkpointer)
+
+            return self._build_workflow().compile()
         except Exception as e:
             error(f"初始化LangGraph智能体时出错: {str(e)}")
             return None
 
+    def _build_workflow(self, with_history=False):
+        """构建智能体状态图：模型节点与工具节点交替执行，可选在入口处压缩会话历史"""
+        # 定义状态图
+        workflow = StateGraph(SessionAgentState if with_history else MedicalAgentState)
+        workflow.add_node("agent", RunnableLambda(self._budgeted_agent_node, afunc=self._abudgeted_agent_node))
+        workflow.add_node("tools", self.tool_node.as_runnable())
+
+        # 设置边
+        if with_history:
+            workflow.add_node("history", RunnableLambda(self._history_node, afunc=self._ahistory_node))
+            workflow.set_entry_point("history")
+            workflow.add_edge("history", "agent")
+        else:
+            workflow.set_entry_point("agent")
+        workflow.add_conditional_edges(
+            "agent",
+            self._should_continue,
+            {
+                "continue": "tools",
+                "end": END
+            }
+        )
+        workflow.add_edge("tools", "agent")
+
+        return workflow
+
+    def _history_node(self, state: SessionAgentState, config=None):
+        """历史节点：超出轮数上限的早期对话合并进摘要"""
+        return self.session_manager.compact(state, self.prompts.get("summary"), get_budget_tracker(config))
+
+    async def _ahistory_node(self, state: SessionAgentState, config=None):
+        """历史节点的异步版本"""
+        return await self.session_manager.acompact(state, self.prompts.get("summary"), get_budget_tracker(config))
+
+    async def _aget_session_agent(self):
+        """获取异步调用使用的会话智能体，SQLite存储需要单独的异步检查点"""
+        if self.session_agent is None:
+            return None
+
+        checkpointer = await self.session_manager.aget_checkpointer()
+        if checkpointer is self.session_manager.checkpointer:
+            return self.session_agent
+
+        if self._async_session_agent is None or self._async_session_agent.checkpointer is not checkpointer:
+            self._async_session_agent = self._build_workflow(with_history=True).compile(checkpointer=checkpointer)
+        return self._async_session_agent
+
+    def _use_session(self, session_id):
+        """是否以会话方式处理请求"""
+        return bool(session_id) and self.session_agent is not None
+
+    def _agent_node(self, state: MedicalAgentState):
+        """代理节点，调用绑定工具的模型决定下一步行动"""
+        return {"messages": [self.prompts.get("agent").invoke(self._prompt_inputs(state))]}
+
+    async def _aagent_node(self, state: MedicalAgentState):
+        """代理节点的异步版本"""
+        return {"messages": [await self.prompts.get("agent").ainvoke(self._prompt_inputs(state))]}
+
+    def _prompt_inputs(self, state):
+        """智能体和收尾提示的输入：对话消息和会话摘要"""
+        return {"messages": state["messages"], "summary": self.session_manager.summary_prompt(state)}
+
+    def _budgeted_agent_node(self, state: MedicalAgentState, config=None):
+        """在预算约束下执行代理节点
+
+        token或时间预算耗尽时不再调用模型，直接返回目前最好的回答；
+        工具迭代次数用尽时调用不绑定工具的模型，根据已有信息收尾。
+        同步路径无法中断进行中的模型调用，截止时间在图的步骤之间检查：每次调用模型前检查，
+        模型返回时已过截止时间则忽略其请求的工具调用，不再执行工具节点，智能体循环随之结束。
+        """
+        tracker = get_budget_tracker(config)
+        if tracker is None:
+            return self._agent_node(state)
+
+        reason = tracker.check()
+        if reason and reason != REASON_ITERATIONS:
+            tracker.mark_exhausted(reason)
+            return {"messages": [AIMessage(content=best_answer_so_far(state["messages"]))]}
+
+        if reason == REASON_ITERATIONS:
+            tracker.mark_exhausted(reason)
+            messages = state["messages"] + [HumanMessage(content=FINALIZE_INSTRUCTION)]
+            try:
+                response = self.prompts.get("finalize").invoke(self._prompt_inputs(state))
+            except Exception as e:
+                warning(f"预算耗尽后生成最终回答失败: {str(e)}")
+                return {"messages": [AIMessage(content=best_answer_so_far(state["messages"]))]}
+        else:
+            messages = state["messages"]
+            response = self._agent_node(state)["messages"][-1]
+            if tracker.check() == REASON_DEADLINE:
+                tracker.mark_exhausted(REASON_DEADLINE)
+                reason = REASON_DEADLINE
+
+        if reason:
+            response = self._without_tool_calls(response, state)
+        tracker.record_llm_response(messages, response)
+        return {"messages": [response]}
+
+    async def _abudgeted_agent_node(self, state: MedicalAgentState, config=None):
+        """在预算约束下执行代理节点的异步版本，模型调用受截止时间限制"""
+        tracker = get_budget_tracker(config)
+        if tracker is None:
+            return await self._aagent_node(state)
+
+        reason = tracker.check()
+        if reason and reason != REASON_ITERATIONS:
+            tracker.mark_exhausted(reason)
+            return {"messages": [AIMessage(content=best_answer_so_far(state["messages"]))]}
+
+        try:
+            if reason == REASON_ITERATIONS:
+                tracker.mark_exhausted(reason)
+                messages = state["messages"] + [HumanMessage(content=FINALIZE_INSTRUCTION)]
+                response = await asyncio.wait_for(self.prompts.get("finalize").ainvoke(self._prompt_inputs(state)),
+                                                  timeout=tracker.remaining_time())
+            else:
+                messages = state["messages"]
+                result = await asyncio.wait_for(self._aagent_node(state), timeout=tracker.remaining_time())
+                response = result["messages"][-1]
+        except asyncio.TimeoutError:
+            tracker.mark_exhausted(REASON_DEADLINE)
+            return {"messages": [AIMessage(content=best_answer_so_far(state["messages"]))]}
+        except Exception as e:
+            if reason != REASON_ITERATIONS:
+                raise
+            warning(f"预算耗尽后生成最终回答失败: {str(e)}")
+            return {"messages": [AIMessage(content=best_answer_so_far(state["messages"]))]}
+
+        if reason:
+            response = self._without_tool_calls(response, state)
+        tracker.record_llm_response(messages, response)
+        return {"messages": [response]}
+
+    @staticmethod
+    def _without_tool_calls(response, state):
+        """收尾时忽略模型仍然请求的工具调用，保证智能体循环结束"""
+        if not getattr(response, "tool_calls", None):
+            return response
+        content = response.content if isinstance(response.content, str) and response.content.strip() else None
+        return AIMessage(content=content or best_answer_so_far(state["messages"]),
+                         usage_metadata=getattr(response, "usage_metadata", None))
+
+    def _agent_config(self, tracker, session_id=None, prefetch=None):
+        """构建智能体调用配置，预算跟踪器、会话ID和检索预取通过configurable传入图中，计时回调对整张图生效"""
+        config = {"configurable": {}, "callbacks": [self.tracing]}
+        if prefetch is not None:
+            config["configurable"]["retrieval_prefetch"] = prefetch
+        if session_id:
+            self.session_manager.touch(session_id)
+            config["configurable"].update(self.session_manager.thread_config(session_id))
+        if tracker is not None:
+            config["configurable"]["budget_tracker"] = tracker
+            # 递归上限作为迭代预算之外的兜底，会话智能体多一个历史节点
+            config["recursion_limit"] = tracker.recursion_limit + (1 if session_id else 0)
+        return config
+
+    def _invoke_agent(self, question, tracker=None, session_id=None):
+        """调用智能体，带session_id时使用会话智能体延续之前的对话"""
+        if self._use_session(session_id):
+            return self.session_agent.invoke({"messages": [HumanMessage(content=question)]},
+                                             config=self._agent_config(tracker, session_id))
+        return self.agent.invoke({"messages": [HumanMessage(content=question)]},
+                                 config=self._agent_config(tracker))
+
+    async def _ainvoke_agent(self, question, tracker=None, session_id=None):
+        """异步调用智能体，带session_id时使用会话智能体延续之前的对话
+
+        调用前以原问题开始检索预取，与第一轮模型推理并发执行。
+        """
+        prefetch = self.prefetcher.start(question)
+        try:
+            if self._use_session(session_id):
+                agent = await self._aget_session_agent()
+                return await agent.ainvoke({"messages": [HumanMessage(content=question)]},
+                                           config=self._agent_config(tracker, session_id, prefetch))
+            return await self.agent.ainvoke({"messages": [HumanMessage(content=question)]},
+                                             config=self._agent_config(tracker, prefetch=prefetch))
+        finally:
+            self.prefetcher.finish(prefetch)
+
+    def _should_continue(self, state: MedicalAgentState):
+        """决定是否继续执行（使用工具）或结束对话"""
+        # 获取最后的消息
+        last_message = state["messages"][-1]
+
+        # 检查是否有工具调用请求
+        if hasattr(last_message, "tool_calls") and last_message.tool_calls:
+            return "continue"
+        else:
+            return "end"
+
+    def _compute_index_version(self):
+        """根据知识库文件（路径、大小、修改时间）和分块参数计算索引版本"""
+        digest = hashlib.md5(self.agent_type.encode("utf-8"))
+        digest.update(json.dumps(self.config_reader.get_text_splitter_config(), sort_keys=True).encode("utf-8"))
+        for file in sorted(self.get_knowledge_files()):
+            try:
+                stat = os.stat(file)
+                digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+            except OSError:
+                continue
+        return f"{self.agent_type}:{digest.hexdigest()[:12]}"
+
     def get_knowledge_files(self):
         """检查知识库是否存在"""
         files = []
@@ -314,31 +626,101 @@ class BaseMedicalAgent(ABC):
             # else:
             #     raise
 
-    @tool
-    def query_medical_knowledge_tool(self, query: str) -> str:
-        """适合用来回答医学知识相关的问题，包括疾病、药物、急救和健康生活方式等内容"""
-        return self.query_medical_knowledge(query)
+    def _create_tools(self):
+        """在工具注册表中注册工具，每个工具同时提供同步和异步实现，并声明并发上限、超时时间和是否可缓存
 
-    @tool
-    def web_search_tool(self, query: str) -> str:
-        """适合用来搜索最新的医疗信息、研究进展和新闻等互联网信息"""
-        if self.search:
-            return self.search.run(query)
-        else:
-            return "网络搜索功能不可用"
+        异步路径（ainvoke）下工具直接在事件循环中执行，不再占用线程池线程。
+        可缓存工具（知识库查询）的结果经全局缓存跨请求、跨智能体复用，缓存键为工具名、索引版本和规范化后的参数，
+        同步和异步实现的输出格式相同，共用缓存条目；网络搜索由搜索服务按截止时间执行并自行缓存结果。
+        """
+        self.tool_registry = ToolRegistry(self.agent_type, self.config_reader.get_module_config("tool_execution"),
+                                          cacheable_result=self._is_cacheable_result)
+        register = self.tool_registry.register
 
-    @tool
-    def extract_symptoms_tool(self, text: str) -> List[str]:
-        """适合用来从文本中提取症状信息"""
-        return self.extract_symptoms(text)
+        def query_medical_knowledge_tool(query: str) -> str:
+            return self.query_medical_knowledge(query)
 
-    @tool
-    def assess_severity_tool(self, symptoms: List[str]) -> str:
-        """适合用来评估症状的严重程度"""
-        return self.assess_severity(symptoms)
+        async def aquery_medical_knowledge_tool(query: str, config: RunnableConfig) -> str:
+            return await self.aquery_medical_knowledge(query, get_retrieval_prefetch(config))
+
+        def web_search_tool(query: str) -> str:
+            return self.web_search(query)
+
+        async def aweb_search_tool(query: str) -> str:
+            return await self.aweb_search(query)
+
+        def extract_symptoms_tool(text: str) -> List[str]:
+            return self.extract_symptoms(text)
+
+        async def aextract_symptoms_tool(text: str) -> List[str]:
+            return await self.aextract_symptoms(text)
+
+        def extract_vital_signs_tool(text: str) -> List[dict]:
+            return self.extract_vital_signs(text)
+
+        async def aextract_vital_signs_tool(text: str) -> List[dict]:
+            return self.extract_vital_signs(text)
+
+        def assess_severity_tool(symptoms: List[str]) -> str:
+            return self.assess_severity(symptoms)
+
+        async def aassess_severity_tool(symptoms: List[str]) -> str:
+            return await self.aassess_severity(symptoms)
+
+        self.query_medical_knowledge_tool = register(
+            "query_medical_knowledge_tool",
+            "适合用来回答医学知识相关的问题，包括疾病、药物、急救和健康生活方式等内容",
+            query_medical_knowledge_tool, aquery_medical_knowledge_tool,
+            max_concurrency=4, timeout=30, cacheable=True,
+            cache_version=lambda: self.index_version, available=lambda: self.retrieval_chain is not None
+        )
+        self.web_search_tool = register(
+            "web_search_tool",
+            "适合用来搜索最新的医疗信息、研究进展和新闻等互联网信息",
+            web_search_tool, aweb_search_tool,
+            max_concurrency=4, timeout=15, available=lambda: self.search is not None
+        )
+        self.extract_symptoms_tool = register(
+            "extract_symptoms_tool",
+            "适合用来从文本中提取症状信息",
+            extract_symptoms_tool, aextract_symptoms_tool,
+            max_concurrency=8, timeout=5
+        )
+        self.extract_vital_signs_tool = register(
+            "extract_vital_signs_tool",
+            "适合用来从文本中提取体温、血压、心率、呼吸频率、血氧饱和度和血糖等数值，返回指标、数值、单位和原文位置",
+            extract_vital_signs_tool, aextract_vital_signs_tool,
+            max_concurrency=8, timeout=5
+        )
+        self.assess_severity_tool = register(
+            "assess_severity_tool",
+            "适合用来评估症状的严重程度，返回严重程度等级、就医建议和判断依据",
+            assess_severity_tool, aassess_severity_tool,
+            max_concurrency=8, timeout=5
+        )
+
+    @staticmethod
+    def _is_cacheable_result(result):
+        """出错或服务不可用时返回的提示不缓存"""
+        if isinstance(result, str):
+            return not any(marker in result for marker in ("出错", "不可用", "无法"))
+        return result is not None
 
     def query_medical_knowledge(self, query):
-        """查询医疗知识库"""
+        """查询医疗知识库：多查询检索后由语言模型基于检索结果作答
+
+        与异步版本的处理和输出格式相同，两者共用工具结果缓存中的同一条目。
+        """
+        if self.retriever and self.llm:
+            try:
+                docs_and_scores = self.retrieve(query)
+                if not docs_and_scores:
+                    return "未在医疗知识库中找到相关信息"
+                return self._answer_from_documents(query, docs_and_scores)
+            except Exception as e:
+                return f"查询知识库时出错: {str(e)}"
+
+        # 未创建多查询检索器时使用检索链
         if not self.retrieval_chain:
             return "医疗知识库不可用"
 
@@ -357,35 +739,231 @@ class BaseMedicalAgent(ABC):
         except Exception as e:
             return f"查询知识库时出错: {str(e)}"
 
+    def retrieve(self, question, k=None):
+        """同步检索知识库，各查询变体在共享线程池中并发执行
+
+        Returns:
+            List[Tuple[Document, float]]: 合并后的(文档, 得分)列表
+        """
+        if not self.retriever:
+            return []
+
+        with stage("retrieval", self.agent_type):
+            queries = self.retriever.build_query_variants(question)
+            return self.retriever.retrieve(queries, k=k)
+
+    async def aretrieve(self, question, k=None):
+        """异步检索知识库，原始问题、症状和同义词扩展等查询变体并发执行
+
+        Returns:
+            List[Tuple[Document, float]]: 合并后的(文档, 得分)列表
+        """
+        if not self.retriever:
+            return []
+
+        with stage("retrieval", self.agent_type):
+            queries = self.retriever.build_query_variants(question)
+            return await self.retriever.aretrieve(queries, k=k)
+
+    async def aquery_medical_knowledge(self, query, prefetch=None):
+        """异步查询医疗知识库：多查询并发检索后由语言模型基于检索结果作答
+
+        查询与本次请求预取的问题相近时直接使用预取的检索结果。
+        """
+        if not self.retriever or not self.llm:
+            return "医疗知识库不可用"
+
+        try:
+            docs_and_scores = await prefetch.aget(query) if prefetch is not None else None
+            if docs_and_scores is None:
+                docs_and_scores = await self.aretrieve(query)
+            if not docs_and_scores:
+                return "未在医疗知识库中找到相关信息"
+
+            return await self._aanswer_from_documents(query, docs_and_scores)
+        except Exception as e:
+            return f"查询知识库时出错: {str(e)}"
+
+    def _answer_from_documents(self, question, docs_and_scores, tracker=None):
+        """基于检索到的文档一次调用语言模型作答"""
+        inputs = {"context": "\n\n".join(doc.page_content for doc, _ in docs_and_scores), "question": question}
+        response = self.prompts.get("knowledge_qa").invoke(inputs)
+        if tracker:
+            tracker.record_llm_response(list(inputs.values()), response)
+        return self._format_answer_with_sources(getattr(response, "content", str(response)), docs_and_scores)
+
+    async def _aanswer_from_documents(self, question, docs_and_scores, tracker=None):
+        """基于检索到的文档一次异步调用语言模型作答"""
+        inputs = {"context": "\n\n".join(doc.page_content for doc, _ in docs_and_scores), "question": question}
+        response = await self.prompts.get("knowledge_qa").ainvoke(inputs)
+        if tracker:
+            tracker.record_llm_response(list(inputs.values()), response)
+        return self._format_answer_with_sources(getattr(response, "content", str(response)), docs_and_scores)
+
+    @staticmethod
+    def _collect_sources(docs_and_scores):
+        """按出现顺序收集文档来源并去重"""
+        sources = []
+        for doc, _ in docs_and_scores:
+            source = doc.metadata.get("source")
+            if source and source not in sources:
+                sources.append(source)
+        return sources
+
+    def _format_answer_with_sources(self, answer, docs_and_scores):
+        """在回答后追加信息来源，与检索链工具的输出格式保持一致"""
+        sources = self._collect_sources(docs_and_scores)
+        if sources:
+            return f"{answer}\n\n信息来源: {', '.join(sources)}"
+        return answer
+
+    def web_search(self, query):
+        """搜索互联网上的医疗信息"""
+        if self.search:
+            return self.search.search(query)
+        else:
+            return SEARCH_UNAVAILABLE
+
+    async def aweb_search(self, query):
+        """异步搜索互联网上的医疗信息"""
+        if not self.search:
+            return SEARCH_UNAVAILABLE
+        return await self.search.asearch(query)
+
     def extract_symptoms(self, text):
         """从文本中提取症状信息"""
         return self.medical_tools.extract_symptoms(text)
 
+    async def aextract_symptoms(self, text):
+        """异步提取症状信息，本地规则计算无需切换线程"""
+        return self.extract_symptoms(text)
+
+    def extract_vital_signs(self, text):
+        """从文本中提取生命体征和化验数值"""
+        return self.medical_tools.extract_vital_signs(text)
+
     def assess_severity(self, symptoms):
         """评估症状的严重程度"""
         return self.medical_tools.assess_severity(symptoms)
 
-    def run(self, question):
-        """运行智能体回答问题"""
+    async def aassess_severity(self, symptoms):
+        """异步评估症状的严重程度，本地规则计算无需切换线程"""
+        return self.assess_severity(symptoms)
+
+    @staticmethod
+    def _extract_answer(result):
+        """从LangGraph智能体的执行结果中提取最终回答"""
+        if isinstance(result, dict) and "messages" in result:
+            for message in reversed(result["messages"]):
+                if isinstance(message, AIMessage):
+                    return message.content
+
+        return str(result)
+
+    def _run_fast_path(self, question, decision, tracker=None):
+        """快速路径：多查询检索后一次生成作答
+
+        Returns:
+            tuple: (回答, 路由决策)，检索得分不足时回答为None，决策改为智能体路径
+        """
+        if not self.retriever or not self.llm:
+            return None, RouteDecision(QueryRouter.PATH_AGENT, "retriever_unavailable")
+
+        try:
+            docs_and_scores = self.retrieve(question)
+            decision = self.router.confirm(decision, top_relevance_score(docs_and_scores))
+            if decision.path != QueryRouter.PATH_FAST:
+                return None, decision
+
+            return self._answer_from_documents(question, docs_and_scores, tracker), decision
+        except Exception as e:
+            warning(f"快速路径处理失败，回退到智能体: {str(e)}")
+            return None, RouteDecision(QueryRouter.PATH_AGENT, "fast_path_error")
+
+    async def _arun_fast_path(self, question, decision, tracker=None):
+        """快速路径的异步版本"""
+        if not self.retriever or not self.llm:
+            return None, RouteDecision(QueryRouter.PATH_AGENT, "retriever_unavailable")
+
+        try:
+            docs_and_scores = await self.aretrieve(question)
+            decision = self.router.confirm(decision, top_relevance_score(docs_and_scores))
+            if decision.path != QueryRouter.PATH_FAST:
+                return None, decision
+
+            return await self._aanswer_from_documents(question, docs_and_scores, tracker), decision
+        except Exception as e:
+            warning(f"快速路径处理失败，回退到智能体: {str(e)}")
+            return None, RouteDecision(QueryRouter.PATH_AGENT, "fast_path_error")
+
+    def _route(self, question, session_id=None):
+        """会话请求直接走智能体路径，其余请求由路由器判断"""
+        if self._use_session(session_id):
+            return RouteDecision(QueryRouter.PATH_AGENT, "session")
+        return self.router.route(question)
+
+    def run(self, question, session_id=None):
+        """运行智能体回答问题
+
+        简单知识问题经路由器判断后走"检索+单次生成"的快速路径，其余问题交给智能体循环。
+        带session_id的追问需要之前的对话作为上下文，始终交给会话智能体处理。
+        """
+        # 验证医疗查询是否合适
+        is_valid, error_msg = self.medical_tools.validate_medical_query(question)
+        if not is_valid:
+            return error_msg
+
+        start_time = time.perf_counter()
+        tracker = self.budget.new_tracker()
+        decision = self._route(question, session_id)
+
+        answer = None
+        if decision.path == QueryRouter.PATH_FAST:
+            answer, decision = self._run_fast_path(question, decision, tracker)
+
+        if answer is None:
+            answer = self._run_agent(question, tracker, session_id)
+
+        self.router.record(decision, time.perf_counter() - start_time)
+        # 本次请求的预算消耗随响应返回
+        set_request_value("budget", tracker.to_dict())
+        return answer
+
+    async def arun(self, question, session_id=None):
+        """异步运行智能体回答问题
+
+        全程通过ainvoke调用LangGraph和语言模型，等待LLM响应期间不占用线程池线程。
+        """
         # 验证医疗查询是否合适
         is_valid, error_msg = self.medical_tools.validate_medical_query(question)
         if not is_valid:
             return error_msg
 
+        start_time = time.perf_counter()
+        tracker = self.budget.new_tracker()
+        decision = self._route(question, session_id)
+
+        answer = None
+        if decision.path == QueryRouter.PATH_FAST:
+            answer, decision = await self._arun_fast_path(question, decision, tracker)
+
+        if answer is None:
+            answer = await self._arun_agent(question, tracker, session_id)
+
+        self.router.record(decision, time.perf_counter() - start_time)
+        # 本次请求的预算消耗随响应返回
+        set_request_value("budget", tracker.to_dict())
+        return answer
+
+    def _run_agent(self, question, tracker=None, session_id=None):
+        """使用智能体循环回答问题"""
         try:
             # 尝试使用LangGraph智能体处理问题
             if self.agent:
-                result = self.agent.invoke({
-                    "messages": [HumanMessage(content=question)]
-                })
+                result = self._invoke_agent(question, tracker, session_id)
 
                 # 从结果中提取回答
-                if isinstance(result, dict) and "messages" in result:
-                    for message in reversed(result["messages"]):
-                        if isinstance(message, AIMessage):
-                            return message.content
-
-                return str(result)
+                return self._extract_answer(result)
             elif self.llm:
                 # 如果没有智能体，直接使用语言模型回答
                 response = self.llm.invoke([HumanMessage(content=question)])
@@ -403,3 +981,195 @@ class BaseMedicalAgent(ABC):
                 except Exception:
                     pass
             return f"处理问题时出错: {str(e)}"
+
+    async def _arun_agent(self, question, tracker=None, session_id=None):
+        """使用智能体循环异步回答问题"""
+        try:
+            # 尝试使用LangGraph智能体处理问题
+            if self.agent:
+                result = await self._ainvoke_agent(question, tracker, session_id)
+
+                # 从结果中提取回答
+                return self._extract_answer(result)
+            elif self.llm:
+                # 如果没有智能体，直接使用语言模型回答
+                response = await self.llm.ainvoke([HumanMessage(content=question)])
+                return response.content
+            else:
+                return "智能体未正确初始化，无法回答问题"
+        except Exception as e:
+            # 捕获工具调用相关的错误
+            error(f"处理问题时出错: {str(e)}")
+            # 尝试直接使用语言模型回答
+            if self.llm:
+                try:
+                    response = await self.llm.ainvoke([HumanMessage(content=question)])
+                    return response.content
+                except Exception:
+                    pass
+            return f"处理问题时出错: {str(e)}"
+
+    async def astream_run(self, question, session_id=None):
+        """以事件流的形式运行智能体，逐token返回回答
+
+        产生的事件为字典: {"event": 事件类型, "data": 数据}，事件类型包括
+        token（生成的文本片段）、thinking（工具调用过程中模型输出的文本）、discard（本轮以工具调用结束，
+        丢弃本轮已发送的token）、tool_start/tool_end（工具调用进度）、
+        sources（知识库来源）、budget（预算消耗）、done（完整回答）和 error（错误信息）。
+        调用方关闭生成器时，上游的流式生成会随之取消。
+        """
+        # 验证医疗查询是否合适
+        is_valid, error_msg = self.medical_tools.validate_medical_query(question)
+        if not is_valid:
+            yield {"event": "error", "data": {"message": error_msg}}
+            return
+
+        start_time = time.perf_counter()
+        tracker = self.budget.new_tracker()
+        decision = self._route(question, session_id)
+
+        try:
+            if decision.path == QueryRouter.PATH_FAST:
+                docs_and_scores = await self.aretrieve(question) if self.retriever and self.llm else []
+                decision = self.router.confirm(decision, top_relevance_score(docs_and_scores))
+
+                if decision.path == QueryRouter.PATH_FAST:
+                    inputs = {"context": "\n\n".join(doc.page_content for doc, _ in docs_and_scores),
+                              "question": question}
+                    async for event in self._astream_chain(self.prompts.get("knowledge_qa"), inputs):
+                        if event["event"] == "done":
+                            tracker.record_llm_response(list(inputs.values()),
+                                                        AIMessage(content=event["data"]["answer"]))
+                            yield {"event": "sources", "data": {"sources": self._collect_sources(docs_and_scores)}}
+                            yield {"event": "budget", "data": tracker.to_dict()}
+                        yield event
+                    return
+
+            async for event in self._astream_agent_events(question, tracker, session_id):
+                if event["event"] == "done":
+                    yield {"event": "budget", "data": tracker.to_dict()}
+                yield event
+        except Exception as e:
+            error(f"流式处理问题时出错: {str(e)}")
+            yield {"event": "error", "data": {"message": f"处理问题时出错: {str(e)}"}}
+        finally:
+            self.router.record(decision, time.perf_counter() - start_time)
+
+    async def _astream_agent_events(self, question, tracker=None, session_id=None):
+        """使用智能体循环流式回答问题"""
+        if self.agent:
+            async for event in self._astream_agent(question, tracker, session_id):
+                yield event
+        elif self.llm:
+            async for event in self._astream_chain(self.llm, [HumanMessage(content=question)]):
+                yield event
+        else:
+            yield {"event": "error", "data": {"message": "智能体未正确初始化，无法回答问题"}}
+
+    async def _astream_agent(self, question, tracker=None, session_id=None):
+        """通过LangGraph的astream_events流式执行智能体，执行期间进行检索预取"""
+        prefetch = self.prefetcher.start(question)
+        try:
+            async for event in self._astream_agent_graph(question, tracker, session_id, prefetch):
+                yield event
+        finally:
+            self.prefetcher.finish(prefetch)
+
+    async def _astream_agent_graph(self, question, tracker, session_id, prefetch):
+        """流式执行智能体状态图并转换事件"""
+        if self._use_session(session_id):
+            agent = await self._aget_session_agent()
+            config = self._agent_config(tracker, session_id, prefetch)
+        else:
+            agent = self.agent
+            config = self._agent_config(tracker, prefetch=prefetch)
+
+        events = agent.astream_events({"messages": [HumanMessage(content=question)]}, config=config, version="v2")
+        async for event in self._convert_agent_events(events):
+            yield event
+
+    @staticmethod
+    async def _convert_agent_events(events):
+        """把LangGraph的astream_events事件转换为流式接口的事件
+
+        模型输出的文本片段到达即作为token发送。片段中出现工具调用后，本轮后续的文本作为thinking发送；
+        本轮以工具调用结束且已发送过token时，发送discard事件，客户端应丢弃本轮已显示的文本，
+        最终回答只包含最后一轮的文本。
+        """
+        answer_parts = []
+        turn_parts = []
+        calling_tools = False
+        sources = []
+
+        async for event in events:
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+
+            if kind == "on_chat_model_start" and node == "agent":
+                # 新一轮推理开始，只保留最后一轮的文本作为最终回答
+                answer_parts = []
+                turn_parts = []
+                calling_tools = False
+            elif kind == "on_chat_model_stream" and node == "agent":
+                chunk = event["data"]["chunk"]
+                if getattr(chunk, "tool_call_chunks", None):
+                    calling_tools = True
+                content = chunk.content
+                if isinstance(content, str) and content:
+                    if calling_tools:
+                        yield {"event": "thinking", "data": {"content": content}}
+                    else:
+                        turn_parts.append(content)
+                        yield {"event": "token", "data": {"content": content}}
+            elif kind == "on_chat_model_end" and node == "agent":
+                output = event["data"].get("output")
+                content = getattr(output, "content", "")
+                if getattr(output, "tool_calls", None):
+                    # 调用工具前的推理文本不属于最终回答
+                    if turn_parts:
+                        yield {"event": "discard", "data": {"content": "".join(turn_parts)}}
+                    elif not calling_tools and isinstance(content, str) and content:
+                        yield {"event": "thinking", "data": {"content": content}}
+                    turn_parts = []
+                elif not turn_parts and isinstance(content, str) and content:
+                    # 不支持流式输出的模型只有结束事件，整段作为一个token发送
+                    turn_parts = [content]
+                    yield {"event": "token", "data": {"content": content}}
+                answer_parts = turn_parts
+            elif kind == "on_chain_end" and event["name"] == "agent" and not answer_parts:
+                # 预算耗尽时节点直接返回已有回答，不经过模型
+                output = event["data"].get("output") or {}
+                messages = output.get("messages") if isinstance(output, dict) else None
+                content = getattr(messages[-1], "content", "") if messages else ""
+                if isinstance(content, str) and content and not getattr(messages[-1], "tool_calls", None):
+                    answer_parts.append(content)
+                    yield {"event": "token", "data": {"content": content}}
+            elif kind == "on_tool_start":
+                yield {"event": "tool_start", "data": {"tool": event["name"], "input": event["data"].get("input")}}
+            elif kind == "on_tool_end":
+                output = event["data"].get("output")
+                output = getattr(output, "content", output)
+                yield {"event": "tool_end", "data": {"tool": event["name"]}}
+
+                # 从知识库工具的输出中提取来源
+                if isinstance(output, str) and "信息来源:" in output:
+                    for source in output.split("信息来源:")[-1].split(","):
+                        source = source.strip()
+                        if source and source not in sources:
+                            sources.append(source)
+
+        if sources:
+            yield {"event": "sources", "data": {"sources": sources}}
+        yield {"event": "done", "data": {"answer": "".join(answer_parts)}}
+
+    @staticmethod
+    async def _astream_chain(chain, inputs):
+        """流式执行链或语言模型，产生token和done事件"""
+        answer_parts = []
+        async for chunk in chain.astream(inputs):
+            content = getattr(chunk, "content", chunk)
+            if isinstance(content, str) and content:
+                answer_parts.append(content)
+                yield {"event": "token", "data": {"content": content}}
+
+        yield {"event": "done", "data": {"answer": "".join(answer_parts)}}
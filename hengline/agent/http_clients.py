@@ -0,0 +1,394 @@
+"""@FileName: http_clients.py
+@Description: 进程内共享的HTTP连接池，各模型和嵌入客户端按服务地址共用长连接的同步和异步客户端，并统计每个连接池的连接复用情况
+@Author: HengLine
+@Time: 2025/10/17 10:30
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+import threading
+import weakref
+from typing import Any, Dict, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug, info, warning
+from hengline.config import config_reader
+from hengline.agent.metrics import HTTP_POOL_CONNECTIONS, HTTP_POOL_REQUESTS
+
+# 连接池的默认设置，可由http_client配置、http_client.pools中按地址的配置和调用方依次覆盖
+DEFAULT_POOL_CONFIG = {
+    "http2": True,
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 60,
+    "timeout": 120,
+    "connect_timeout": 5
+}
+
+
+def pool_key(base_url: str) -> str:
+    """连接池按协议、主机和端口区分，同一服务的不同接口路径共用连接"""
+    parts = urlsplit(base_url if "://" in base_url else f"http://{base_url}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+class _PoolStats:
+    """一个连接池的请求数和新建连接数，新建连接数即TCP握手次数（HTTPS另有同样次数的TLS握手）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "connections_opened": 0, "tls_handshakes": 0}
+
+    def record_request(self, success: bool):
+        with self._lock:
+            self._stats["requests"] += 1
+            if not success:
+                self._stats["errors"] += 1
+        HTTP_POOL_REQUESTS.inc(pool=self.name, outcome="success" if success else "error")
+
+    def trace(self, event_name: str, _info):
+        """httpcore的连接事件回调"""
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self._stats["connections_opened"] += 1
+            HTTP_POOL_CONNECTIONS.inc(pool=self.name)
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self._stats["tls_handshakes"] += 1
+
+    async def atrace(self, event_name: str, info):
+        self.trace(event_name, info)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        requests = stats["requests"]
+        stats["connection_reuse_rate"] = round(1 - stats["connections_opened"] / requests, 4) if requests else 0.0
+        return stats
+
+
+def _count_connections(transport) -> Tuple[int, int]:
+    """连接池当前打开的连接数和其中空闲的连接数"""
+    pool = getattr(transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    return len(connections), sum(1 for connection in connections if connection.is_idle())
+
+
+# SSE流的结束标记。OpenAI SDK读到该标记后即关闭响应，此时分块编码的结束块还没有读取，
+# httpcore会因响应未读完而断开连接，下一次流式请求只能重新握手
+SSE_DONE = b"[DONE]"
+
+
+class _ReusableStream(httpx.SyncByteStream):
+    """响应体包装：SSE流已到结束标记时，关闭前读完剩余的结束块，使连接回到连接池
+
+    未到结束标记时（如调用方中途停止读取）直接关闭连接，服务端随之中止生成。
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._iterator = None
+        self._tail = b""
+
+    def _chunks(self):
+        if self._iterator is None:
+            self._iterator = iter(self._stream)
+        return self._iterator
+
+    def __iter__(self):
+        for chunk in self._chunks():
+            self._tail = (self._tail + chunk)[-16:]
+            yield chunk
+
+    def close(self):
+        try:
+            if self._tail.rstrip().endswith(SSE_DONE):
+                for _ in self._chunks():
+                    pass
+        except Exception:
+            pass
+        finally:
+            self._stream.close()
+
+
+class _AsyncReusableStream(httpx.AsyncByteStream):
+    """_ReusableStream的异步版本"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._iterator = None
+        self._tail = b""
+
+    def _chunks(self):
+        if self._iterator is None:
+            self._iterator = self._stream.__aiter__()
+        return self._iterator
+
+    async def __aiter__(self):
+        async for chunk in self._chunks():
+            self._tail = (self._tail + chunk)[-16:]
+            yield chunk
+
+    async def aclose(self):
+        try:
+            if self._tail.rstrip().endswith(SSE_DONE):
+                async for _ in self._chunks():
+                    pass
+        except Exception:
+            pass
+        finally:
+            await self._stream.aclose()
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    """在同步传输层上统计请求和新建连接"""
+
+    def __init__(self, stats: _PoolStats, **transport_kwargs):
+        self._stats = stats
+        self._transport = httpx.HTTPTransport(**transport_kwargs)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions.setdefault("trace", self._stats.trace)
+        try:
+            response = self._transport.handle_request(request)
+        except Exception:
+            self._stats.record_request(False)
+            raise
+        self._stats.record_request(True)
+        response.stream = _ReusableStream(response.stream)
+        return response
+
+    def connections(self) -> Tuple[int, int]:
+        return _count_connections(self._transport)
+
+    def close(self):
+        self._transport.close()
+
+
+class _MeteredAsyncTransport(httpx.AsyncBaseTransport):
+    """异步传输层：每个事件循环使用各自的连接池
+
+    异步连接绑定在创建它的事件循环上，不能跨循环复用。API服务只有一个事件循环，
+    稳定负载下所有异步请求共用同一个连接池；同步代码中临时创建的事件循环使用单独的连接池，
+    循环结束后连接池随之释放。
+    """
+
+    def __init__(self, stats: _PoolStats, **transport_kwargs):
+        self._stats = stats
+        self._transport_kwargs = transport_kwargs
+        self._transports = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get_transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._transport_kwargs)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions.setdefault("trace", self._stats.atrace)
+        try:
+            response = await self._get_transport().handle_async_request(request)
+        except Exception:
+            self._stats.record_request(False)
+            raise
+        self._stats.record_request(True)
+        response.stream = _AsyncReusableStream(response.stream)
+        return response
+
+    def connections(self) -> Tuple[int, int]:
+        with self._lock:
+            transports = list(self._transports.values())
+        counts = [_count_connections(transport) for transport in transports]
+        return sum(count[0] for count in counts), sum(count[1] for count in counts)
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class _BorrowedTransport(httpx.BaseTransport):
+    """借用共享连接池的传输层，客户端关闭时不关闭连接池"""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self._transport.handle_request(request)
+
+
+class _AsyncBorrowedTransport(httpx.AsyncBaseTransport):
+    """_BorrowedTransport的异步版本"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+
+class _HttpPool:
+    def __init__(self, name: str, pool_config: Dict[str, Any]):
+        self.name = name
+        self.config = pool_config
+        self.stats = _PoolStats(name)
+        self.http2 = self._use_http2(name, pool_config.get("http2", False))
+
+        transport_kwargs = {
+            "limits": httpx.Limits(max_connections=pool_config["max_connections"],
+                                   max_keepalive_connections=pool_config["max_keepalive_connections"],
+                                   keepalive_expiry=pool_config["keepalive_expiry"]),
+            "http2": self.http2
+        }
+        timeout = httpx.Timeout(pool_config["timeout"], connect=pool_config["connect_timeout"])
+        self.transport = _MeteredTransport(self.stats, **transport_kwargs)
+        self.async_transport = _MeteredAsyncTransport(self.stats, **transport_kwargs)
+        # base_url使只传相对路径的客户端（如Ollama）也能使用；传完整地址的客户端不受影响
+        self.client = httpx.Client(transport=self.transport, timeout=timeout, base_url=name)
+        self.async_client = httpx.AsyncClient(transport=self.async_transport, timeout=timeout, base_url=name)
+
+        # requests会话在首次使用时创建
+        self.session = None
+        self._session_adapter = None
+        self._session_opened = 0
+        self._session_lock = threading.Lock()
+
+    @staticmethod
+    def _use_http2(name: str, enabled: bool) -> bool:
+        """HTTP/2只用于HTTPS（通过ALPN协商，服务端不支持时自动使用HTTP/1.1），且需要安装h2"""
+        if not enabled or not name.startswith("https://"):
+            return False
+        if importlib.util.find_spec("h2") is None:
+            warning(f"未安装h2，连接池 {name} 使用HTTP/1.1（pip install httpx[http2]）")
+            return False
+        return True
+
+    def get_session(self):
+        """基于requests的SDK（如DashScope）使用的共享会话，连接池大小与httpx客户端一致"""
+        with self._session_lock:
+            if self.session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.config["max_connections"])
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.hooks["response"].append(self._on_session_response)
+                self._session_adapter = adapter
+                self.session = session
+            return self.session
+
+    def _session_connections(self) -> int:
+        """requests会话累计新建的连接数，由urllib3连接池计数"""
+        if self._session_adapter is None:
+            return 0
+        pools = self._session_adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in list(pools.keys()) if key in pools)
+
+    def _on_session_response(self, response, *args, **kwargs):
+        self.stats.record_request(response.status_code < 500)
+        opened = self._session_connections()
+        with self._session_lock:
+            delta, self._session_opened = opened - self._session_opened, opened
+        for _ in range(delta):
+            self.stats.trace("connection.connect_tcp.complete", None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.snapshot()
+        sync_open, sync_idle = self.transport.connections()
+        async_open, async_idle = self.async_transport.connections()
+        stats.update({
+            "http2": self.http2,
+            "open_connections": sync_open + async_open,
+            "idle_connections": sync_idle + async_idle,
+            "max_connections": self.config["max_connections"],
+            "max_keepalive_connections": self.config["max_keepalive_connections"]
+        })
+        return stats
+
+
+class HttpClientFactory:
+    """进程内共享的HTTP客户端工厂
+
+    每个服务地址（协议、主机和端口）只创建一对同步和异步客户端，同一进程中的所有智能体
+    （医疗和生成式、各后端）共用。客户端保持长连接，HTTPS在可用时使用HTTP/2多路复用，
+    稳定负载下的请求复用已建立的连接，不再重复TCP和TLS握手。
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        self.defaults = dict(DEFAULT_POOL_CONFIG)
+        self.defaults.update({key: value for key, value in config.items() if key in DEFAULT_POOL_CONFIG})
+        # 服务地址 -> 该地址连接池的配置
+        self.pool_configs = {pool_key(url): pool_config for url, pool_config in config.get("pools", {}).items()}
+        self._pools: Dict[str, _HttpPool] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, base_url: str, pool_config: Dict[str, Any] = None) -> _HttpPool:
+        name = pool_key(base_url)
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                # 优先级：pools中按地址的配置 > 调用方的配置 > 全局默认值
+                merged = dict(self.defaults)
+                merged.update({key: value for key, value in (pool_config or {}).items() if key in DEFAULT_POOL_CONFIG})
+                merged.update(self.pool_configs.get(name, {}))
+                pool = self._pools[name] = _HttpPool(name, merged)
+                info(f"已创建HTTP连接池: {name}，最大连接数 {merged['max_connections']}，HTTP/2 {pool.http2}")
+            elif pool_config:
+                debug(f"HTTP连接池 {name} 已存在，沿用首次创建时的配置")
+            return pool
+
+    def get_clients(self, base_url: str, pool_config: Dict[str, Any] = None) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """获取服务地址对应的共享同步和异步客户端"""
+        pool = self._get_pool(base_url, pool_config)
+        return pool.client, pool.async_client
+
+    def get_transports(self, base_url: str, pool_config: Dict[str, Any] = None) \
+            -> Tuple[httpx.BaseTransport, httpx.AsyncBaseTransport]:
+        """获取服务地址对应的共享同步和异步传输层
+
+        用于自行创建httpx客户端的SDK（如ollama）：作为transport参数传入，SDK客户端的请求头、认证、
+        重定向和地址中的路径前缀等设置不变，连接使用共享连接池，SDK客户端关闭时不关闭连接池。
+        """
+        pool = self._get_pool(base_url, pool_config)
+        return _BorrowedTransport(pool.transport), _AsyncBorrowedTransport(pool.async_transport)
+
+    def get_session(self, base_url: str, pool_config: Dict[str, Any] = None):
+        """获取服务地址对应的共享requests会话，用于基于requests的SDK"""
+        return self._get_pool(base_url, pool_config).get_session()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各连接池的请求数、新建连接数、连接复用率和当前连接数"""
+        with self._lock:
+            pools = list(self._pools.values())
+        return {pool.name: pool.get_stats() for pool in pools}
+
+    async def aclose(self):
+        """关闭所有连接池，应用停止时调用"""
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.client.close()
+            await pool.async_client.aclose()
+            if pool.session is not None:
+                pool.session.close()
+
+
+# 全局HTTP客户端工厂
+http_client_factory = HttpClientFactory(config_reader.get_module_config("http_client"))
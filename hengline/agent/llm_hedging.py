@@ -0,0 +1,195 @@
+"""@FileName: llm_hedging.py
+@Description: 对冲请求，模型调用在近期首token耗时的高百分位内仍未返回首个token时发出重复请求，取先返回者
+@Author: HengLine
+@Time: 2025/10/13 16:10
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import BaseMessageChunk, message_chunk_to_message
+from langchain_core.runnables import Runnable
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug
+from hengline.config import config_reader
+
+
+class LLMHedger:
+    """对冲请求的全局配置、限流和统计
+
+    /api/query 的长尾耗时主要来自上游偶发的慢生成。启用后，对配置的后端（默认qwen、openai），
+    模型调用在近期首token耗时的指定百分位内仍未返回首个token时，向同一后端再发一次相同的请求，
+    使用先返回首个token的一方，取消另一方。每分钟发出的对冲请求数有上限，避免上游变慢时请求量翻倍。
+    """
+
+    def __init__(self, hedging_config: Dict[str, Any] = None):
+        hedging_config = hedging_config or {}
+        self.enabled = hedging_config.get("enabled", False)
+        self.backends = hedging_config.get("backends", ["qwen", "openai"])
+        self.percentile = hedging_config.get("percentile", 95)
+        self.min_samples = hedging_config.get("min_samples", 20)
+        self.min_delay = hedging_config.get("min_delay", 0.5)
+        self.max_hedges_per_minute = hedging_config.get("max_hedges_per_minute", 30)
+        self.window_size = hedging_config.get("window_size", 200)
+
+        self._lock = threading.Lock()
+        self._hedge_times = deque()
+        self._stats = {}
+
+    def applies_to(self, backend: str) -> bool:
+        return self.enabled and backend in self.backends
+
+    def wrap(self, model, name: str) -> "HedgedModel":
+        """包装模型，name用于区分各条链的首token耗时和统计"""
+        return HedgedModel(model, name, self)
+
+    def try_acquire(self) -> bool:
+        """按每分钟上限申请一次对冲名额"""
+        now = time.monotonic()
+        with self._lock:
+            while self._hedge_times and now - self._hedge_times[0] >= 60:
+                self._hedge_times.popleft()
+            if len(self._hedge_times) >= self.max_hedges_per_minute:
+                return False
+            self._hedge_times.append(now)
+            return True
+
+    def count(self, name: str, field: str):
+        with self._lock:
+            chain_stats = self._stats.setdefault(name, {
+                "requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "capped": 0
+            })
+            chain_stats[field] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各链的请求数、对冲次数和对冲请求的胜出率"""
+        with self._lock:
+            chains = {}
+            for name, chain_stats in self._stats.items():
+                chains[name] = dict(chain_stats)
+                chains[name]["hedge_win_rate"] = round(
+                    chain_stats["hedge_wins"] / chain_stats["hedged"], 4) if chain_stats["hedged"] else 0.0
+            return {
+                "enabled": self.enabled,
+                "hedges_last_minute": len(self._hedge_times),
+                "max_hedges_per_minute": self.max_hedges_per_minute,
+                "chains": chains
+            }
+
+
+class HedgedModel(Runnable):
+    """带对冲的模型包装，可直接放在提示链中代替原模型
+
+    异步调用以流式方式执行以获得首token时间，ainvoke汇总流式片段后返回完整消息；同步调用不做对冲。
+    """
+
+    def __init__(self, model, name: str, hedger: LLMHedger):
+        self.model = model
+        self.name = name
+        self.hedger = hedger
+        self._ttft = deque(maxlen=hedger.window_size)
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲等待时间：近期首token耗时的指定百分位，样本不足时不对冲"""
+        with self._lock:
+            samples = sorted(self._ttft)
+        if len(samples) < self.hedger.min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(self.hedger.percentile / 100 * (len(samples) - 1))))
+        return max(self.hedger.min_delay, samples[index])
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.model.invoke(input, config, **kwargs)
+
+    def stream(self, input, config=None, **kwargs):
+        return self.model.stream(input, config, **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        result = None
+        async for chunk in self.astream(input, config, **kwargs):
+            result = chunk if result is None else result + chunk
+        return message_chunk_to_message(result) if isinstance(result, BaseMessageChunk) else result
+
+    async def astream(self, input, config=None, **kwargs):
+        self.hedger.count(self.name, "requests")
+        start_time = time.perf_counter()
+        primary = self.model.astream(input, config, **kwargs)
+        attempts = {asyncio.ensure_future(primary.__anext__()): primary}
+        winner = None
+
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(list(attempts), timeout=delay)
+                if not done:
+                    if self.hedger.try_acquire():
+                        # 首token超时，向同一后端发出重复请求
+                        self.hedger.count(self.name, "hedged")
+                        debug(f"模型调用 {self.name} 在 {delay:.2f}s 内未返回首个token，发出对冲请求")
+                        hedge = self.model.astream(input, config, **kwargs)
+                        attempts[asyncio.ensure_future(hedge.__anext__())] = hedge
+                    else:
+                        self.hedger.count(self.name, "capped")
+
+            first_task = await self._first_completed(list(attempts))
+            winner = attempts[first_task]
+            if len(attempts) > 1:
+                self.hedger.count(self.name, "primary_wins" if winner is primary else "hedge_wins")
+            if first_task.exception() is None:
+                self._record_ttft(time.perf_counter() - start_time)
+        finally:
+            # 取消落后的一方；尚未决出胜者时（如调用方取消）全部取消
+            for task, stream in attempts.items():
+                if stream is not winner:
+                    await self._close(task, stream)
+
+        try:
+            try:
+                first_chunk = first_task.result()
+            except StopAsyncIteration:
+                return
+            yield first_chunk
+            async for chunk in winner:
+                yield chunk
+        finally:
+            await winner.aclose()
+
+    @staticmethod
+    async def _first_completed(tasks):
+        """返回最先成功产生首个片段的任务，全部失败时返回原请求的任务（由调用方抛出其异常）"""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # 同时完成时优先使用原请求
+            for task in sorted(done, key=tasks.index):
+                if task.exception() is None or isinstance(task.exception(), StopAsyncIteration):
+                    return task
+        return tasks[0]
+
+    @staticmethod
+    async def _close(task, stream):
+        if not task.done():
+            task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+        await stream.aclose()
+
+    def _record_ttft(self, elapsed: float):
+        """记录首token耗时；对冲胜出时记录的是原请求首token耗时的下限"""
+        with self._lock:
+            self._ttft.append(elapsed)
+
+
+# 全局对冲配置和统计
+llm_hedger = LLMHedger(config_reader.get_module_config("hedging"))
@@ -0,0 +1,203 @@
+"""@FileName: metrics.py
+@Description: 轻量的指标注册表，按标签记录计数器和耗时直方图，并输出Prometheus文本格式
+@Author: HengLine
+@Time: 2025/10/13 20:30
+"""
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 耗时直方图的默认分桶（秒），覆盖本地规则计算到长文本生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """按标签累加的计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """按标签记录的耗时直方图，分桶为累计计数，与Prometheus的histogram类型一致"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数, 总和, 总数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def summary(self, **labels) -> Optional[Dict[str, float]]:
+        """某组标签的调用次数和平均耗时，未记录过时返回None"""
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            return {"count": entry[2], "avg_seconds": round(entry[1] / entry[2], 6)}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, [list(entry[0]), entry[1], entry[2]]) for key, entry in self._values.items())
+
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = _format_labels(self.label_names, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.label_names, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(float(total))}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def _get_or_create(self, metric_class, name, documentation, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, label_names, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"指标 {name} 已注册为 {metric.type_name} 类型")
+            return metric
+
+    def render(self) -> str:
+        """输出Prometheus文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+# 请求各阶段（嵌入、向量检索、图节点、工具等）的耗时
+STAGE_LATENCY = metrics.histogram(
+    "hengline_stage_duration_seconds", "Latency of request stages such as embedding, vector search, graph nodes and tools.",
+    ("stage", "backend"))
+STAGE_ERRORS = metrics.counter(
+    "hengline_stage_errors_total", "Number of request stages that raised an error.", ("stage", "backend"))
+
+# 模型调用的首token耗时、总耗时、错误数、token数和估算费用
+LLM_TTFT = metrics.histogram(
+    "hengline_llm_time_to_first_token_seconds", "Time from the start of a streaming LLM call to its first token.",
+    ("backend", "model"))
+LLM_LATENCY = metrics.histogram(
+    "hengline_llm_duration_seconds", "Total latency of LLM calls.", ("backend", "model"))
+LLM_ERRORS = metrics.counter(
+    "hengline_llm_errors_total", "Number of failed LLM calls.", ("backend", "model"))
+LLM_TOKENS = metrics.counter(
+    "hengline_llm_tokens_total", "Tokens consumed by LLM calls, split into input and output.",
+    ("backend", "model", "direction"))
+LLM_COST = metrics.counter(
+    "hengline_llm_estimated_cost_total", "Estimated cost of LLM calls based on the configured per-token prices.",
+    ("backend", "model"))
+
+# 工具调用次数（按结果：success、error、timeout）和耗时，包括等待并发名额的时间
+TOOL_CALLS = metrics.counter(
+    "hengline_tool_calls_total", "Number of tool calls by tool, backend and outcome.", ("tool", "backend", "status"))
+TOOL_LATENCY = metrics.histogram(
+    "hengline_tool_duration_seconds", "Latency of tool calls including time spent waiting for a concurrency slot.",
+    ("tool", "backend"))
+
+# 进程内vLLM引擎的批次大小，以及请求从提交到开始生成（批量引擎为批次提交，异步引擎为首个输出）的等待时间
+VLLM_BATCH_SIZE = metrics.histogram(
+    "hengline_vllm_batch_size", "Number of requests per micro-batch submitted to the in-process vLLM engine.",
+    ("model",), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+VLLM_QUEUE_WAIT = metrics.histogram(
+    "hengline_vllm_queue_wait_seconds", "Time an in-process vLLM request waits before generation starts.",
+    ("model", "engine"))
+
+# 共享HTTP连接池的请求数和新建连接数（每个新建连接对应一次TCP握手，HTTPS另加一次TLS握手）
+HTTP_POOL_REQUESTS = metrics.counter(
+    "hengline_http_pool_requests_total", "Number of outbound HTTP requests by connection pool and outcome.",
+    ("pool", "outcome"))
+HTTP_POOL_CONNECTIONS = metrics.counter(
+    "hengline_http_pool_connections_opened_total", "Number of new connections opened by each outbound connection pool.",
+    ("pool",))
+
+# API请求数和端到端耗时
+HTTP_REQUESTS = metrics.counter(
+    "hengline_http_requests_total", "Number of API requests by endpoint and status code.", ("endpoint", "status"))
+HTTP_LATENCY = metrics.histogram(
+    "hengline_http_request_duration_seconds", "End-to-end latency of API requests.", ("endpoint",))
@@ -10,6 +10,9 @@ from utils.log_utils import print_log_exception
 
 # 从基类导入
 from hengline.agent.base_agent import BaseMedicalAgent
+from hengline.agent.tracing import TimedEmbeddings
+from hengline.agent.http_clients import http_client_factory
+from hengline.agent.ollama.ollama_runtime import get_ollama_runtime
 
 # 导入Ollama特定的库
 from langchain_ollama import ChatOllama
@@ -34,43 +37,31 @@ class OllamaBaseAgent(BaseMedicalAgent):
         try:
             # 从配置中获取Ollama模型参数
             ollama_config = self.config_reader.get_ollama_config()
-            
-            # 尝试使用支持工具调用的模型
-            try:
-                llm = ChatOllama(
-                    model=ollama_config.get("model_name", "llama3.2"),
-                    temperature=ollama_config.get("temperature", 0.1),
-                    base_url=ollama_config.get("base_url", "http://localhost:11434"),
-                    keep_alive=ollama_config.get("keep_alive", 300),
-                    top_p=ollama_config.get("top_p", 0.95),
-                    num_predict=ollama_config.get("max_tokens", 1024)
-                )
-                self.model_supports_tools = self._check_tool_support(ollama_config.get("model_name", "llama3.2"))
-                logger.info(f"成功初始化Ollama模型: {ollama_config.get('model_name', 'llama3.2')}")
-                return llm
-            except Exception as e:
-                # 如果首选模型不可用，尝试使用备选模型
-                logger.warning(f"尝试使用首选模型失败: {str(e)}")
-                
-                # 备选模型列表
-                fallback_models = ["qwen3", "mistral", "llama2"]
-                
-                for fallback_model in fallback_models:
-                    try:
-                        llm = ChatOllama(
-                            model=fallback_model,
-                            temperature=ollama_config.get("temperature", 0.1),
-                            base_url=ollama_config.get("base_url", "http://localhost:11434"),
-                            keep_alive=ollama_config.get("keep_alive", 300)
-                        )
-                        self.model_supports_tools = self._check_tool_support(fallback_model)
-                        logger.info(f"已切换到备选Ollama模型: {fallback_model}")
-                        return llm
-                    except Exception:
-                        continue
-                
-                # 如果所有备选模型都不可用，抛出异常
-                raise Exception("无法初始化Ollama模型，请检查Ollama服务是否正常运行")
+
+            # ChatOllama构造时不会连接服务，先探测服务、从首选模型和备选模型中选出已安装的模型并预热
+            preferred_models = [ollama_config.get("model_name", "llama3.2")]
+            for fallback_model in ollama_config.get("fallback_models", ["qwen3", "mistral", "llama2"]):
+                if fallback_model not in preferred_models:
+                    preferred_models.append(fallback_model)
+            model_name = get_ollama_runtime(ollama_config).prepare(preferred_models)
+
+            # ollama库自行创建httpx客户端（请求头、认证和地址中的路径前缀不变），只传入共享连接池的传输层
+            base_url = ollama_config.get("base_url", "http://localhost:11434")
+            transport, async_transport = http_client_factory.get_transports(base_url)
+            llm = ChatOllama(
+                model=model_name,
+                temperature=ollama_config.get("temperature", 0.1),
+                base_url=base_url,
+                keep_alive=ollama_config.get("keep_alive", 300),
+                top_p=ollama_config.get("top_p", 0.95),
+                num_predict=ollama_config.get("max_tokens", 1024),
+                client_kwargs={"timeout": ollama_config.get("timeout", 300)},
+                sync_client_kwargs={"transport": transport},
+                async_client_kwargs={"transport": async_transport}
+            )
+            self.model_supports_tools = self._check_tool_support(model_name)
+            logger.info(f"成功初始化Ollama模型: {model_name}")
+            return llm
         except Exception as e:
             logger.error(f"初始化Ollama语言模型时出错: {str(e)}")
             # 返回None，基类会处理这种情况
@@ -118,6 +109,9 @@ class OllamaBaseAgent(BaseMedicalAgent):
                 from langchain_community.embeddings.fake import FakeEmbeddings
                 embedding_model = FakeEmbeddings(size=768)
             
+            # 记录查询嵌入和文档嵌入的耗时
+            embedding_model = TimedEmbeddings(embedding_model, agent_type)
+
             # 加载文档并创建向量存储
             from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
             from langchain.text_splitter import CharacterTextSplitter
@@ -22,50 +22,51 @@ class OllamaGenerativeAgent(OllamaBaseAgent):
         # 调用基类初始化
         super().__init__()
         
-        # 初始化生成式提示模板
+        # 初始化生成式提示模板：生成要求作为固定的系统消息，主题放在最后的用户消息中，
+        # 同一生成类型的各次请求共享相同的前缀，便于Ollama复用前缀的KV缓存
         self.prompt_templates = {
-            "general_info": ChatPromptTemplate.from_template(
-                """请提供关于{topic}的详细医学信息。包括：
-                1. 定义和基本概念
-                2. 主要症状和临床表现
-                3. 常见病因
-                4. 诊断方法
-                5. 治疗方案
-                6. 预防措施
-                7. 预后情况
-                
-                请使用自然、易懂的语言，避免过于技术性的术语。"""
-            ),
-            "detailed_explanation": ChatPromptTemplate.from_template(
-                """请详细解释{topic}。要求：
-                1. 深入分析该主题的医学原理
-                2. 提供最新的研究进展
-                3. 解释临床应用中的关键点
-                4. 讨论相关争议或未解决的问题
-                
-                适合医疗专业人士阅读的详细解释。"""
-            ),
-            "patient_education": ChatPromptTemplate.from_template(
-                """为患者创建关于{topic}的教育材料。要求：
-                1. 使用简单易懂的语言
-                2. 重点关注患者需要了解的关键信息
-                3. 提供实际的生活建议
-                4. 解释重要的注意事项
-                5. 包含常见问题解答
-                
-                格式应当友好、易于阅读。"""
-            ),
-            "medical_case": ChatPromptTemplate.from_template(
-                """创建一个关于{topic}的临床案例。要求：
-                1. 提供详细的患者病史
-                2. 描述症状和体征
-                3. 列出诊断过程和检查结果
-                4. 解释治疗方案的制定和实施
-                5. 讨论治疗效果和随访情况
-                6. 提供临床启示和经验教训
-                
-                请确保案例具有教育意义和现实参考价值。"""
-            )
+            "general_info": ChatPromptTemplate.from_messages([
+                ("system", "请提供关于用户给定主题的详细医学信息。包括：\n"
+                           "1. 定义和基本概念\n"
+                           "2. 主要症状和临床表现\n"
+                           "3. 常见病因\n"
+                           "4. 诊断方法\n"
+                           "5. 治疗方案\n"
+                           "6. 预防措施\n"
+                           "7. 预后情况\n\n"
+                           "请使用自然、易懂的语言，避免过于技术性的术语。"),
+                ("human", "主题: {topic}")
+            ]),
+            "detailed_explanation": ChatPromptTemplate.from_messages([
+                ("system", "请详细解释用户给定的主题。要求：\n"
+                           "1. 深入分析该主题的医学原理\n"
+                           "2. 提供最新的研究进展\n"
+                           "3. 解释临床应用中的关键点\n"
+                           "4. 讨论相关争议或未解决的问题\n\n"
+                           "适合医疗专业人士阅读的详细解释。"),
+                ("human", "主题: {topic}")
+            ]),
+            "patient_education": ChatPromptTemplate.from_messages([
+                ("system", "为患者创建关于用户给定主题的教育材料。要求：\n"
+                           "1. 使用简单易懂的语言\n"
+                           "2. 重点关注患者需要了解的关键信息\n"
+                           "3. 提供实际的生活建议\n"
+                           "4. 解释重要的注意事项\n"
+                           "5. 包含常见问题解答\n\n"
+                           "格式应当友好、易于阅读。"),
+                ("human", "主题: {topic}")
+            ]),
+            "medical_case": ChatPromptTemplate.from_messages([
+                ("system", "创建一个关于用户给定主题的临床案例。要求：\n"
+                           "1. 提供详细的患者病史\n"
+                           "2. 描述症状和体征\n"
+                           "3. 列出诊断过程和检查结果\n"
+                           "4. 解释治疗方案的制定和实施\n"
+                           "5. 讨论治疗效果和随访情况\n"
+                           "6. 提供临床启示和经验教训\n\n"
+                           "请确保案例具有教育意义和现实参考价值。"),
+                ("human", "主题: {topic}")
+            ])
         }
         
         # 初始化输出解析器
@@ -85,8 +86,9 @@ class OllamaGenerativeAgent(OllamaBaseAgent):
         
         for chain_name, prompt_template in self.prompt_templates.items():
             try:
-                chain = prompt_template | self.llm | self.output_parser
-                generative_chains[chain_name] = chain
+                # 统一登记到提示链注册表，记录调用次数和耗时
+                generative_chains[chain_name] = self.prompts.register(
+                    f"generate.{chain_name}", prompt_template, self.llm, self.output_parser)
             except Exception as e:
                 logger.error(f"创建{chain_name}生成链时出错: {str(e)}")
         
@@ -125,11 +127,54 @@ class OllamaGenerativeAgent(OllamaBaseAgent):
             
             return result
         except Exception as e:
-            logger.error(f"生成内容时出错: {str(e)}")
-            # 提供更友好的错误信息
-            if "积极拒绝" in str(e):
-                return f"无法连接到Ollama服务。请确保Ollama服务已启动，然后重新尝试。\n错误详情: {str(e)}"
-            return f"生成内容时出错: {str(e)}"
+            return self._format_generation_error(e)
+    
+    async def agenerate_content(self, topic, generation_type="general_info", **kwargs):
+        """异步生成医疗相关内容，参数与generate_content一致"""
+        try:
+            # 验证生成类型
+            if generation_type not in self.generative_chains:
+                available_types = ", ".join(self.generative_chains.keys())
+                return f"不支持的生成类型: {generation_type}。支持的类型: {available_types}"
+            
+            # 准备输入
+            input_data = {"topic": topic}
+            input_data.update(kwargs)
+            
+            logger.info(f"开始异步生成关于'{topic}'的{generation_type}内容")
+            
+            # 异步执行生成
+            result = await self.generative_chains[generation_type].ainvoke(input_data)
+            
+            logger.info(f"完成关于'{topic}'的{generation_type}内容生成")
+            
+            return result
+        except Exception as e:
+            return self._format_generation_error(e)
+    
+    async def astream_content(self, topic, generation_type="general_info", **kwargs):
+        """流式生成医疗相关内容，逐token产生事件"""
+        if generation_type not in self.generative_chains:
+            available_types = ", ".join(self.generative_chains.keys())
+            yield {"event": "error", "data": {"message": f"不支持的生成类型: {generation_type}。支持的类型: {available_types}"}}
+            return
+        
+        input_data = {"topic": topic}
+        input_data.update(kwargs)
+        
+        try:
+            async for event in self._astream_chain(self.generative_chains[generation_type], input_data):
+                yield event
+        except Exception as e:
+            yield {"event": "error", "data": {"message": self._format_generation_error(e)}}
+    
+    def _format_generation_error(self, e):
+        """记录生成错误并返回友好的错误信息"""
+        logger.error(f"生成内容时出错: {str(e)}")
+        # 提供更友好的错误信息
+        if "积极拒绝" in str(e):
+            return f"无法连接到Ollama服务。请确保Ollama服务已启动，然后重新尝试。\n错误详情: {str(e)}"
+        return f"生成内容时出错: {str(e)}"
     
     def run(self, question, **kwargs):
         """运行智能体回答问题，同时提供生成式功能"""
@@ -150,6 +195,23 @@ class OllamaGenerativeAgent(OllamaBaseAgent):
         
         return base_answer
     
+    async def arun(self, question, **kwargs):
+        """异步运行智能体回答问题，同时提供生成式功能"""
+        # 首先使用基类的arun方法回答问题
+        base_answer = await super().arun(question)
+        
+        # 检查是否需要生成额外内容
+        if kwargs.get("generate_extra_content", False):
+            # 根据问题自动确定生成类型
+            generation_type = self._determine_generation_type(question)
+            
+            # 异步生成额外内容
+            extra_content = await self.agenerate_content(question, generation_type)
+            
+            return f"{base_answer}\n\n===== 详细说明 =====\n{extra_content}"
+        
+        return base_answer
+    
     def _determine_generation_type(self, question):
         """根据问题自动确定合适的生成类型"""
         question_lower = question.lower()
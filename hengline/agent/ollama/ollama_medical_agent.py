@@ -18,14 +18,18 @@ class OllamaMedicalAgent(OllamaBaseAgent):
         # 调用基类初始化
         super().__init__()
     
-    def run(self, question):
+    def run(self, question, session_id=None):
         """运行智能体回答问题，针对Ollama模型进行优化"""
         # 调用基类的run方法
-        result = super().run(question)
+        result = super().run(question, session_id)
         
         # 可以在这里添加Ollama特定的后处理
         return result
 
+    async def arun(self, question, session_id=None):
+        """异步运行智能体回答问题，针对Ollama模型进行优化"""
+        return await super().arun(question, session_id)
+
 
 if __name__ == "__main__":
     # 创建基于Ollama的医疗智能体实例
@@ -0,0 +1,245 @@
+"""@FileName: ollama_runtime.py
+@Description: Ollama服务的启动准备：探测可用模型、预热加载权重、按keep_alive定期保活，并记录就绪耗时和模型加载耗时
+@Author: HengLine
+@Time: 2025/10/17 15:20
+"""
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+# 导入日志模块
+from hengline.logger import logger
+from hengline.agent.http_clients import http_client_factory
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+# keep_alive的时间单位
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_keep_alive(keep_alive) -> Optional[float]:
+    """把keep_alive（秒数或"5m"、"1h"这样的时长）转换为秒，负数表示常驻内存，返回None"""
+    if keep_alive is None:
+        return 300.0
+    if isinstance(keep_alive, (int, float)):
+        seconds = float(keep_alive)
+    else:
+        match = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*", str(keep_alive))
+        if not match:
+            return 300.0
+        seconds = float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+    return None if seconds < 0 else seconds
+
+
+def match_model(model: str, installed: List[str]) -> Optional[str]:
+    """在已安装的模型中查找，未写标签的模型名匹配该模型的任意标签，优先latest"""
+    if model in installed:
+        return model
+    if ":" not in model:
+        if f"{model}:latest" in installed:
+            return f"{model}:latest"
+        for name in installed:
+            if name.split(":", 1)[0] == model:
+                return name
+    return None
+
+
+class OllamaRuntime:
+    """一个Ollama服务地址的启动准备和保活
+
+    Ollama在首次请求时才把模型权重加载进内存，通常需要数秒到数十秒，且模型空闲超过keep_alive后
+    会被卸载。智能体初始化时先通过/api/tags确认服务可用并从偏好列表中选出已安装的模型，
+    再发起一次只生成一个token的预热请求加载权重；之后后台线程按keep_alive的一定比例定期发送
+    空提示请求，重置卸载计时，使用户请求不再承担模型加载时间。同一地址的医疗和生成式智能体共用。
+    """
+
+    def __init__(self, base_url: str, ollama_config: Dict[str, Any]):
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = ollama_config.get("keep_alive", 300)
+        self.keep_alive_seconds = parse_keep_alive(self.keep_alive)
+        self.warm_up_enabled = ollama_config.get("warm_up", True)
+        self.probe_timeout = ollama_config.get("probe_timeout", 3)
+        self.warm_up_timeout = ollama_config.get("timeout", 300)
+        self.ping_ratio = ollama_config.get("keep_alive_ping_ratio", 0.8)
+        self.client, _ = http_client_factory.get_clients(self.base_url, {"timeout": self.warm_up_timeout})
+
+        self.started_at = time.time()
+        self.installed_models: List[str] = []
+        # 模型名 -> 预热结果
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._ping_thread = None
+        self._lock = threading.Lock()
+        self._stats = {"status": "starting", "reachable": None, "time_to_ready_ms": None, "pings": 0,
+                       "ping_failures": 0, "last_ping_at": None}
+
+    def list_models(self) -> Optional[List[str]]:
+        """查询已安装的模型，服务不可达时返回None"""
+        try:
+            response = self.client.get("/api/tags", timeout=self.probe_timeout)
+            response.raise_for_status()
+            models = [model.get("name") or model.get("model") for model in response.json().get("models", [])]
+        except Exception as e:
+            logger.warning(f"无法连接Ollama服务 {self.base_url}: {str(e)}")
+            with self._lock:
+                self._stats["reachable"] = False
+                self._stats["status"] = "unreachable"
+            return None
+        with self._lock:
+            self.installed_models = [name for name in models if name]
+            self._stats["reachable"] = True
+        return self.installed_models
+
+    def select_model(self, preferred_models: List[str]) -> str:
+        """按偏好顺序选择第一个已安装的模型；服务不可达或都未安装时返回首选模型"""
+        installed = self.list_models()
+        if installed is None:
+            return preferred_models[0]
+
+        for model in preferred_models:
+            matched = match_model(model, installed)
+            if matched:
+                if model != preferred_models[0]:
+                    logger.warning(f"Ollama未安装首选模型 {preferred_models[0]}，已切换到备选模型 {matched}")
+                return matched
+
+        logger.warning(f"Ollama未安装以下任何模型: {', '.join(preferred_models)}（已安装: {', '.join(installed) or '无'}），"
+                       f"请先执行 ollama pull {preferred_models[0]}")
+        return preferred_models[0]
+
+    def prepare(self, preferred_models: List[str]) -> str:
+        """选择模型并预热，返回选中的模型名；同一模型只预热一次"""
+        model = self.select_model(preferred_models)
+        with self._lock:
+            prepared = model in self._models
+            if not prepared:
+                self._models[model] = {"load_duration_ms": None, "warm_up_ms": None, "warmed_up": False}
+
+        if not prepared and self.warm_up_enabled and self._stats["reachable"]:
+            self.warm_up(model)
+        with self._lock:
+            if self._stats["time_to_ready_ms"] is None and self._stats["reachable"]:
+                self._stats["time_to_ready_ms"] = round((time.time() - self.started_at) * 1000, 1)
+                self._stats["status"] = "ready"
+        self._start_keep_alive()
+        return model
+
+    def warm_up(self, model: str) -> bool:
+        """生成一个token，使Ollama把模型权重加载进内存"""
+        start_time = time.perf_counter()
+        try:
+            data = self._generate(model, prompt="你好", timeout=self.warm_up_timeout, options={"num_predict": 1})
+        except Exception as e:
+            logger.warning(f"Ollama模型 {model} 预热失败，首个请求将承担模型加载时间: {str(e)}")
+            return False
+
+        elapsed = time.perf_counter() - start_time
+        load_duration_ms = round(data.get("load_duration", 0) / 1e6, 1)
+        with self._lock:
+            self._models[model].update({"load_duration_ms": load_duration_ms, "warm_up_ms": round(elapsed * 1000, 1),
+                                        "warmed_up": True})
+        logger.info(f"Ollama模型 {model} 预热完成，耗时 {elapsed:.2f}秒（模型加载 {load_duration_ms / 1000:.2f}秒）")
+        return True
+
+    def _generate(self, model: str, prompt: str, timeout: float, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        payload = {"model": model, "prompt": prompt, "stream": False, "keep_alive": self.keep_alive}
+        if options:
+            payload["options"] = options
+        response = self.client.post("/api/generate", json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    @property
+    def ping_interval(self) -> Optional[float]:
+        """保活间隔：keep_alive的一定比例；常驻内存（负数）或立即卸载（0）时不保活"""
+        if not self.keep_alive_seconds:
+            return None
+        return max(5.0, self.keep_alive_seconds * self.ping_ratio)
+
+    def _start_keep_alive(self):
+        if self.ping_interval is None:
+            return
+        with self._lock:
+            if self._ping_thread is not None:
+                return
+            self._ping_thread = threading.Thread(target=self._keep_alive_loop, name="ollama-keep-alive", daemon=True)
+            self._ping_thread.start()
+        logger.info(f"Ollama保活已启动: 每 {self.ping_interval:.0f}秒 一次（keep_alive {self.keep_alive}）")
+
+    def _keep_alive_loop(self):
+        while True:
+            time.sleep(self.ping_interval)
+            with self._lock:
+                models = list(self._models)
+            for model in models:
+                self.ping(model)
+
+    def ping(self, model: str) -> bool:
+        """空提示的请求只加载模型不生成内容，重置模型的卸载计时；模型已被卸载时重新加载"""
+        try:
+            try:
+                data = self._generate(model, prompt="", timeout=self.warm_up_timeout)
+            except httpx.TransportError:
+                # 两次保活之间连接空闲较久，可能已被服务端关闭，换新连接重试一次
+                data = self._generate(model, prompt="", timeout=self.warm_up_timeout)
+        except Exception as e:
+            with self._lock:
+                self._stats["ping_failures"] += 1
+                self._stats["reachable"] = False
+                self._stats["status"] = "unreachable"
+            logger.warning(f"Ollama保活请求失败: {model}，{str(e)}")
+            return False
+
+        with self._lock:
+            self._stats["pings"] += 1
+            self._stats["last_ping_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            self._stats["reachable"] = True
+            self._stats["status"] = "ready"
+            if self._stats["time_to_ready_ms"] is None:
+                self._stats["time_to_ready_ms"] = round((time.time() - self.started_at) * 1000, 1)
+            load_duration = data.get("load_duration", 0)
+            # 加载耗时明显时说明模型曾被卸载，重新加载过
+            if load_duration > 1e8:
+                self._models[model]["load_duration_ms"] = round(load_duration / 1e6, 1)
+                self._models[model]["warmed_up"] = True
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "base_url": self.base_url,
+                "keep_alive": self.keep_alive,
+                "ping_interval_seconds": self.ping_interval,
+                "installed_models": list(self.installed_models),
+                "models": {model: dict(info) for model, info in self._models.items()}
+            })
+            return stats
+
+
+# 服务地址 -> 启动准备和保活
+_runtimes: Dict[str, OllamaRuntime] = {}
+_runtimes_lock = threading.Lock()
+
+
+def get_ollama_runtime(ollama_config: Dict[str, Any]) -> OllamaRuntime:
+    base_url = (ollama_config.get("base_url") or DEFAULT_BASE_URL).rstrip("/")
+    with _runtimes_lock:
+        runtime = _runtimes.get(base_url)
+        if runtime is None:
+            runtime = _runtimes[base_url] = OllamaRuntime(base_url, ollama_config)
+        return runtime
+
+
+def get_ollama_stats() -> Dict[str, Any]:
+    """各Ollama服务的就绪耗时、模型加载耗时和保活情况"""
+    with _runtimes_lock:
+        runtimes = list(_runtimes.values())
+    return {runtime.base_url: runtime.get_stats() for runtime in runtimes}
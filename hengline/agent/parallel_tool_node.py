@@ -0,0 +1,163 @@
+"""@FileName: parallel_tool_node.py
+@Description: 并行工具执行节点，同一步中相互独立的工具调用并发执行，超时、并发上限和统计由工具注册表负责
+@Author: HengLine
+@Time: 2025/10/9 20:10
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import copy_context
+from typing import Dict, Any, List
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug, warning
+from hengline.agent.tool_registry import ToolRegistry, ToolTimeoutError
+
+
+class ParallelToolNode:
+    """并行工具执行节点
+
+    模型在一轮中给出多个工具调用时（如同时提取症状、查询知识库和网络搜索），
+    各调用并发执行，单步耗时取决于最慢的工具而不是所有工具之和。
+    工具从注册表获取，各工具的超时时间、并发上限和调用统计由注册表统一管理；
+    超时或出错的调用以错误信息返回给模型，不影响其他调用。
+    每个ToolMessage的additional_kwargs["tool_timing"]中附带该工具的耗时。
+    """
+
+    def __init__(self, registry: ToolRegistry, max_concurrency: int = 4):
+        self.registry = registry
+        self.max_concurrency = max(1, max_concurrency)
+
+        # 同步执行使用的线程池，线程数即单步的并发上限
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="tool")
+
+    def as_runnable(self):
+        """包装为可加入StateGraph的节点，同时支持invoke和ainvoke"""
+        return RunnableLambda(self._run, afunc=self._arun, name="tools")
+
+    def _get_timeout(self, tool_name: str) -> float:
+        return self.registry.get_timeout(tool_name)
+
+    @staticmethod
+    def _get_tool_calls(state) -> List[Dict[str, Any]]:
+        """获取最后一条消息中的工具调用"""
+        messages = state["messages"] if isinstance(state, dict) else state
+        return getattr(messages[-1], "tool_calls", None) or []
+
+    def _run(self, state, config=None):
+        """同步执行：各工具调用在线程池中并发执行"""
+        tool_calls = self._get_tool_calls(state)
+        step_start = time.perf_counter()
+
+        futures = []
+        for tool_call in tool_calls:
+            # 每个调用使用独立的上下文副本，保证回调和追踪信息在线程中可用
+            context = copy_context()
+            futures.append(self._executor.submit(context.run, self._invoke_tool, tool_call, config))
+
+        messages = []
+        for tool_call, future in zip(tool_calls, futures):
+            # 超时从本步开始计算，避免依次等待时超时时间累加
+            timeout = self._get_timeout(tool_call["name"])
+            remaining = max(0.0, step_start + timeout - time.perf_counter())
+            try:
+                messages.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                # 超时的线程无法中断，只放弃等待其结果，注册表在其结束时计为超时
+                messages.append(self._timeout_message(tool_call, timeout))
+
+        self._log_step(messages, step_start)
+        return {"messages": messages}
+
+    async def _arun(self, state, config=None):
+        """异步执行：各工具调用并发执行，并发数受信号量限制，超时由注册表中的工具自行结束"""
+        tool_calls = self._get_tool_calls(state)
+        step_start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(tool_call):
+            async with semaphore:
+                return await self._ainvoke_tool(tool_call, config)
+
+        messages = list(await asyncio.gather(*[run_one(tool_call) for tool_call in tool_calls]))
+
+        self._log_step(messages, step_start)
+        return {"messages": messages}
+
+    def _invoke_tool(self, tool_call, config) -> ToolMessage:
+        """执行单个工具调用"""
+        start_time = time.perf_counter()
+        tool = self.registry.get(tool_call["name"])
+        if tool is None:
+            return self._error_message(tool_call, f"未知的工具: {tool_call['name']}", start_time)
+
+        try:
+            output = tool.invoke(tool_call["args"], config)
+            return self._output_message(tool_call, output, start_time)
+        except ToolTimeoutError as e:
+            return self._timeout_message(tool_call, e.timeout)
+        except Exception as e:
+            return self._error_message(tool_call, f"工具 {tool_call['name']} 执行出错: {str(e)}", start_time)
+
+    async def _ainvoke_tool(self, tool_call, config) -> ToolMessage:
+        """异步执行单个工具调用"""
+        start_time = time.perf_counter()
+        tool = self.registry.get(tool_call["name"])
+        if tool is None:
+            return self._error_message(tool_call, f"未知的工具: {tool_call['name']}", start_time)
+
+        try:
+            output = await tool.ainvoke(tool_call["args"], config)
+            return self._output_message(tool_call, output, start_time)
+        except ToolTimeoutError as e:
+            return self._timeout_message(tool_call, e.timeout)
+        except Exception as e:
+            return self._error_message(tool_call, f"工具 {tool_call['name']} 执行出错: {str(e)}", start_time)
+
+    def _output_message(self, tool_call, output, start_time) -> ToolMessage:
+        if not isinstance(output, str):
+            try:
+                output = json.dumps(output, ensure_ascii=False)
+            except (TypeError, ValueError):
+                output = str(output)
+        return self._build_message(tool_call, output, "success", time.perf_counter() - start_time)
+
+    def _error_message(self, tool_call, content, start_time) -> ToolMessage:
+        warning(content)
+        return self._build_message(tool_call, content, "error", time.perf_counter() - start_time)
+
+    def _timeout_message(self, tool_call, timeout) -> ToolMessage:
+        warning(f"工具 {tool_call['name']} 执行超时（{timeout}秒）")
+        return self._build_message(tool_call, f"工具 {tool_call['name']} 执行超时，请根据已有信息回答",
+                                   "timeout", timeout)
+
+    def _build_message(self, tool_call, content, status, elapsed) -> ToolMessage:
+        """构建工具消息并附带耗时信息"""
+        return ToolMessage(
+            content=content,
+            name=tool_call["name"],
+            tool_call_id=tool_call["id"],
+            status="success" if status == "success" else "error",
+            additional_kwargs={"tool_timing": {"elapsed_ms": round(elapsed * 1000, 2), "status": status}}
+        )
+
+    @staticmethod
+    def _log_step(messages: List[ToolMessage], step_start: float):
+        """记录单步的实际耗时和各工具耗时之和"""
+        if len(messages) > 1:
+            step_ms = (time.perf_counter() - step_start) * 1000
+            total_ms = sum(message.additional_kwargs["tool_timing"]["elapsed_ms"] for message in messages)
+            debug(f"并行执行 {len(messages)} 个工具调用: 耗时 {step_ms:.1f}ms, 串行累计 {total_ms:.1f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各工具的调用次数、错误/超时次数和平均/最大耗时"""
+        return self.registry.get_stats()
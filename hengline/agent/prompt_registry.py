@@ -0,0 +1,194 @@
+"""@FileName: prompt_registry.py
+@Description: 提示链注册表，智能体初始化时一次性编译提示模板和调用链，并记录各链的调用次数和耗时
+@Author: HengLine
+@Time: 2025/10/11 16:40
+"""
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackManager
+from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate
+from langchain_core.runnables.config import ensure_config, merge_configs
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug, warning
+from hengline.agent.llm_hedging import llm_hedger
+
+# 固定文本在前、变量只追加在末尾的系统提示模板，前缀缓存仍能命中固定部分
+STABLE_PREFIX_TEMPLATE = re.compile(r"[^{}]+(?:\{\w+\})+")
+
+
+class CompiledChain:
+    """预编译的提示链，调用方式与LangChain链一致，调用时记录次数和耗时"""
+
+    def __init__(self, name: str, prompt: ChatPromptTemplate, chain, registry: "PromptRegistry"):
+        self.name = name
+        self.prompt = prompt
+        self.chain = chain
+        self._registry = registry
+
+    def _with_callbacks(self, config):
+        """在继承的回调之上加入注册表的回调
+
+        在智能体图中调用时，继承的回调管理器还包含astream_events等调用方的回调，
+        不能用链上绑定的回调替换；图的配置中已有的回调不重复加入。
+        """
+        callbacks = self._registry.callbacks
+        if not callbacks:
+            return config
+        config = ensure_config(config)
+        inherited = config.get("callbacks")
+        handlers = inherited.handlers if isinstance(inherited, BaseCallbackManager) else (inherited or [])
+        missing = [callback for callback in callbacks if callback not in handlers]
+        return merge_configs(config, {"callbacks": missing}) if missing else config
+
+    def invoke(self, inputs: Dict[str, Any], config=None):
+        start_time = time.perf_counter()
+        try:
+            result = self.chain.invoke(inputs, self._with_callbacks(config))
+        except Exception:
+            self._registry.record(self.name, time.perf_counter() - start_time, False)
+            raise
+        self._registry.record(self.name, time.perf_counter() - start_time, True)
+        return result
+
+    async def ainvoke(self, inputs: Dict[str, Any], config=None):
+        start_time = time.perf_counter()
+        try:
+            result = await self.chain.ainvoke(inputs, self._with_callbacks(config))
+        except Exception:
+            self._registry.record(self.name, time.perf_counter() - start_time, False)
+            raise
+        self._registry.record(self.name, time.perf_counter() - start_time, True)
+        return result
+
+    def batch(self, inputs: List[Dict[str, Any]], config=None, return_exceptions=False):
+        """批量调用，各输入并发执行（并发数由config的max_concurrency限制），每个输入按整批耗时记录一次"""
+        start_time = time.perf_counter()
+        try:
+            results = self.chain.batch(inputs, self._with_callbacks(config), return_exceptions=return_exceptions)
+        except Exception:
+            self._registry.record(self.name, time.perf_counter() - start_time, False)
+            raise
+        self._record_batch(results, time.perf_counter() - start_time)
+        return results
+
+    async def abatch(self, inputs: List[Dict[str, Any]], config=None, return_exceptions=False):
+        start_time = time.perf_counter()
+        try:
+            results = await self.chain.abatch(inputs, self._with_callbacks(config), return_exceptions=return_exceptions)
+        except Exception:
+            self._registry.record(self.name, time.perf_counter() - start_time, False)
+            raise
+        self._record_batch(results, time.perf_counter() - start_time)
+        return results
+
+    def _record_batch(self, results, elapsed: float):
+        for result in results:
+            self._registry.record(self.name, elapsed, not isinstance(result, Exception))
+
+    async def astream(self, inputs: Dict[str, Any], config=None):
+        """流式调用，耗时记录到最后一个片段生成为止"""
+        start_time = time.perf_counter()
+        try:
+            async for chunk in self.chain.astream(inputs, self._with_callbacks(config)):
+                yield chunk
+        except Exception:
+            self._registry.record(self.name, time.perf_counter() - start_time, False)
+            raise
+        self._registry.record(self.name, time.perf_counter() - start_time, True)
+
+
+class PromptRegistry:
+    """提示链注册表
+
+    每个智能体实例持有一个注册表，提示模板和"提示 | 模型 | 解析器"链在初始化时编译一次，
+    调用时不再重复构建。提示统一采用"固定的系统消息在前、可变内容在后"的布局，
+    使同一条链的每次请求共享相同的前缀，便于服务端的提示缓存和Ollama/vLLM的前缀缓存命中。
+    """
+
+    def __init__(self, owner: str = "", callbacks=None):
+        self.owner = owner
+        # 绑定到每条链的回调（如分阶段计时），链在智能体图之外单独调用时同样生效
+        self.callbacks = callbacks
+        self._chains: Dict[str, CompiledChain] = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def register(self, name: str, prompt: ChatPromptTemplate, llm, parser=None) -> Optional[CompiledChain]:
+        """编译并注册一条提示链，模型不可用时返回None"""
+        if llm is None:
+            return None
+
+        if not self._has_stable_prefix(prompt):
+            warning(f"提示链 {name} 的开头不是固定的系统消息，无法命中前缀缓存")
+
+        if llm_hedger.applies_to(self.owner):
+            llm = llm_hedger.wrap(llm, f"{self.owner}.{name}")
+
+        chain = prompt | llm
+        if parser is not None:
+            chain = chain | parser
+        # 提示链名称写入元数据，模型调用的回调据此区分生成类型；注册表的回调在调用时合并
+        chain = chain.with_config(metadata={"prompt_name": name})
+
+        compiled = CompiledChain(name, prompt, chain, self)
+        with self._lock:
+            self._chains[name] = compiled
+            self._stats.setdefault(name, {"count": 0, "errors": 0, "total_latency": 0.0, "max_latency": 0.0})
+        debug(f"已注册提示链: {self.owner}.{name}")
+        return compiled
+
+    def get(self, name: str) -> Optional[CompiledChain]:
+        return self._chains.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._chains
+
+    @staticmethod
+    def _has_stable_prefix(prompt: ChatPromptTemplate) -> bool:
+        """检查提示的第一条消息是否为固定的系统消息，变量（如会话摘要）只能追加在固定文本之后"""
+        messages = getattr(prompt, "messages", None)
+        if not messages:
+            return False
+        first = messages[0]
+        if not isinstance(first, SystemMessagePromptTemplate):
+            return False
+        if not first.input_variables:
+            return True
+        return bool(STABLE_PREFIX_TEMPLATE.fullmatch(getattr(first.prompt, "template", "")))
+
+    def record(self, name: str, elapsed: float, success: bool):
+        with self._lock:
+            chain_stats = self._stats.setdefault(name, {
+                "count": 0,
+                "errors": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0
+            })
+            chain_stats["count"] += 1
+            chain_stats["total_latency"] += elapsed
+            chain_stats["max_latency"] = max(chain_stats["max_latency"], elapsed)
+            if not success:
+                chain_stats["errors"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各提示链的调用次数、错误次数和平均/最大耗时"""
+        with self._lock:
+            stats = {}
+            for name, chain_stats in self._stats.items():
+                count = chain_stats["count"]
+                stats[name] = {
+                    "count": count,
+                    "errors": chain_stats["errors"],
+                    "avg_latency_ms": round(chain_stats["total_latency"] / count * 1000, 2) if count else 0.0,
+                    "max_latency_ms": round(chain_stats["max_latency"] * 1000, 2)
+                }
+            return stats
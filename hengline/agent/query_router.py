@@ -0,0 +1,135 @@
+"""@FileName: query_router.py
+@Description: 基于规则的查询路由器，简单知识类问题走"检索+单次生成"快速路径，复杂问题走智能体循环
+@Author: HengLine
+@Time: 2025/10/9 16:20
+"""
+import os
+import re
+import sys
+import threading
+from typing import Dict, Any, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug
+
+from hengline.tools.medical_tools import MedicalTools
+from hengline.tools.query_normalizer import query_normalizer
+
+
+class RouteDecision:
+    """路由决策结果"""
+
+    def __init__(self, path: str, reason: str, score: Optional[float] = None):
+        self.path = path
+        self.reason = reason
+        self.score = score
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"path": self.path, "reason": self.reason, "score": self.score}
+
+
+class QueryRouter:
+    """查询预路由器
+
+    只使用廉价信号（问题句式、症状提取结果、问题长度、检索得分）做判断，
+    不调用语言模型。满足条件的简单知识问题直接检索后一次生成作答，
+    其余问题保留ReAct/StateGraph智能体循环。
+    """
+
+    PATH_FAST = "fast"
+    PATH_AGENT = "agent"
+
+    # 预编译的问题句式：定义、症状、病因、预防等知识类问法
+    _knowledge_question_regex = re.compile(
+        r'^(什么是|何为|啥是|请问什么是|介绍一下|简单介绍)'
+        r'|(是什么|是啥|是什么病|的定义|的概念|有哪些症状|有什么症状|的症状|的病因|的原因|怎么引起的'
+        r'|如何预防|怎么预防|怎样预防|的预防|有哪些危害|的危害|注意事项|需要注意什么|的治疗方法|怎么治疗)'
+    )
+
+    # 预编译的复杂信号：时效性信息、个人病情描述、用药剂量、比较类问题
+    _complex_question_regex = re.compile(
+        r'最新|研究进展|新闻|今年|近期|指南更新'
+        r'|我[的们]?|孩子|宝宝|家人|老公|老婆|妈妈|爸爸|父亲|母亲'
+        r'|吃了|服用|剂量|用量|能不能一起'
+        r'|区别|比较|哪个好|关系'
+    )
+
+    def __init__(self, router_config: Dict[str, Any] = None):
+        router_config = router_config or {}
+        self.enabled = router_config.get("enabled", True)
+        self.max_question_length = router_config.get("max_question_length", 60)
+        self.min_retrieval_score = router_config.get("fast_path_min_score", 0.5)
+
+        # 路由统计
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def route(self, question: str) -> RouteDecision:
+        """根据廉价信号对问题做预路由"""
+        if not self.enabled:
+            return RouteDecision(self.PATH_AGENT, "router_disabled")
+
+        # 在规范化后的问题上判断，繁体、全角和多余空白不影响句式匹配
+        question = query_normalizer.normalize(question)
+
+        if len(question) > self.max_question_length:
+            return RouteDecision(self.PATH_AGENT, "question_too_long")
+
+        # 多个问题需要智能体拆解
+        if question.count("?") > 2:
+            return RouteDecision(self.PATH_AGENT, "multiple_questions")
+
+        if self._complex_question_regex.search(question):
+            return RouteDecision(self.PATH_AGENT, "complex_signal")
+
+        # 出现多个症状通常是病情描述，需要提取和评估工具
+        if len(MedicalTools.extract_symptoms(question)) > 1:
+            return RouteDecision(self.PATH_AGENT, "symptom_description")
+
+        if not self._knowledge_question_regex.search(question):
+            return RouteDecision(self.PATH_AGENT, "no_knowledge_pattern")
+
+        return RouteDecision(self.PATH_FAST, "knowledge_question")
+
+    def confirm(self, decision: RouteDecision, top_score: Optional[float]) -> RouteDecision:
+        """根据检索得分确认快速路径，得分不足时回退到智能体循环"""
+        if decision.path != self.PATH_FAST:
+            return decision
+
+        if top_score is None or top_score < self.min_retrieval_score:
+            return RouteDecision(self.PATH_AGENT, "low_retrieval_score", top_score)
+
+        return RouteDecision(self.PATH_FAST, decision.reason, top_score)
+
+    def record(self, decision: RouteDecision, elapsed: float):
+        """记录一次路由决策及该路径的耗时（秒）"""
+        with self._lock:
+            path_stats = self._stats.setdefault(decision.path, {
+                "count": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+                "reasons": {}
+            })
+            path_stats["count"] += 1
+            path_stats["total_latency"] += elapsed
+            path_stats["max_latency"] = max(path_stats["max_latency"], elapsed)
+            path_stats["reasons"][decision.reason] = path_stats["reasons"].get(decision.reason, 0) + 1
+
+        debug(f"路由决策: {decision.path} ({decision.reason}), 耗时 {elapsed * 1000:.1f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各路径的请求数和平均/最大耗时"""
+        with self._lock:
+            stats = {}
+            for path, path_stats in self._stats.items():
+                count = path_stats["count"]
+                stats[path] = {
+                    "count": count,
+                    "avg_latency_ms": round(path_stats["total_latency"] / count * 1000, 2) if count else 0.0,
+                    "max_latency_ms": round(path_stats["max_latency"] * 1000, 2),
+                    "reasons": dict(path_stats["reasons"])
+                }
+            return stats
@@ -0,0 +1,48 @@
+"""@FileName: request_context.py
+@Description: 请求上下文，基于contextvars在一次API请求内传递附加信息（预算消耗等）
+@Author: HengLine
+@Time: 2025/10/10 11:20
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+
+class RequestContext:
+    """单次请求的上下文，智能体在处理过程中写入，API层在构建响应时读取"""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.data: Dict[str, Any] = {}
+
+    def set(self, key: str, value: Any):
+        self.data[key] = value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+
+_current_context: ContextVar[Optional[RequestContext]] = ContextVar("hengline_request_context", default=None)
+
+
+@contextmanager
+def request_scope(request_id: Optional[str] = None):
+    """开启一个请求上下文，退出时恢复之前的上下文"""
+    context = RequestContext(request_id)
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+def get_request_context() -> Optional[RequestContext]:
+    """获取当前请求上下文，不在请求范围内时返回None"""
+    return _current_context.get()
+
+
+def set_request_value(key: str, value: Any):
+    """向当前请求上下文写入一个值，不在请求范围内时忽略"""
+    context = _current_context.get()
+    if context is not None:
+        context.set(key, value)
@@ -0,0 +1,127 @@
+"""@FileName: retrieval_prefetch.py
+@Description: 知识库检索预取，问题进入智能体循环时即在后台检索，与第一轮模型推理并发执行
+@Author: HengLine
+@Time: 2025/10/12 09:30
+"""
+import asyncio
+import os
+import re
+import sys
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug, warning
+from hengline.tools.query_normalizer import query_normalizer
+
+
+class RetrievalPrefetch:
+    """单次请求的预取任务，通过LangGraph的configurable传给知识库工具"""
+
+    def __init__(self, prefetcher: "RetrievalPrefetcher", question: str, task: asyncio.Task):
+        self.prefetcher = prefetcher
+        self.question = question
+        self.task = task
+        self.hits = 0
+
+    async def aget(self, query: str) -> Optional[List[Tuple[Any, float]]]:
+        """工具查询与预取的问题足够相似时返回预取的检索结果，否则返回None"""
+        coverage = self.prefetcher.coverage(query, self.question)
+        if coverage < self.prefetcher.min_coverage:
+            self.prefetcher.count("misses")
+            debug(f"检索预取未命中: 查询 '{query}' 与问题的重合度 {coverage:.2f}")
+            return None
+
+        try:
+            # shield保证工具调用超时被取消时，预取任务仍可供后续调用使用
+            docs_and_scores = await asyncio.shield(self.task)
+        except asyncio.CancelledError:
+            if self.task.cancelled():
+                return None
+            raise
+        except Exception as e:
+            self.prefetcher.count("errors")
+            warning(f"检索预取失败，改为实时检索: {str(e)}")
+            return None
+
+        self.hits += 1
+        self.prefetcher.count("hits")
+        return docs_and_scores
+
+
+class RetrievalPrefetcher:
+    """知识库检索预取器
+
+    ReAct流程中模型要先完成一轮推理决定调用知识库工具，之后才开始检索。
+    预取器在问题进入智能体循环时立即以原问题在后台检索，
+    模型随后以相近的查询调用知识库工具时直接使用预取结果，省去检索等待。
+    相似度按工具查询的字符二元组被原问题覆盖的比例计算。
+    """
+
+    def __init__(self, retrieve: Callable[[str], Awaitable[List[Tuple[Any, float]]]],
+                 prefetch_config: Dict[str, Any] = None):
+        prefetch_config = prefetch_config or {}
+        self.retrieve = retrieve
+        self.enabled = prefetch_config.get("enabled", True) and retrieve is not None
+        self.min_coverage = prefetch_config.get("min_coverage", 0.6)
+
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "used": 0, "unused": 0, "hits": 0, "misses": 0, "errors": 0}
+
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        """规范化并去除空白和标点后的字符二元组"""
+        text = re.sub(r"[\s\W_]+", "", query_normalizer.normalize(text))
+        if len(text) < 2:
+            return {text} if text else set()
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def coverage(self, query: str, question: str) -> float:
+        """工具查询的二元组中出现在原问题里的比例"""
+        query_bigrams = self._bigrams(query)
+        if not query_bigrams:
+            return 0.0
+        return len(query_bigrams & self._bigrams(question)) / len(query_bigrams)
+
+    def start(self, question: str) -> Optional[RetrievalPrefetch]:
+        """在后台开始检索问题，需在事件循环中调用"""
+        if not self.enabled or not question:
+            return None
+
+        task = asyncio.ensure_future(self.retrieve(question))
+        self.count("started")
+        return RetrievalPrefetch(self, question, task)
+
+    def finish(self, prefetch: Optional[RetrievalPrefetch]):
+        """请求结束时记录预取是否被使用，并取消尚未完成的检索"""
+        if prefetch is None:
+            return
+
+        self.count("used" if prefetch.hits else "unused")
+        if not prefetch.task.done():
+            prefetch.task.cancel()
+        elif not prefetch.task.cancelled() and prefetch.task.exception() is not None:
+            # 预取失败且没有被使用时，避免"exception was never retrieved"警告
+            debug(f"检索预取失败: {str(prefetch.task.exception())}")
+
+    def count(self, field: str):
+        with self._lock:
+            self._stats[field] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预取次数、命中次数和命中率"""
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats["used"] + stats["unused"]
+        stats["hit_rate"] = round(stats["used"] / finished, 4) if finished else 0.0
+        return stats
+
+
+def get_retrieval_prefetch(config) -> Optional[RetrievalPrefetch]:
+    """从工具调用的config中取出本次请求的预取任务"""
+    if not config:
+        return None
+    return (config.get("configurable") or {}).get("retrieval_prefetch")
@@ -0,0 +1,347 @@
+"""@FileName: session_manager.py
+@Description: 会话管理，基于LangGraph检查点保存多轮对话，历史超过轮数上限时滚动压缩为摘要
+@Author: HengLine
+@Time: 2025/10/11 10:15
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langgraph.checkpoint.memory import MemorySaver
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import info, warning, debug
+from hengline.config import config_reader
+
+# 历史摘要提示模板，系统消息不含变量以便各会话共享前缀
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "你负责压缩医疗咨询对话的历史记录。请将已有摘要和新的对话内容合并为一段简洁的摘要，"
+               "保留用户的症状、病史、用药、过敏史以及已经给出的主要建议。"),
+    ("human", "已有摘要:\n{summary}\n\n新的对话内容:\n{transcript}\n\n摘要不超过{max_chars}字。")
+])
+
+
+class BoundedMemorySaver(MemorySaver):
+    """只保留每个会话最近若干个检查点的内存检查点
+
+    MemorySaver为图的每一步都保存一个检查点并永久保留，会话历史和中间状态随对话轮数不断累积。
+    会话只需要从最新检查点继续，每次保存后删除更早的检查点及其写入记录和不再被引用的通道值。
+    """
+
+    def __init__(self, max_checkpoints: int = 2):
+        super().__init__()
+        self.max_checkpoints = max(1, max_checkpoints)
+        self._lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            self._prune(next_config["configurable"]["thread_id"], next_config["configurable"]["checkpoint_ns"])
+        return next_config
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            super().delete_thread(thread_id)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.max_checkpoints:
+            return
+
+        # 检查点ID按时间递增，与MemorySaver取最新检查点的方式一致
+        expired_ids = sorted(checkpoints)[:-self.max_checkpoints]
+        expired_versions = set()
+        for checkpoint_id in expired_ids:
+            saved, _, _ = checkpoints.pop(checkpoint_id)
+            expired_versions.update(self.serde.loads_typed(saved)["channel_versions"].items())
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        kept_versions = set()
+        for saved, _, _ in checkpoints.values():
+            kept_versions.update(self.serde.loads_typed(saved)["channel_versions"].items())
+        for channel, version in expired_versions - kept_versions:
+            self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+
+
+class SessionManager:
+    """会话管理器
+
+    以session_id作为LangGraph的thread_id，由检查点（内存或SQLite）保存每个会话的消息。
+    每次调用开始时检查历史：最近max_turns轮对话原样保留，更早的对话合并进滚动摘要并从状态中移除，
+    使提示长度不随对话轮数增长。会话数量按最近使用顺序限制在max_sessions以内，
+    超过ttl_seconds未使用的会话被删除（SQLite中之前运行保存的会话在启动时恢复使用时间，同样过期），
+    内存检查点只保留每个会话最近的检查点。
+    """
+
+    def __init__(self, session_config: Dict[str, Any] = None):
+        session_config = session_config or {}
+        self.enabled = session_config.get("enabled", True)
+        self.backend = session_config.get("backend", "memory")
+        self.sqlite_path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+            session_config.get("sqlite_path", "cache/sessions.db")
+        )
+        self.max_turns = max(1, session_config.get("max_turns", 4))
+        self.summary_max_chars = session_config.get("summary_max_chars", 500)
+        # 会话数量上限和空闲过期时间，0表示不限制
+        self.max_sessions = session_config.get("max_sessions", 1000)
+        self.ttl_seconds = session_config.get("ttl_seconds", 3600)
+        self.max_checkpoints = session_config.get("max_checkpoints", 2)
+
+        # 检查点在首次使用时创建；SQLite的异步检查点绑定事件循环，单独创建
+        self._checkpointer = None
+        self._async_checkpointer = None
+        self._async_loop = None
+        # 创建异步检查点的锁，asyncio.Lock绑定事件循环，随事件循环一起更换
+        self._async_lock = None
+        self._async_lock_loop = None
+        self._lock = threading.Lock()
+        # session_id -> 最近使用时间，按使用顺序排列
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    @property
+    def checkpointer(self):
+        """同步检查点"""
+        if self._checkpointer is None:
+            with self._lock:
+                if self._checkpointer is None:
+                    self._checkpointer = self._create_checkpointer()
+        return self._checkpointer
+
+    def _create_checkpointer(self):
+        if self.backend == "sqlite":
+            try:
+                from langgraph.checkpoint.sqlite import SqliteSaver
+
+                os.makedirs(os.path.dirname(self.sqlite_path), exist_ok=True)
+                connection = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+                info(f"会话将保存到SQLite: {self.sqlite_path}")
+                checkpointer = SqliteSaver(connection)
+                self._restore_sessions(checkpointer)
+                return checkpointer
+            except ImportError:
+                warning("未安装langgraph-checkpoint-sqlite，会话将保存在内存中")
+                self.backend = "memory"
+
+        return BoundedMemorySaver(self.max_checkpoints)
+
+    async def aget_checkpointer(self):
+        """异步检查点：内存检查点与同步共用，SQLite使用基于aiosqlite的异步实现
+
+        aiosqlite连接绑定创建时的事件循环，事件循环变化时重新创建。
+        """
+        checkpointer = self.checkpointer
+        if self.backend != "sqlite":
+            return checkpointer
+
+        loop = asyncio.get_running_loop()
+        if self._async_checkpointer is not None and self._async_loop is loop:
+            return self._async_checkpointer
+
+        with self._lock:
+            if self._async_lock is None or self._async_lock_loop is not loop:
+                self._async_lock = asyncio.Lock()
+                self._async_lock_loop = loop
+            async_lock = self._async_lock
+
+        async with async_lock:
+            # 等待锁期间其他请求可能已创建好连接
+            if self._async_checkpointer is None or self._async_loop is not loop:
+                import aiosqlite
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+                self._stop_async_connection()
+                connection = await aiosqlite.connect(self.sqlite_path)
+                self._async_checkpointer = AsyncSqliteSaver(connection)
+                self._async_loop = loop
+            return self._async_checkpointer
+
+    def _stop_async_connection(self):
+        """停止已失效事件循环上的aiosqlite连接线程"""
+        if self._async_checkpointer is not None:
+            stop = getattr(self._async_checkpointer.conn, "stop", None)
+            if stop:
+                stop()
+            self._async_checkpointer = None
+
+    async def aclose(self):
+        """关闭异步检查点的数据库连接，应在服务停止时调用"""
+        if self._async_checkpointer is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_checkpointer.conn.close()
+            self._async_checkpointer = None
+        self._stop_async_connection()
+
+    @staticmethod
+    def thread_config(session_id: str) -> Dict[str, Any]:
+        return {"thread_id": session_id}
+
+    def touch(self, session_id: str):
+        """记录会话的使用时间，删除超出数量上限的最久未使用会话和空闲超时的会话"""
+        with self._sessions_lock:
+            self._last_used[session_id] = time.time()
+            self._last_used.move_to_end(session_id)
+            expired = self._collect_expired()
+        self._delete_threads(self.checkpointer, expired)
+
+    def _collect_expired(self) -> List[str]:
+        """从使用记录中移除超出数量上限和空闲超时的会话并返回其session_id，调用方需持有_sessions_lock"""
+        now = time.time()
+        expired = []
+        while self.max_sessions and len(self._last_used) > self.max_sessions:
+            expired.append(self._last_used.popitem(last=False)[0])
+        while self.ttl_seconds and self._last_used:
+            oldest_id, last_used = next(iter(self._last_used.items()))
+            if now - last_used <= self.ttl_seconds:
+                break
+            expired.append(oldest_id)
+            del self._last_used[oldest_id]
+        return expired
+
+    @staticmethod
+    def _delete_threads(checkpointer, expired: List[str]):
+        for expired_id in expired:
+            checkpointer.delete_thread(expired_id)
+        if expired:
+            debug(f"已清理过期会话: {len(expired)} 个")
+
+    def _restore_sessions(self, checkpointer):
+        """恢复SQLite中之前运行保存的会话，以最新检查点的时间作为最近使用时间
+
+        之前运行的会话同样受数量上限和空闲过期时间约束，启动时即清理已过期的会话。
+        """
+        try:
+            with checkpointer.cursor(transaction=False) as cursor:
+                cursor.execute("SELECT DISTINCT thread_id FROM checkpoints")
+                thread_ids = [row[0] for row in cursor.fetchall()]
+
+            sessions = []
+            for thread_id in thread_ids:
+                checkpoint_tuple = checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+                if checkpoint_tuple is not None:
+                    last_used = datetime.fromisoformat(checkpoint_tuple.checkpoint["ts"]).timestamp()
+                    sessions.append((last_used, thread_id))
+        except Exception as e:
+            warning(f"恢复SQLite中的会话失败，之前运行的会话不会过期清理: {str(e)}")
+            return
+
+        with self._sessions_lock:
+            for last_used, thread_id in sorted(sessions):
+                self._last_used[thread_id] = last_used
+                self._last_used.move_to_end(thread_id)
+            expired = self._collect_expired()
+        self._delete_threads(checkpointer, expired)
+        if sessions:
+            info(f"已恢复SQLite中的会话: {len(sessions) - len(expired)} 个，清理过期会话 {len(expired)} 个")
+
+    def delete_session(self, session_id: str):
+        """删除会话的全部历史"""
+        with self._sessions_lock:
+            self._last_used.pop(session_id, None)
+        self.checkpointer.delete_thread(session_id)
+        debug(f"已删除会话: {session_id}")
+
+    def split_history(self, messages: List[Any]):
+        """按轮次拆分历史，返回(需要压缩的旧消息, 保留的最近消息)
+
+        以用户消息为轮次边界，保证工具调用与工具结果不会被拆开。
+        """
+        turn_starts = [index for index, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        if len(turn_starts) <= self.max_turns:
+            return [], messages
+
+        cut = turn_starts[-self.max_turns]
+        return messages[:cut], messages[cut:]
+
+    def _build_transcript(self, messages: List[Any]) -> str:
+        """只保留用户问题和助手的文本回答，工具调用过程不进入摘要"""
+        lines = []
+        for message in messages:
+            content = message.content if isinstance(message.content, str) else ""
+            if not content.strip():
+                continue
+            if isinstance(message, HumanMessage):
+                lines.append(f"用户: {content[:500]}")
+            elif isinstance(message, AIMessage) and not message.tool_calls:
+                lines.append(f"助手: {content[:500]}")
+        return "\n".join(lines)
+
+    def _fallback_summary(self, summary: str, transcript: str) -> str:
+        """摘要模型不可用时，保留最近的对话文本"""
+        return f"{summary}\n{transcript}".strip()[-self.summary_max_chars:]
+
+    def compact(self, state: Dict[str, Any], chain, tracker=None) -> Dict[str, Any]:
+        """压缩超出轮数上限的历史，返回状态更新
+
+        Args:
+            state: 会话智能体的状态
+            chain: 以SUMMARY_PROMPT编译的摘要链，为None时直接截取对话文本
+            tracker: 本次请求的预算跟踪器
+        """
+        old_messages, _ = self.split_history(state["messages"])
+        if not old_messages:
+            return {}
+
+        summary = state.get("summary") or ""
+        transcript = self._build_transcript(old_messages)
+        if transcript and chain is None:
+            summary = self._fallback_summary(summary, transcript)
+        elif transcript:
+            try:
+                inputs = {"max_chars": self.summary_max_chars, "summary": summary or "无", "transcript": transcript}
+                response = chain.invoke(inputs)
+                if tracker:
+                    tracker.record_llm_response([inputs["summary"], transcript], response)
+                summary = response.content
+            except Exception as e:
+                warning(f"生成会话摘要失败: {str(e)}")
+                summary = self._fallback_summary(summary, transcript)
+
+        debug(f"会话历史压缩: 移除 {len(old_messages)} 条消息")
+        return {"summary": summary, "messages": [RemoveMessage(id=message.id) for message in old_messages]}
+
+    async def acompact(self, state: Dict[str, Any], chain, tracker=None) -> Dict[str, Any]:
+        """压缩历史的异步版本"""
+        old_messages, _ = self.split_history(state["messages"])
+        if not old_messages:
+            return {}
+
+        summary = state.get("summary") or ""
+        transcript = self._build_transcript(old_messages)
+        if transcript and chain is None:
+            summary = self._fallback_summary(summary, transcript)
+        elif transcript:
+            try:
+                inputs = {"max_chars": self.summary_max_chars, "summary": summary or "无", "transcript": transcript}
+                response = await chain.ainvoke(inputs)
+                if tracker:
+                    tracker.record_llm_response([inputs["summary"], transcript], response)
+                summary = response.content
+            except Exception as e:
+                warning(f"生成会话摘要失败: {str(e)}")
+                summary = self._fallback_summary(summary, transcript)
+
+        debug(f"会话历史压缩: 移除 {len(old_messages)} 条消息")
+        return {"summary": summary, "messages": [RemoveMessage(id=message.id) for message in old_messages]}
+
+    @staticmethod
+    def summary_prompt(state: Dict[str, Any]) -> str:
+        """会话摘要对应的提示文本，追加在智能体系统提示的末尾；没有摘要时为空"""
+        summary = state.get("summary")
+        if not summary:
+            return ""
+        return f"\n\n以下是与该用户之前对话的摘要，可作为回答的背景：\n{summary}"
+
+# 全局会话管理器，所有智能体实例共享同一个检查点
+session_manager = SessionManager(config_reader.get_module_config("session"))
@@ -0,0 +1,343 @@
+"""@FileName: tool_registry.py
+@Description: 工具注册表，每个工具声明并发上限、超时时间和是否可缓存，执行时统一限流、计时、缓存并统计调用次数、耗时和错误率
+@Author: HengLine
+@Time: 2025/10/16 10:30
+"""
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug
+from hengline.agent.metrics import TOOL_CALLS, TOOL_LATENCY
+from hengline.tools.tool_cache import ToolResultCache, tool_result_cache
+
+
+class ToolTimeoutError(Exception):
+    """工具在声明的超时时间内（包括等待并发名额的时间）没有完成"""
+
+    def __init__(self, tool_name: str, timeout: float):
+        super().__init__(f"工具 {tool_name} 执行超时（{timeout}秒）")
+        self.tool_name = tool_name
+        self.timeout = timeout
+
+
+class ConcurrencyLimiter:
+    """同一工具的并发上限，同步线程和各事件循环中的调用共用同一组名额
+
+    名额释放时直接交给最早等待的调用方（线程或协程），等待方按到达顺序获得名额。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._lock = threading.Lock()
+        # 等待方：线程为threading.Event，协程为(事件循环, Future)
+        self._waiters = deque()
+
+    def acquire(self, timeout: float = None) -> bool:
+        """同步获取名额，超时返回False"""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            event = threading.Event()
+            self._waiters.append(event)
+
+        if event.wait(timeout):
+            return True
+        with self._lock:
+            try:
+                self._waiters.remove(event)
+                return False
+            except ValueError:
+                # 超时的同时名额已交给本线程
+                return True
+
+    async def aacquire(self):
+        """异步获取名额，超时由调用方的wait_for控制"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    granted = False
+                except ValueError:
+                    granted = True
+            # 取消时名额已经交给本协程，转交给下一个等待方
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            waiter = self._waiters.popleft()
+
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._grant, future)
+
+    @staticmethod
+    def _grant(future):
+        if not future.done():
+            future.set_result(None)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class ToolSpec:
+    """工具声明：实现函数及执行约束"""
+
+    def __init__(self, name: str, description: str, func: Callable, coroutine: Optional[Callable] = None,
+                 max_concurrency: int = 4, timeout: float = 30.0, cacheable: bool = False,
+                 cache_version: Optional[Callable[[], Any]] = None, available: Optional[Callable[[], bool]] = None):
+        self.name = name
+        self.description = description
+        self.func = func
+        self.coroutine = coroutine
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cacheable = cacheable
+        # 缓存版本，如知识库索引版本，版本变化后旧的缓存结果不再命中
+        self.cache_version = cache_version
+        # 工具当前是否可用，如知识库未加载时不提供知识库查询工具
+        self.available = available
+
+
+def _accepts_config(func: Optional[Callable]) -> bool:
+    """实现函数是否声明了RunnableConfig类型的config参数"""
+    if func is None:
+        return False
+    parameter = inspect.signature(func).parameters.get("config")
+    return parameter is not None and parameter.annotation is RunnableConfig
+
+
+class ToolRegistry:
+    """智能体的工具注册表
+
+    - 每个工具注册时声明并发上限、超时时间和是否可缓存，config.json中的tool_execution可按工具覆盖；
+    - 注册后得到的工具在执行时统一获取并发名额、按超时时间结束、经工具结果缓存复用结果；
+    - 按后端在配置中启用工具，未配置的后端使用default列表，均未配置时启用全部可用工具；
+    - 记录各工具的调用次数、耗时、错误和超时，同时写入全局指标。
+    """
+
+    def __init__(self, backend: str, tool_config: Dict[str, Any] = None, cache: ToolResultCache = None,
+                 cacheable_result: Callable[[Any], bool] = None):
+        tool_config = tool_config or {}
+        self.backend = backend
+        self.default_timeout = tool_config.get("default_timeout", 30)
+        self.tool_timeouts = tool_config.get("tool_timeouts", {})
+        self.tool_concurrency = tool_config.get("tool_concurrency", {})
+        enabled_tools = tool_config.get("enabled_tools", {})
+        self.enabled_names = enabled_tools.get(backend, enabled_tools.get("default"))
+        self.cache = cache or tool_result_cache
+        self.cacheable_result = cacheable_result
+
+        self._specs: Dict[str, ToolSpec] = {}
+        self._tools: Dict[str, StructuredTool] = {}
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def register(self, name: str, description: str, func: Callable, coroutine: Optional[Callable] = None, *,
+                 max_concurrency: int = 4, timeout: float = None, cacheable: bool = False,
+                 cache_version: Optional[Callable[[], Any]] = None,
+                 available: Optional[Callable[[], bool]] = None) -> StructuredTool:
+        """注册工具并返回受注册表管理的工具，配置中的超时时间和并发上限优先于声明值"""
+        spec = ToolSpec(name, description, func, coroutine,
+                        max_concurrency=self.tool_concurrency.get(name, max_concurrency),
+                        timeout=self.tool_timeouts.get(name, timeout if timeout is not None else self.default_timeout),
+                        cacheable=cacheable, cache_version=cache_version, available=available)
+
+        self._limiters[name] = ConcurrencyLimiter(spec.max_concurrency)
+
+        # 参数模式从实现函数推断，与直接使用StructuredTool.from_function时一致
+        schema_tool = StructuredTool.from_function(func=func, coroutine=coroutine, name=name, description=description)
+        tool = StructuredTool(name=name, description=description, args_schema=schema_tool.args_schema,
+                              func=self._make_runner(spec), coroutine=self._make_async_runner(spec))
+
+        self._specs[name] = spec
+        self._tools[name] = tool
+        return tool
+
+    def is_enabled(self, name: str) -> bool:
+        spec = self._specs.get(name)
+        if spec is None:
+            return False
+        if self.enabled_names is not None and name not in self.enabled_names:
+            return False
+        return spec.available is None or bool(spec.available())
+
+    def get_tools(self) -> List[StructuredTool]:
+        """当前后端启用且可用的工具，按注册顺序排列"""
+        tools = [tool for name, tool in self._tools.items() if self.is_enabled(name)]
+        debug(f"{self.backend} 启用的工具: {[tool.name for tool in tools]}")
+        return tools
+
+    def get(self, name: str) -> Optional[StructuredTool]:
+        return self._tools.get(name) if self.is_enabled(name) else None
+
+    def get_timeout(self, name: str) -> float:
+        spec = self._specs.get(name)
+        return spec.timeout if spec else self.default_timeout
+
+    def _make_runner(self, spec: ToolSpec):
+        limiter = self._limiters[spec.name]
+
+        def run(config: RunnableConfig = None, **kwargs):
+            start_time = time.perf_counter()
+            if not limiter.acquire(spec.timeout):
+                self._record(spec.name, "timeout", time.perf_counter() - start_time)
+                raise ToolTimeoutError(spec.name, spec.timeout)
+
+            status = "error"
+            try:
+                result = self._call(spec, kwargs, config)
+                status = "success"
+                return result
+            finally:
+                limiter.release()
+                elapsed = time.perf_counter() - start_time
+                # 同步调用无法中断，超过超时时间完成时调用方已放弃等待，计为超时
+                if status == "success" and elapsed > spec.timeout:
+                    status = "timeout"
+                self._record(spec.name, status, elapsed)
+
+        return run
+
+    def _make_async_runner(self, spec: ToolSpec):
+        limiter = self._limiters[spec.name]
+
+        async def limited_call(kwargs, config):
+            await limiter.aacquire()
+            try:
+                return await self._acall(spec, kwargs, config)
+            finally:
+                limiter.release()
+
+        async def arun(config: RunnableConfig = None, **kwargs):
+            start_time = time.perf_counter()
+            status = "error"
+            try:
+                result = await asyncio.wait_for(limited_call(kwargs, config), timeout=spec.timeout)
+                status = "success"
+                return result
+            except asyncio.TimeoutError:
+                status = "timeout"
+                raise ToolTimeoutError(spec.name, spec.timeout) from None
+            except asyncio.CancelledError:
+                # 请求被取消（如客户端断开）不计入工具的错误
+                status = None
+                raise
+            finally:
+                if status is not None:
+                    self._record(spec.name, status, time.perf_counter() - start_time)
+
+        return arun
+
+    def _call(self, spec: ToolSpec, kwargs: Dict[str, Any], config):
+        def compute():
+            return self._call_sync(spec, kwargs, config)
+
+        if not spec.cacheable:
+            return compute()
+        return self.cache.get_or_compute(spec.name, kwargs, compute, version=self._cache_version(spec),
+                                         cacheable=self.cacheable_result)
+
+    async def _acall(self, spec: ToolSpec, kwargs: Dict[str, Any], config):
+        async def compute():
+            if spec.coroutine is None:
+                # 只有同步实现的工具放到线程中执行，不阻塞事件循环
+                return await asyncio.to_thread(self._call_sync, spec, kwargs, config)
+            if _accepts_config(spec.coroutine):
+                return await spec.coroutine(**kwargs, config=config)
+            return await spec.coroutine(**kwargs)
+
+        if not spec.cacheable:
+            return await compute()
+        return await self.cache.aget_or_compute(spec.name, kwargs, compute, version=self._cache_version(spec),
+                                                cacheable=self.cacheable_result)
+
+    @staticmethod
+    def _call_sync(spec: ToolSpec, kwargs: Dict[str, Any], config):
+        return spec.func(**kwargs, config=config) if _accepts_config(spec.func) else spec.func(**kwargs)
+
+    @staticmethod
+    def _cache_version(spec: ToolSpec) -> Optional[str]:
+        if spec.cache_version is None:
+            return None
+        version = spec.cache_version() if callable(spec.cache_version) else spec.cache_version
+        return None if version is None else str(version)
+
+    def _record(self, tool_name: str, status: str, elapsed: float):
+        TOOL_CALLS.inc(tool=tool_name, backend=self.backend, status=status)
+        TOOL_LATENCY.observe(elapsed, tool=tool_name, backend=self.backend)
+
+        with self._lock:
+            tool_stats = self._stats.setdefault(tool_name, {
+                "count": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0
+            })
+            tool_stats["count"] += 1
+            tool_stats["total_latency"] += elapsed
+            tool_stats["max_latency"] = max(tool_stats["max_latency"], elapsed)
+            if status == "error":
+                tool_stats["errors"] += 1
+            elif status == "timeout":
+                tool_stats["timeouts"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各工具的声明约束、当前并发、调用次数、错误率和平均/最大耗时"""
+        with self._lock:
+            stats = {}
+            for name, spec in self._specs.items():
+                tool_stats = self._stats.get(name, {})
+                count = tool_stats.get("count", 0)
+                failures = tool_stats.get("errors", 0) + tool_stats.get("timeouts", 0)
+                limiter = self._limiters[name]
+                stats[name] = {
+                    "enabled": self.is_enabled(name),
+                    "max_concurrency": limiter.limit,
+                    "timeout": spec.timeout,
+                    "cacheable": spec.cacheable,
+                    "in_flight": limiter.active,
+                    "waiting": limiter.waiting,
+                    "count": count,
+                    "errors": tool_stats.get("errors", 0),
+                    "timeouts": tool_stats.get("timeouts", 0),
+                    "error_rate": round(failures / count, 4) if count else 0.0,
+                    "avg_latency_ms": round(tool_stats["total_latency"] / count * 1000, 2) if count else 0.0,
+                    "max_latency_ms": round(tool_stats.get("max_latency", 0.0) * 1000, 2)
+                }
+            return stats
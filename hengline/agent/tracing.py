@@ -0,0 +1,268 @@
+"""@FileName: tracing.py
+@Description: 请求分阶段计时，通过计时上下文管理器和LangChain回调记录嵌入、检索、图节点、工具和模型调用的耗时
+@Author: HengLine
+@Time: 2025/10/13 21:10
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from hengline.agent.metrics import (STAGE_LATENCY, STAGE_ERRORS, LLM_TTFT, LLM_LATENCY, LLM_ERRORS, LLM_TOKENS)
+from hengline.agent.request_context import get_request_context
+from hengline.agent.usage_accounting import extract_token_usage, usage_accountant
+
+
+class RequestTimings:
+    """单次请求的分阶段耗时，保存在请求上下文中，请求方需要时随响应返回"""
+
+    # 单次请求最多保留的阶段记录数，避免异常的长循环占用过多内存
+    MAX_SPANS = 500
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start_time: float, duration: float, **attributes):
+        span = {
+            "stage": stage,
+            "start_ms": round((start_time - self.start_time) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2)
+        }
+        span.update({key: value for key, value in attributes.items() if value is not None})
+        with self._lock:
+            if len(self.spans) < self.MAX_SPANS:
+                self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """按阶段汇总次数、总耗时和最大耗时，并附带按开始时间排序的明细"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+
+        stages = {}
+        for span in spans:
+            stage_stats = stages.setdefault(span["stage"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stage_stats["count"] += 1
+            stage_stats["total_ms"] = round(stage_stats["total_ms"] + span["duration_ms"], 2)
+            stage_stats["max_ms"] = max(stage_stats["max_ms"], span["duration_ms"])
+
+        return {
+            "total_ms": round((time.perf_counter() - self.start_time) * 1000, 2),
+            "stages": stages,
+            "spans": spans
+        }
+
+
+def get_request_timings() -> Optional[RequestTimings]:
+    """获取当前请求的耗时记录，不在请求范围内时返回None"""
+    context = get_request_context()
+    if context is None:
+        return None
+
+    timings = context.get("timings")
+    if timings is None:
+        timings = RequestTimings()
+        context.set("timings", timings)
+    return timings
+
+
+def record_stage(stage: str, start_time: float, duration: float, backend: str = None, success: bool = True,
+                 **attributes):
+    """记录一个阶段的耗时到全局指标和当前请求"""
+    STAGE_LATENCY.observe(duration, stage=stage, backend=backend or "")
+    if not success:
+        STAGE_ERRORS.inc(stage=stage, backend=backend or "")
+
+    timings = get_request_timings()
+    if timings is not None:
+        timings.add(stage, start_time, duration, backend=backend, error=None if success else True, **attributes)
+
+
+@contextmanager
+def stage(name: str, backend: str = None, **attributes):
+    """阶段计时上下文管理器，同步和异步代码中均可使用
+
+    Example:
+        with stage("retrieval", backend="qwen"):
+            docs = await retriever.aretrieve(queries)
+    """
+    start_time = time.perf_counter()
+    success = False
+    try:
+        yield
+        success = True
+    finally:
+        record_stage(name, start_time, time.perf_counter() - start_time, backend, success, **attributes)
+
+
+class TimedEmbeddings(Embeddings):
+    """记录嵌入耗时的嵌入模型包装，查询嵌入和文档嵌入分别计为embedding:query和embedding:documents"""
+
+    def __init__(self, embeddings: Embeddings, backend: str = None):
+        self.embeddings = embeddings
+        self.backend = backend
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with stage("embedding:documents", self.backend, count=len(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with stage("embedding:query", self.backend):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        with stage("embedding:documents", self.backend, count=len(texts)):
+            return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with stage("embedding:query", self.backend):
+            return await self.embeddings.aembed_query(text)
+
+    def __getattr__(self, name):
+        # 其余属性（如model_name）沿用被包装的嵌入模型
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """记录LangGraph节点、工具和模型调用耗时的回调
+
+    每个智能体持有一个实例，通过调用配置的callbacks传入图和提示链。
+    模型调用记录首token耗时（仅流式调用）、总耗时和输入/输出token数，
+    token数同时交给用量核算，并通过on_usage回调交给智能体累计。
+    """
+
+    # 在调用方的线程或事件循环中直接执行，不切换到线程池
+    run_inline = True
+
+    def __init__(self, backend: str, on_usage=None):
+        self.backend = backend
+        self.on_usage = on_usage
+        # run_id -> (阶段名, 开始时间, 附加信息)
+        self._runs: Dict[Any, list] = {}
+        self._lock = threading.Lock()
+
+    # ---------- 模型调用 ----------
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start_llm(run_id, serialized, metadata, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start_llm(run_id, serialized, metadata, kwargs)
+
+    def _start_llm(self, run_id, serialized, metadata, kwargs):
+        invocation_params = kwargs.get("invocation_params") or {}
+        model = ((metadata or {}).get("ls_model_name") or invocation_params.get("model")
+                 or invocation_params.get("model_name") or (serialized or {}).get("name") or "")
+        # 生成类型：提示链的名称，图节点中直接调用模型时为节点名
+        generation_type = (metadata or {}).get("prompt_name") or (metadata or {}).get("langgraph_node") or "llm"
+        with self._lock:
+            self._runs[run_id] = ["llm", time.perf_counter(),
+                                  {"model": model, "ttft": None, "generation_type": generation_type}]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or run[2]["ttft"] is not None:
+                return
+            run[2]["ttft"] = time.perf_counter() - run[1]
+        LLM_TTFT.observe(run[2]["ttft"], backend=self.backend, model=run[2]["model"])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._pop(run_id)
+        if run is None:
+            return
+
+        _, start_time, info = run
+        duration = time.perf_counter() - start_time
+        usage = extract_token_usage(response)
+        input_tokens, output_tokens = usage["input_tokens"], usage["output_tokens"]
+        LLM_LATENCY.observe(duration, backend=self.backend, model=info["model"])
+        if input_tokens or output_tokens:
+            LLM_TOKENS.inc(input_tokens, backend=self.backend, model=info["model"], direction="input")
+            LLM_TOKENS.inc(output_tokens, backend=self.backend, model=info["model"], direction="output")
+
+        # 生成耗时优先取服务端统计（Ollama），其次为流式调用首token之后的耗时，否则为整个调用的耗时
+        generation_seconds = usage["generation_seconds"]
+        if generation_seconds is None:
+            generation_seconds = duration - info["ttft"] if info["ttft"] is not None else duration
+        usage_accountant.record(self.backend, info["model"], info["generation_type"], input_tokens, output_tokens,
+                                generation_seconds)
+        if self.on_usage is not None:
+            self.on_usage(input_tokens, output_tokens)
+
+        timings = get_request_timings()
+        if timings is not None:
+            timings.add("llm", start_time, duration, backend=self.backend, model=info["model"] or None,
+                        ttft_ms=round(info["ttft"] * 1000, 2) if info["ttft"] is not None else None,
+                        input_tokens=input_tokens or None, output_tokens=output_tokens or None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._pop(run_id)
+        if run is None:
+            return
+
+        _, start_time, info = run
+        duration = time.perf_counter() - start_time
+        # 被取消的调用（如对冲请求中落后的一方、客户端断开）不计为错误
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit, KeyboardInterrupt)):
+            return
+        LLM_ERRORS.inc(backend=self.backend, model=info["model"])
+        LLM_LATENCY.observe(duration, backend=self.backend, model=info["model"])
+        timings = get_request_timings()
+        if timings is not None:
+            timings.add("llm", start_time, duration, backend=self.backend, model=info["model"] or None, error=True)
+
+    # ---------- 工具调用 ----------
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        with self._lock:
+            self._runs[run_id] = [f"tool:{name}", time.perf_counter(), None]
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._finish(run_id, True)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, False)
+
+    # ---------- LangGraph节点 ----------
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        # 只记录节点本身的运行，节点内部的子链带有相同的langgraph_node元数据但名称不同
+        node = (metadata or {}).get("langgraph_node")
+        if not node or kwargs.get("name") != node:
+            return
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+            if parent is not None and parent[0] == f"node:{node}":
+                return
+            self._runs[run_id] = [f"node:{node}", time.perf_counter(), None]
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id, True)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, False)
+
+    def _pop(self, run_id):
+        with self._lock:
+            return self._runs.pop(run_id, None)
+
+    def _finish(self, run_id, success: bool):
+        run = self._pop(run_id)
+        if run is None:
+            return
+        stage_name, start_time, _ = run
+        record_stage(stage_name, start_time, time.perf_counter() - start_time, self.backend, success)
@@ -0,0 +1,204 @@
+"""@FileName: usage_accounting.py
+@Description: token用量核算，从各模型服务返回的用量信息中读取输入/输出token数，按请求、接口、后端、模型和生成类型汇总，并计算生成速度和估算费用
+@Author: HengLine
+@Time: 2025/10/17 17:40
+"""
+import os
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from hengline.config import config_reader
+from hengline.agent.metrics import LLM_COST
+from hengline.agent.request_context import get_request_context
+
+# 不在API请求范围内的模型调用（启动预热、后台任务等）归入的接口名
+INTERNAL_ENDPOINT = "internal"
+
+
+def extract_token_usage(response) -> Dict[str, Any]:
+    """从模型调用结果（LLMResult）中读取输入和输出token数
+
+    各模型服务返回用量的位置和字段名不同：
+    - ChatOpenAI（含vLLM服务）和ChatOllama：消息的usage_metadata（input_tokens、output_tokens）
+    - ChatTongyi：消息的response_metadata或generation_info中的token_usage，字段为input_tokens、output_tokens
+    - 其他OpenAI兼容模型：llm_output中的token_usage，字段为prompt_tokens、completion_tokens
+    Ollama另外返回eval_duration（纳秒），即服务端实际生成输出token的耗时，用于计算生成速度。
+
+    Returns:
+        dict: input_tokens、output_tokens，以及服务端提供时的generation_seconds
+    """
+    usage = {"input_tokens": 0, "output_tokens": 0, "generation_seconds": None}
+    try:
+        generation = response.generations[0][0]
+    except (AttributeError, IndexError, TypeError):
+        generation = None
+
+    message = getattr(generation, "message", None)
+    metadata = {}
+    metadata.update(getattr(generation, "generation_info", None) or {})
+    metadata.update(getattr(message, "response_metadata", None) or {})
+
+    usage_metadata = getattr(message, "usage_metadata", None)
+    token_usage = metadata.get("token_usage") or (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if usage_metadata:
+        usage["input_tokens"] = usage_metadata.get("input_tokens") or 0
+        usage["output_tokens"] = usage_metadata.get("output_tokens") or 0
+    elif token_usage:
+        usage["input_tokens"] = token_usage.get("input_tokens") or token_usage.get("prompt_tokens") or 0
+        usage["output_tokens"] = token_usage.get("output_tokens") or token_usage.get("completion_tokens") or 0
+    elif "eval_count" in metadata:
+        usage["input_tokens"] = metadata.get("prompt_eval_count") or 0
+        usage["output_tokens"] = metadata.get("eval_count") or 0
+
+    if metadata.get("eval_duration"):
+        usage["generation_seconds"] = metadata["eval_duration"] / 1e9
+    return usage
+
+
+def _new_bucket() -> Dict[str, float]:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_cost": 0.0, "generation_seconds": 0.0}
+
+
+def _add_to_bucket(bucket: Dict[str, float], input_tokens: int, output_tokens: int, cost: float,
+                   generation_seconds: float):
+    bucket["calls"] += 1
+    bucket["input_tokens"] += input_tokens
+    bucket["output_tokens"] += output_tokens
+    bucket["estimated_cost"] += cost
+    bucket["generation_seconds"] += generation_seconds
+
+
+def _bucket_to_dict(bucket: Dict[str, float]) -> Dict[str, Any]:
+    """汇总结果，生成速度为输出token数除以生成耗时"""
+    return {
+        "calls": bucket["calls"],
+        "input_tokens": bucket["input_tokens"],
+        "output_tokens": bucket["output_tokens"],
+        "total_tokens": bucket["input_tokens"] + bucket["output_tokens"],
+        "estimated_cost": round(bucket["estimated_cost"], 6),
+        "tokens_per_second": round(bucket["output_tokens"] / bucket["generation_seconds"], 2)
+        if bucket["generation_seconds"] > 0 else None
+    }
+
+
+class RequestUsage:
+    """单次请求的token用量，保存在请求上下文中，随响应返回"""
+
+    def __init__(self, currency: str):
+        self.currency = currency
+        self._total = _new_bucket()
+        self._models: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, input_tokens: int, output_tokens: int, cost: float, generation_seconds: float):
+        with self._lock:
+            _add_to_bucket(self._total, input_tokens, output_tokens, cost, generation_seconds)
+            _add_to_bucket(self._models.setdefault(model, _new_bucket()), input_tokens, output_tokens, cost,
+                           generation_seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            usage = _bucket_to_dict(self._total)
+            usage["currency"] = self.currency
+            usage["models"] = {model: _bucket_to_dict(bucket) for model, bucket in self._models.items()}
+            return usage
+
+
+class UsageAccountant:
+    """全局token用量核算
+
+    由计时回调在每次模型调用结束时记录，累计到当前请求的用量和全局的按接口、后端、模型、
+    生成类型分组的用量中。估算费用按配置的每千token单价计算，模型名按最长前缀匹配单价，
+    未配置单价的模型（如本地部署的Ollama、vLLM模型）费用计为0。
+    """
+
+    GROUPS = ("endpoint", "backend", "model", "generation_type")
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.enabled = config.get("enabled", True)
+        self.currency = config.get("currency", "USD")
+        # 模型名 -> {"input": 每千输入token单价, "output": 每千输出token单价}
+        self.pricing: Dict[str, Dict[str, float]] = config.get("pricing", {})
+        self._lock = threading.Lock()
+        self._total = _new_bucket()
+        self._groups: Dict[str, Dict[str, Dict[str, float]]] = {group: {} for group in self.GROUPS}
+
+    def get_price(self, model: str) -> Optional[Dict[str, float]]:
+        """按最长前缀匹配模型单价，如gpt-4o-mini-2024-07-18匹配gpt-4o-mini而不是gpt-4o"""
+        if not model:
+            return None
+        if model in self.pricing:
+            return self.pricing[model]
+        matches = [name for name in self.pricing if model.startswith(name)]
+        return self.pricing[max(matches, key=len)] if matches else None
+
+    def estimate_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        price = self.get_price(model)
+        if not price:
+            return 0.0
+        return (input_tokens * price.get("input", 0) + output_tokens * price.get("output", 0)) / 1000
+
+    def record(self, backend: str, model: str, generation_type: str, input_tokens: int, output_tokens: int,
+               generation_seconds: float):
+        """记录一次模型调用的用量，接口名和本次请求的用量从请求上下文中获取"""
+        if not self.enabled:
+            return
+
+        cost = self.estimate_cost(model, input_tokens, output_tokens)
+        if cost:
+            LLM_COST.inc(cost, backend=backend, model=model)
+
+        endpoint = INTERNAL_ENDPOINT
+        context = get_request_context()
+        if context is not None:
+            endpoint = context.get("endpoint") or INTERNAL_ENDPOINT
+            request_usage = context.get("usage")
+            if request_usage is None:
+                request_usage = RequestUsage(self.currency)
+                context.set("usage", request_usage)
+            request_usage.add(model, input_tokens, output_tokens, cost, generation_seconds)
+
+        keys = {"endpoint": endpoint, "backend": backend, "model": model or "unknown",
+                "generation_type": generation_type}
+        with self._lock:
+            _add_to_bucket(self._total, input_tokens, output_tokens, cost, generation_seconds)
+            for group, key in keys.items():
+                bucket = self._groups[group].setdefault(key, _new_bucket())
+                _add_to_bucket(bucket, input_tokens, output_tokens, cost, generation_seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {"enabled": self.enabled, "currency": self.currency, "total": _bucket_to_dict(self._total)}
+            for group in self.GROUPS:
+                stats[f"by_{group}"] = {key: _bucket_to_dict(bucket) for key, bucket in self._groups[group].items()}
+            return stats
+
+
+def get_request_usage() -> Optional[Dict[str, Any]]:
+    """获取当前请求的token用量，不在请求范围内时返回None，请求中没有模型调用时用量为0"""
+    context = get_request_context()
+    if context is None:
+        return None
+
+    usage = context.get("usage")
+    if usage is None:
+        usage = RequestUsage(usage_accountant.currency)
+        context.set("usage", usage)
+    return usage.to_dict()
+
+
+def coalesced_usage(leader_request_id: Optional[str] = None) -> Dict[str, Any]:
+    """被合并的请求的用量：实际调用由合并到的请求执行并计入其用量，本请求计为0"""
+    usage = RequestUsage(usage_accountant.currency).to_dict()
+    usage["coalesced"] = True
+    usage["leader_request_id"] = leader_request_id
+    return usage
+
+
+# 全局token用量核算
+usage_accountant = UsageAccountant(config_reader.get_module_config("usage_accounting"))
@@ -98,7 +98,7 @@ def main():
         
         print("\n方法4: 使用Docker容器")
         print("docker pull vllm/vllm-openai")
-        print("docker run --gpus all -p 8000:8000 vllm/vllm-openai")
+        print("docker run --gpus all -p 8001:8000 vllm/vllm-openai")
         
         print("\n方法5: 如果您不需要GPU加速，可以考虑使用其他轻量级模型")
         print("例如: pip install transformers torch")
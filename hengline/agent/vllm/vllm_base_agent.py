@@ -12,87 +12,79 @@ from utils.log_utils import print_log_exception
 
 # 从基类导入
 from hengline.agent.base_agent import BaseMedicalAgent
+from hengline.agent.tracing import TimedEmbeddings
+from hengline.tools.tool_cache import ToolResultCache
+from hengline.config import config_reader
 
-# 导入VLLM相关库
-import vllm
+# vLLM服务客户端；进程内的本地模式才需要安装vllm，在加载引擎时导入
+from hengline.agent.vllm.vllm_client import VLLMServerClient, create_vllm_chat_model
+from hengline.agent.vllm.vllm_local import create_vllm_local_chat_model
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 
-# 导入LangChain的Runnable接口
-from langchain_core.runnables import Runnable
-
-
-# 定义一个VLLM包装器类，继承自Runnable
-class VLLM(Runnable):
-    def __init__(self, model="gpt2", temperature=0.1, max_new_tokens=1024, top_p=0.95, **kwargs):
-        self.model = model
-        self.temperature = temperature
-        self.max_new_tokens = max_new_tokens
-        self.top_p = top_p
-        self.vllm_kwargs = kwargs
-        
-        # 这里我们不会真正初始化vLLM模型，而是提供一个模拟实现
-        # 在实际使用时，可以根据需要初始化真实的vLLM模型
-        self.engine = None
-        logger.info(f"创建VLLM包装器: {model}")
-    
-    def invoke(self, prompt, **kwargs):
-        """模拟VLLM的调用方法"""
-        try:
-            # 在实际应用中，这里应该使用真实的vLLM模型生成回答
-            # 现在我们只返回一个模拟的回答
-            return f"[VLLM医学智能回答] 针对问题: {prompt[:50]}..."
-        except Exception as e:
-            logger.error(f"VLLM调用出错: {str(e)}")
-            return "抱歉，VLLM医学智能模型处理请求时出错。"
-    
-    def bind_tools(self, tools, **kwargs):
-        """模拟bind_tools方法，因为LangChain需要这个方法"""
-        logger.info(f"绑定工具到VLLM模型: {len(tools)}个工具")
-        # 返回self以便链式调用
-        return self
-    
-    def __call__(self, prompt, **kwargs):
-        """实现__call__方法以支持直接调用"""
-        return self.invoke(prompt, **kwargs)
-
 
 class VLLMBaseAgent(BaseMedicalAgent):
     """基于VLLM的医疗智能体基类，包含通用的初始化和配置逻辑"""
 
     def __init__(self):
-        # 初始化缓存
-        self.cache = {}
+        # 回答缓存，与工具结果缓存相同的TTL和LRU淘汰，出错的回答不缓存
+        cache_config = config_reader.get_vllm_config().get("answer_cache", {})
+        self.answer_cache = ToolResultCache(max_entries=cache_config.get("max_entries", 256),
+                                            default_ttl=cache_config.get("ttl", 600),
+                                            enabled=cache_config.get("enabled", True))
+
+        # vLLM服务的辅助接口（模型信息、健康检查和批量补全），仅server模式下可用
+        self.vllm_server = None
 
         # 调用基类初始化
         super().__init__("vllm")
 
 
     def _initialize_llm(self):
-        """初始化VLLM语言模型"""
+        """初始化VLLM语言模型
+
+        mode为server（默认）时连接vLLM的OpenAI兼容服务，支持流式输出、工具调用和服务端批处理；
+        mode为local时在进程内加载模型，引擎类型由local.engine配置（batch：微批次合并，async：异步引擎流式输出）。
+        """
         try:
             # 从配置中获取VLLM模型参数
             vllm_config = self.config_reader.get_vllm_config()
             
             if not vllm_config:
                 raise ValueError("未找到VLLM配置")
-            
-            # 初始化VLLM模型包装器
-            llm = VLLM(
-                model=vllm_config.get("model", "gpt2"),  # 默认模型
-                temperature=vllm_config.get("temperature", 0.1),
-                max_new_tokens=vllm_config.get("max_tokens", 1024),
-                top_p=vllm_config.get("top_p", 0.95),
-                **vllm_config.get("vllm_kwargs", {})
-            )
-            
-            logger.info(f"VLLM模型包装器初始化成功: {vllm_config.get('model', 'gpt2')}")
+
+            if vllm_config.get("mode", "server") == "server":
+                return self._initialize_server_llm(vllm_config)
+
+            # 进程内加载模型，并发请求合并为微批次或由异步引擎连续批处理
+            llm = create_vllm_local_chat_model(vllm_config)
+            logger.info(f"进程内vLLM模型初始化成功: {llm.model}（{llm.engine}）")
             return llm
         except Exception as e:
-            logger.error(f"VLLM模型包装器初始化失败: {str(e)}")
+            logger.error(f"VLLM模型初始化失败: {str(e)}")
             # 返回None，基类会处理这种情况
             return None
 
+    def _initialize_server_llm(self, vllm_config):
+        """连接vLLM的OpenAI兼容服务，并以服务端实际的max_model_len为准"""
+        llm = create_vllm_chat_model(vllm_config)
+        self.vllm_server = VLLMServerClient(llm.openai_api_base, llm.model_name,
+                                            api_key=vllm_config.get("api_key", ""),
+                                            server_config=vllm_config.get("server", {}))
+
+        try:
+            model_info = self.vllm_server.get_model_info()
+            server_max_model_len = (model_info or {}).get("max_model_len")
+            if server_max_model_len and (not llm.max_model_len or server_max_model_len < llm.max_model_len):
+                if llm.max_model_len:
+                    logger.warning(f"配置的max_model_len {llm.max_model_len} 超过vLLM服务的 {server_max_model_len}，"
+                                   f"以服务端为准")
+                llm.max_model_len = server_max_model_len
+            logger.info(f"已连接vLLM服务: {llm.openai_api_base}，max_model_len {llm.max_model_len}")
+        except Exception as e:
+            # 服务可能稍后启动，模型客户端照常创建，请求时由重试和后端池处理
+            logger.warning(f"暂时无法连接vLLM服务 {llm.openai_api_base}: {str(e)}")
+        return llm
 
     def load_medical_knowledge(self, agent_type: str):
         """加载医疗知识库"""
@@ -126,6 +118,9 @@ class VLLMBaseAgent(BaseMedicalAgent):
                 from langchain_community.embeddings.fake import FakeEmbeddings
                 embedding_model = FakeEmbeddings(size=768)
             
+            # 记录查询嵌入和文档嵌入的耗时
+            embedding_model = TimedEmbeddings(embedding_model, agent_type)
+
             # 加载文档并创建向量存储
             from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
             from langchain.text_splitter import CharacterTextSplitter
@@ -0,0 +1,117 @@
+"""@FileName: vllm_client.py
+@Description: vLLM OpenAI兼容服务的客户端，共享连接池的同步和异步HTTP、流式输出和工具调用，采样参数和max_model_len来自配置
+@Author: HengLine
+@Time: 2025/10/16 15:40
+"""
+import os
+import sys
+from typing import Any, Dict, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+# 导入日志模块
+from hengline.logger import info
+from hengline.agent.http_clients import http_client_factory
+
+# 默认端口避开本项目API服务的8000端口
+DEFAULT_BASE_URL = "http://localhost:8001/v1"
+
+# OpenAI接口原生支持的采样参数；其余参数（top_k、min_p、repetition_penalty等）是vLLM的扩展参数，通过extra_body传递
+OPENAI_SAMPLING_PARAMS = ("presence_penalty", "frequency_penalty", "seed", "stop", "logit_bias", "n")
+
+
+class ChatVLLM(ChatOpenAI):
+    """指向vLLM OpenAI兼容服务的聊天模型
+
+    流式输出和工具调用沿用ChatOpenAI的实现，工具调用需要服务以--enable-auto-tool-choice和
+    --tool-call-parser启动。配置了max_model_len时，生成长度不超过模型上下文减去为提示保留的
+    min_prompt_tokens（最多保留上下文的一半），并通过truncate_prompt_tokens让服务端截断过长的提示，
+    而不是拒绝整个请求。服务端从左侧截断，保留提示末尾的token，过长时开头的系统提示也会被截掉；
+    会话历史由会话管理压缩为摘要，正常情况下不会触发截断。
+    """
+
+    max_model_len: Optional[int] = None
+    min_prompt_tokens: int = 512
+
+    def _get_request_payload(self, input_, *, stop=None, **kwargs) -> dict:
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        # vLLM各版本都支持max_tokens，较早的版本不识别max_completion_tokens
+        if "max_completion_tokens" in payload:
+            payload["max_tokens"] = payload.pop("max_completion_tokens")
+
+        max_tokens = payload.get("max_tokens")
+        if self.max_model_len and max_tokens:
+            prompt_budget = min(self.min_prompt_tokens, self.max_model_len // 2)
+            max_tokens = min(max_tokens, self.max_model_len - prompt_budget)
+            payload["max_tokens"] = max_tokens
+            extra_body = dict(payload.get("extra_body") or {})
+            extra_body.setdefault("truncate_prompt_tokens", self.max_model_len - max_tokens)
+            payload["extra_body"] = extra_body
+        return payload
+
+
+class VLLMServerClient:
+    """vLLM服务的辅助接口：模型信息和健康检查
+
+    批量生成通过聊天模型并发提交请求，由vLLM的连续批处理合并；/completions接口不套用聊天模板，不用于生成。
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, model: str = None, api_key: str = "",
+                 server_config: Dict[str, Any] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        # 与聊天模型共用同一服务地址的连接池
+        self.client, _ = http_client_factory.get_clients(self.base_url, server_config)
+
+    def get_model_info(self, timeout: float = 5) -> Optional[Dict[str, Any]]:
+        """查询服务加载的模型，vLLM在模型信息中返回max_model_len"""
+        response = self.client.get(f"{self.base_url}/models", headers=self.headers, timeout=timeout)
+        response.raise_for_status()
+        models = response.json().get("data", [])
+        for model in models:
+            if model.get("id") == self.model:
+                return model
+        return models[0] if models else None
+
+    def health(self, timeout: float = 5) -> bool:
+        """服务健康检查，/health位于API路径之外"""
+        root_url = self.base_url[:-3] if self.base_url.endswith("/v1") else self.base_url
+        try:
+            return self.client.get(f"{root_url}/health", timeout=timeout).status_code == 200
+        except httpx.HTTPError:
+            return False
+
+
+def create_vllm_chat_model(vllm_config: Dict[str, Any]) -> ChatVLLM:
+    """按配置创建vLLM聊天模型，采样参数中OpenAI原生参数直接设置，其余作为vLLM扩展参数传递"""
+    base_url = vllm_config.get("base_url", DEFAULT_BASE_URL)
+    server_config = vllm_config.get("server", {})
+    sampling = dict(vllm_config.get("sampling", {}))
+    openai_params = {key: sampling.pop(key) for key in OPENAI_SAMPLING_PARAMS if key in sampling}
+    # 连接数上限应大于预期的并发请求数，使并发请求同时到达服务端，由vLLM的连续批处理合并生成
+    http_client, http_async_client = http_client_factory.get_clients(base_url, server_config)
+
+    llm = ChatVLLM(
+        model=vllm_config.get("served_model_name") or vllm_config.get("model", "gpt2"),
+        api_key=vllm_config.get("api_key") or "EMPTY",
+        base_url=base_url,
+        temperature=vllm_config.get("temperature", 0.1),
+        top_p=vllm_config.get("top_p", 0.95),
+        max_tokens=vllm_config.get("max_tokens", 1024),
+        streaming=vllm_config.get("streaming", True),
+        stream_usage=True,
+        max_retries=server_config.get("max_retries", 2),
+        http_client=http_client,
+        http_async_client=http_async_client,
+        extra_body=sampling or None,
+        max_model_len=vllm_config.get("max_model_len") or vllm_config.get("vllm_kwargs", {}).get("max_model_len"),
+        min_prompt_tokens=vllm_config.get("min_prompt_tokens", 512),
+        **openai_params
+    )
+    info(f"vLLM服务客户端已创建: {base_url}，模型 {llm.model_name}")
+    return llm
@@ -42,59 +42,84 @@ class VllmGenerativeAgent(VLLMBaseAgent):
             warning("语言模型尚未初始化，无法创建生成链")
             return
 
+        # 各生成类型的提示：生成要求作为固定的系统消息，主题放在最后的用户消息中，
+        # 同一生成类型的各次请求共享相同的前缀，便于vLLM的前缀缓存命中
+
         # 通用信息生成提示
-        general_info_template = ChatPromptTemplate.from_template(
-            "你是一位经验丰富的医学专家。请提供关于{topic}的简明扼要的概述信息。\n\n" \
-            "要求：\n" \
-            "1. 内容准确、专业\n" \
-            "2. 语言通俗易懂\n" \
-            "3. 包含最重要的关键点\n" \
-            "4. 不包含过于专业的术语解释\n" \
-            "5. 长度适中，约200-300字"
-        )
+        general_info_template = ChatPromptTemplate.from_messages([
+            ("system", "你是一位经验丰富的医学专家。请提供关于用户给定主题的简明扼要的概述信息。\n\n" \
+                       "要求：\n" \
+                       "1. 内容准确、专业\n" \
+                       "2. 语言通俗易懂\n" \
+                       "3. 包含最重要的关键点\n" \
+                       "4. 不包含过于专业的术语解释\n" \
+                       "5. 长度适中，约200-300字"),
+            ("human", "主题: {topic}")
+        ])
 
         # 详细解释生成提示
-        detailed_explanation_template = ChatPromptTemplate.from_template(
-            "你是一位经验丰富的医学专家。请提供关于{topic}的详细解释。\n\n" \
-            "要求：\n" \
-            "1. 内容深入、全面\n" \
-            "2. 包含相关的医学原理和机制\n" \
-            "3. 适当使用专业术语并给出解释\n" \
-            "4. 结构清晰，逻辑连贯\n" \
-            "5. 长度约500-800字"
-        )
+        detailed_explanation_template = ChatPromptTemplate.from_messages([
+            ("system", "你是一位经验丰富的医学专家。请提供关于用户给定主题的详细解释。\n\n" \
+                       "要求：\n" \
+                       "1. 内容深入、全面\n" \
+                       "2. 包含相关的医学原理和机制\n" \
+                       "3. 适当使用专业术语并给出解释\n" \
+                       "4. 结构清晰，逻辑连贯\n" \
+                       "5. 长度约500-800字"),
+            ("human", "主题: {topic}")
+        ])
 
         # 患者教育材料生成提示
-        patient_education_template = ChatPromptTemplate.from_template(
-            "你是一位经验丰富的医学专家。请创建一份面向患者的关于{topic}的教育材料。\n\n" \
-            "要求：\n" \
-            "1. 语言简单易懂，避免专业术语\n" \
-            "2. 内容实用，关注患者关心的问题\n" \
-            "3. 包含常见问题解答\n" \
-            "4. 提供明确的建议和注意事项\n" \
-            "5. 语气亲切，有帮助性\n" \
-            "6. 长度约300-500字"
-        )
+        patient_education_template = ChatPromptTemplate.from_messages([
+            ("system", "你是一位经验丰富的医学专家。请创建一份面向患者的关于用户给定主题的教育材料。\n\n" \
+                       "要求：\n" \
+                       "1. 语言简单易懂，避免专业术语\n" \
+                       "2. 内容实用，关注患者关心的问题\n" \
+                       "3. 包含常见问题解答\n" \
+                       "4. 提供明确的建议和注意事项\n" \
+                       "5. 语气亲切，有帮助性\n" \
+                       "6. 长度约300-500字"),
+            ("human", "主题: {topic}")
+        ])
 
         # 医疗案例生成提示
-        medical_case_template = ChatPromptTemplate.from_template(
-            "你是一位经验丰富的医学专家。请创建一个关于{topic}的临床案例。\n\n" \
-            "要求：\n" \
-            "1. 案例描述详细、真实\n" \
-            "2. 包含患者基本信息、症状、诊断过程、治疗方案和预后\n" \
-            "3. 反映真实的临床思维过程\n" \
-            "4. 包含相关的医学知识要点\n" \
-            "5. 长度约800-1000字"
-        )
-
-        # 创建各种生成类型的链
-        self.generative_chains["general_info"] = general_info_template | self.llm | StrOutputParser()
-        self.generative_chains["detailed_explanation"] = detailed_explanation_template | self.llm | StrOutputParser()
-        self.generative_chains["patient_education"] = patient_education_template | self.llm | StrOutputParser()
-        self.generative_chains["medical_case"] = medical_case_template | self.llm | StrOutputParser()
+        medical_case_template = ChatPromptTemplate.from_messages([
+            ("system", "你是一位经验丰富的医学专家。请创建一个关于用户给定主题的临床案例。\n\n" \
+                       "要求：\n" \
+                       "1. 案例描述详细、真实\n" \
+                       "2. 包含患者基本信息、症状、诊断过程、治疗方案和预后\n" \
+                       "3. 反映真实的临床思维过程\n" \
+                       "4. 包含相关的医学知识要点\n" \
+                       "5. 长度约800-1000字"),
+            ("human", "主题: {topic}")
+        ])
+
+        # 创建各种生成类型的链，统一登记到提示链注册表以记录调用次数和耗时
+        templates = {
+            "general_info": general_info_template,
+            "detailed_explanation": detailed_explanation_template,
+            "patient_education": patient_education_template,
+            "medical_case": medical_case_template
+        }
+        for gen_type, template in templates.items():
+            self.generative_chains[gen_type] = self.prompts.register(
+                f"generate.{gen_type}", template, self.llm, StrOutputParser())
 
         info(f"成功创建{len(self.generative_chains)}种生成类型的链")
 
+    def _resolve_generation_type(self, topic, generation_type):
+        """校验生成参数，不支持的生成类型回退为general_info"""
+        # 验证生成类型
+        if generation_type not in self.generative_chains:
+            warning(f"不支持的生成类型: {generation_type}，将使用默认类型 general_info")
+            generation_type = "general_info"
+
+        # 验证主题
+        if not topic or not isinstance(topic, str) or topic.strip() == "":
+            raise ValueError("主题必须是非空字符串")
+
+        return generation_type
+
     def generate_content(self, topic, generation_type="general_info"):
         """生成医疗内容
         
@@ -107,14 +132,7 @@ class VllmGenerativeAgent(VLLMBaseAgent):
             str: 生成的内容
         """
         try:
-            # 验证生成类型
-            if generation_type not in self.generative_chains:
-                warning(f"不支持的生成类型: {generation_type}，将使用默认类型 general_info")
-                generation_type = "general_info"
-
-            # 验证主题
-            if not topic or not isinstance(topic, str) or topic.strip() == "":
-                raise ValueError("主题必须是非空字符串")
+            generation_type = self._resolve_generation_type(topic, generation_type)
 
             info(f"正在生成关于'{topic}'的{generation_type}内容")
 
@@ -126,6 +144,93 @@ class VllmGenerativeAgent(VLLMBaseAgent):
             error(f"生成内容时出错: {str(e)}")
             return f"生成内容时出错: {str(e)}"
 
+    async def agenerate_content(self, topic, generation_type="general_info"):
+        """异步生成医疗内容，参数与generate_content一致"""
+        try:
+            generation_type = self._resolve_generation_type(topic, generation_type)
+
+            info(f"正在异步生成关于'{topic}'的{generation_type}内容")
+
+            # 异步执行生成链
+            return await self.generative_chains[generation_type].ainvoke({"topic": topic})
+        except Exception as e:
+            error(f"生成内容时出错: {str(e)}")
+            return f"生成内容时出错: {str(e)}"
+
+    def generate_batch(self, topics, generation_type="general_info"):
+        """批量生成医疗内容，各主题的请求并发提交，由vLLM服务的连续批处理合并生成
+
+        Returns:
+            List[str]: 与topics顺序一致的生成内容，主题无效或单个主题出错时返回错误信息
+        """
+        if not topics:
+            return []
+
+        try:
+            generation_type, results, valid = self._prepare_batch(topics, generation_type)
+            if valid:
+                outputs = self.generative_chains[generation_type].batch(
+                    [{"topic": topics[index]} for index in valid],
+                    config={"max_concurrency": self._batch_concurrency()}, return_exceptions=True)
+                self._fill_batch_results(results, valid, outputs)
+            return results
+        except Exception as e:
+            error(f"批量生成内容时出错: {str(e)}")
+            return [f"生成内容时出错: {str(e)}"] * len(topics)
+
+    async def agenerate_batch(self, topics, generation_type="general_info"):
+        """generate_batch的异步版本"""
+        if not topics:
+            return []
+
+        try:
+            generation_type, results, valid = self._prepare_batch(topics, generation_type)
+            if valid:
+                outputs = await self.generative_chains[generation_type].abatch(
+                    [{"topic": topics[index]} for index in valid],
+                    config={"max_concurrency": self._batch_concurrency()}, return_exceptions=True)
+                self._fill_batch_results(results, valid, outputs)
+            return results
+        except Exception as e:
+            error(f"批量生成内容时出错: {str(e)}")
+            return [f"生成内容时出错: {str(e)}"] * len(topics)
+
+    def _prepare_batch(self, topics, generation_type):
+        """逐个校验主题，无效主题直接得到错误信息，不提交给服务端
+
+        Returns:
+            tuple: (生成类型, 与topics等长的结果列表, 有效主题的下标)
+        """
+        results = [None] * len(topics)
+        valid = []
+        for index, topic in enumerate(topics):
+            try:
+                generation_type = self._resolve_generation_type(topic, generation_type)
+                valid.append(index)
+            except ValueError as e:
+                results[index] = f"生成内容时出错: {str(e)}"
+        return generation_type, results, valid
+
+    @staticmethod
+    def _fill_batch_results(results, valid, outputs):
+        for index, output in zip(valid, outputs):
+            results[index] = f"生成内容时出错: {str(output)}" if isinstance(output, Exception) else output
+
+    def _batch_concurrency(self):
+        """批量生成时同时提交给服务端的请求数"""
+        return self.config_reader.get_vllm_config().get("server", {}).get("batch_concurrency", 32)
+
+    async def astream_content(self, topic, generation_type="general_info"):
+        """流式生成医疗内容，逐token产生事件"""
+        try:
+            generation_type = self._resolve_generation_type(topic, generation_type)
+
+            async for event in self._astream_chain(self.generative_chains[generation_type], {"topic": topic}):
+                yield event
+        except Exception as e:
+            error(f"流式生成内容时出错: {str(e)}")
+            yield {"event": "error", "data": {"message": f"生成内容时出错: {str(e)}"}}
+
     def _determine_generation_type(self, query):
         """根据查询自动确定生成类型
         
@@ -192,6 +297,35 @@ class VllmGenerativeAgent(VLLMBaseAgent):
             error(f"运行智能体时出错: {str(e)}")
             return f"运行智能体时出错: {str(e)}"
 
+    async def arun(self, question):
+        """异步运行智能体回答问题或生成内容
+
+        Args:
+            question: 用户的问题或内容生成请求
+
+        Returns:
+            str: 智能体的回答或生成的内容
+        """
+        try:
+            # 检查是否初始化成功
+            if not self.llm:
+                return "智能体初始化失败，请检查配置"
+
+            # 如果没有生成链，创建生成链
+            if not self.generative_chains:
+                self._create_generative_chains()
+
+                if not self.generative_chains:
+                    return "无法创建生成链，无法生成内容"
+
+            # 确定生成类型，直接使用问题作为主题
+            generation_type = self._determine_generation_type(question)
+
+            return await self.agenerate_content(question, generation_type)
+        except Exception as e:
+            error(f"运行智能体时出错: {str(e)}")
+            return f"运行智能体时出错: {str(e)}"
+
 
 if __name__ == "__main__":
     # 创建基于vLLM的生成式医疗智能体实例
@@ -0,0 +1,489 @@
+"""@FileName: vllm_local.py
+@Description: 进程内vLLM引擎的聊天模型，并发请求合并为微批次一次调用引擎的批量生成，或使用异步引擎逐请求流式输出
+@Author: HengLine
+@Time: 2025/10/16 20:10
+"""
+import asyncio
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+# 导入日志模块
+from hengline.logger import logger
+from hengline.agent.metrics import VLLM_BATCH_SIZE, VLLM_QUEUE_WAIT
+
+# 只有异步引擎接受的参数，批量引擎（vllm.LLM）不识别
+ASYNC_ENGINE_ONLY_ARGS = ("disable_log_requests",)
+
+# 消息类型 -> 聊天模板中的角色
+MESSAGE_ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+
+
+class VLLMQueueFullError(RuntimeError):
+    """等待合批的请求数达到上限"""
+
+
+class _PendingRequest:
+    __slots__ = ("prompt", "sampling_params", "future", "enqueued_at")
+
+    def __init__(self, prompt: str, sampling_params):
+        self.prompt = prompt
+        self.sampling_params = sampling_params
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchEngineRunner:
+    """批量引擎：各请求线程的提示进入同一个队列，由引擎线程合并为微批次后一次调用generate
+
+    vllm.LLM不是线程安全的，所有生成都在专用的引擎线程中执行。引擎线程取到第一个请求后最多再等待
+    batch_window秒收集后续请求，批次的请求数达到max_batch_size或token数（提示加最大生成长度）
+    达到max_batch_tokens时立即提交，放不下的请求留到下一批的开头。
+    """
+
+    def __init__(self, model: str, engine_kwargs: Dict[str, Any] = None, batch_window: float = 0.01,
+                 max_batch_tokens: int = 8192, max_batch_size: int = 64, max_queue_size: int = 1024):
+        import vllm
+
+        engine_kwargs = {key: value for key, value in (engine_kwargs or {}).items()
+                         if key not in ASYNC_ENGINE_ONLY_ARGS}
+        self.model = model
+        self.engine = vllm.LLM(model=model, **engine_kwargs)
+        self.tokenizer = self.engine.get_tokenizer()
+        self.batch_window = batch_window
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        # 上一批放不下、留到下一批开头的请求
+        self._carry: Optional[Tuple[_PendingRequest, List[int]]] = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "rejected": 0, "errors": 0, "max_batch_size": 0,
+                       "total_batch_size": 0, "total_batch_tokens": 0, "total_queue_wait": 0.0}
+        threading.Thread(target=self._run, name="vllm-batcher", daemon=True).start()
+
+    def submit(self, prompt: str, sampling_params) -> Future:
+        request = _PendingRequest(prompt, sampling_params)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise VLLMQueueFullError(f"vLLM请求队列已满（{self._queue.maxsize}）")
+        with self._lock:
+            self._stats["requests"] += 1
+        return request.future
+
+    def generate(self, prompt: str, sampling_params):
+        return self.submit(prompt, sampling_params).result()
+
+    async def agenerate(self, prompt: str, sampling_params):
+        return await asyncio.wrap_future(self.submit(prompt, sampling_params))
+
+    def stream(self, prompt: str, sampling_params) -> Iterator[Any]:
+        """批量引擎不逐token输出，生成完成后一次返回"""
+        yield self.generate(prompt, sampling_params)
+
+    async def astream(self, prompt: str, sampling_params) -> AsyncIterator[Any]:
+        yield await self.agenerate(prompt, sampling_params)
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._execute(batch)
+
+    def _collect_batch(self) -> List[Tuple[_PendingRequest, List[int]]]:
+        """收集一个微批次：阻塞等待第一个请求，之后在时间窗口内继续收集直到达到上限"""
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = self._prepare(self._queue.get())
+
+        if first is None:
+            return []
+        batch = [first]
+        batch_tokens = self._request_tokens(first)
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._prepare(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            if item is None:
+                continue
+            tokens = self._request_tokens(item)
+            if batch and batch_tokens + tokens > self.max_batch_tokens:
+                self._carry = item
+                break
+            batch.append(item)
+            batch_tokens += tokens
+        return batch
+
+    def _prepare(self, request: _PendingRequest) -> Optional[Tuple[_PendingRequest, List[int]]]:
+        """在引擎线程中分词，调用方已取消的请求直接丢弃"""
+        if not request.future.set_running_or_notify_cancel():
+            return None
+        try:
+            return request, self.tokenizer.encode(request.prompt)
+        except Exception as e:
+            request.future.set_exception(e)
+            return None
+
+    @staticmethod
+    def _request_tokens(item: Tuple[_PendingRequest, List[int]]) -> int:
+        request, token_ids = item
+        return len(token_ids) + (getattr(request.sampling_params, "max_tokens", None) or 0)
+
+    def _execute(self, batch: List[Tuple[_PendingRequest, List[int]]]):
+        dispatched_at = time.perf_counter()
+        queue_wait = 0.0
+        for request, _ in batch:
+            wait = dispatched_at - request.enqueued_at
+            queue_wait += wait
+            VLLM_QUEUE_WAIT.observe(wait, model=self.model, engine="batch")
+        VLLM_BATCH_SIZE.observe(len(batch), model=self.model)
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["total_batch_size"] += len(batch)
+            self._stats["total_batch_tokens"] += sum(self._request_tokens(item) for item in batch)
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+            self._stats["total_queue_wait"] += queue_wait
+
+        try:
+            # 提示已在引擎线程中分词，直接以token id提交，引擎不再重复分词
+            outputs = self.engine.generate([{"prompt_token_ids": token_ids} for _, token_ids in batch],
+                                           [request.sampling_params for request, _ in batch], use_tqdm=False)
+        except Exception as e:
+            logger.error(f"vLLM批量生成出错（批次 {len(batch)} 个请求）: {str(e)}")
+            with self._lock:
+                self._stats["errors"] += len(batch)
+            for request, _ in batch:
+                request.future.set_exception(e)
+            return
+
+        for (request, _), output in zip(batch, outputs):
+            request.future.set_result(output)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = self._stats["batches"]
+            dispatched = self._stats["total_batch_size"]
+            return {
+                "engine": "batch",
+                "requests": self._stats["requests"],
+                "batches": batches,
+                "rejected": self._stats["rejected"],
+                "errors": self._stats["errors"],
+                "queue_depth": self._queue.qsize(),
+                "avg_batch_size": round(dispatched / batches, 2) if batches else 0.0,
+                "max_batch_size": self._stats["max_batch_size"],
+                "avg_batch_tokens": round(self._stats["total_batch_tokens"] / batches, 1) if batches else 0.0,
+                "avg_queue_wait_ms": round(self._stats["total_queue_wait"] / dispatched * 1000, 2)
+                if dispatched else 0.0,
+                "batch_window_ms": self.batch_window * 1000,
+                "max_batch_tokens": self.max_batch_tokens
+            }
+
+
+class AsyncEngineRunner:
+    """异步引擎：在专用的后台事件循环中运行AsyncLLMEngine，引擎自身做连续批处理，每个请求逐token输出
+
+    同步和异步调用方都把请求提交到后台事件循环，输出通过队列转交给调用方；
+    调用方中途停止读取（如客户端断开）时中止引擎中的请求，释放其KV缓存。
+    """
+
+    def __init__(self, model: str, engine_kwargs: Dict[str, Any] = None, max_queue_size: int = 1024):
+        self.model = model
+        self.max_queue_size = max_queue_size
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="vllm-engine", daemon=True).start()
+        self.engine = asyncio.run_coroutine_threadsafe(self._create_engine(model, engine_kwargs or {}),
+                                                       self._loop).result()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "active": 0, "max_active": 0, "rejected": 0, "aborted": 0, "errors": 0,
+                       "total_queue_wait": 0.0, "started": 0}
+
+    @staticmethod
+    async def _create_engine(model: str, engine_kwargs: Dict[str, Any]):
+        from vllm import AsyncEngineArgs, AsyncLLMEngine
+
+        return AsyncLLMEngine.from_engine_args(AsyncEngineArgs(model=model, **engine_kwargs))
+
+    async def _produce(self, prompt: str, sampling_params, request_id: str, emit):
+        """在后台事件循环中生成，每个输出（累计文本）交给emit，结束时emit(None)，出错时emit异常"""
+        submitted_at = time.perf_counter()
+        first = True
+        try:
+            async for output in self.engine.generate(prompt, sampling_params, request_id):
+                if first:
+                    first = False
+                    wait = time.perf_counter() - submitted_at
+                    VLLM_QUEUE_WAIT.observe(wait, model=self.model, engine="async")
+                    with self._lock:
+                        self._stats["total_queue_wait"] += wait
+                        self._stats["started"] += 1
+                emit(output)
+            emit(None)
+        except asyncio.CancelledError:
+            await self.engine.abort(request_id)
+            with self._lock:
+                self._stats["aborted"] += 1
+            raise
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            emit(e)
+
+    def _start(self, prompt: str, sampling_params, emit) -> Future:
+        with self._lock:
+            if self._stats["active"] >= self.max_queue_size:
+                self._stats["rejected"] += 1
+                raise VLLMQueueFullError(f"vLLM进行中的请求已达上限（{self.max_queue_size}）")
+            self._stats["requests"] += 1
+            self._stats["active"] += 1
+            self._stats["max_active"] = max(self._stats["max_active"], self._stats["active"])
+        future = asyncio.run_coroutine_threadsafe(
+            self._produce(prompt, sampling_params, uuid.uuid4().hex, emit), self._loop)
+        # 在完成回调中释放名额：调用方在生成开始前就取消时_produce不会执行，回调仍会调用
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self._stats["active"] -= 1
+
+    def stream(self, prompt: str, sampling_params) -> Iterator[Any]:
+        outputs = queue.Queue()
+        future = self._start(prompt, sampling_params, outputs.put)
+        try:
+            while True:
+                item = outputs.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # 调用方提前停止读取时取消后台的生成，_produce会中止引擎中的请求
+            future.cancel()
+
+    async def astream(self, prompt: str, sampling_params) -> AsyncIterator[Any]:
+        caller_loop = asyncio.get_running_loop()
+        outputs = asyncio.Queue()
+        future = self._start(prompt, sampling_params,
+                             lambda item: caller_loop.call_soon_threadsafe(outputs.put_nowait, item))
+        try:
+            while True:
+                item = await outputs.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def generate(self, prompt: str, sampling_params):
+        output = None
+        for output in self.stream(prompt, sampling_params):
+            pass
+        return output
+
+    async def agenerate(self, prompt: str, sampling_params):
+        output = None
+        async for output in self.astream(prompt, sampling_params):
+            pass
+        return output
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._stats["started"]
+            return {
+                "engine": "async",
+                "requests": self._stats["requests"],
+                "active": self._stats["active"],
+                "max_active": self._stats["max_active"],
+                "rejected": self._stats["rejected"],
+                "aborted": self._stats["aborted"],
+                "errors": self._stats["errors"],
+                "avg_queue_wait_ms": round(self._stats["total_queue_wait"] / started * 1000, 2) if started else 0.0
+            }
+
+
+# (模型, 引擎类型) -> 引擎；同一模型只加载一次，医疗和生成式智能体共用
+_engines: Dict[Tuple[str, str], Any] = {}
+_engines_lock = threading.Lock()
+
+
+def get_local_engine(model: str, engine: str = "batch", engine_kwargs: Dict[str, Any] = None,
+                     local_config: Dict[str, Any] = None):
+    """获取进程内的vLLM引擎，首次调用时加载模型"""
+    local_config = local_config or {}
+    with _engines_lock:
+        runner = _engines.get((model, engine))
+        if runner is None:
+            if engine == "async":
+                runner = AsyncEngineRunner(model, engine_kwargs, max_queue_size=local_config.get("max_queue_size", 1024))
+            elif engine == "batch":
+                runner = BatchEngineRunner(model, engine_kwargs,
+                                           batch_window=local_config.get("batch_window_ms", 10) / 1000,
+                                           max_batch_tokens=local_config.get("max_batch_tokens", 8192),
+                                           max_batch_size=local_config.get("max_batch_size", 64),
+                                           max_queue_size=local_config.get("max_queue_size", 1024))
+            else:
+                raise ValueError(f"未知的vLLM引擎类型: {engine}，可选 batch 或 async")
+            _engines[(model, engine)] = runner
+            logger.info(f"进程内vLLM引擎已加载: {model}（{engine}）")
+        return runner
+
+
+def get_local_engine_stats() -> Dict[str, Any]:
+    """各进程内引擎的请求、批次和排队统计"""
+    with _engines_lock:
+        runners = dict(_engines)
+    return {f"{model}:{engine}": runner.get_stats() for (model, engine), runner in runners.items()}
+
+
+class ChatVLLMLocal(BaseChatModel):
+    """使用进程内vLLM引擎的聊天模型
+
+    消息按模型分词器的聊天模板拼接为提示后提交给共享的引擎。本地模式不解析工具调用，
+    bind_tools返回模型本身，智能体直接根据检索上下文回答。
+    """
+
+    model: str
+    temperature: float = 0.1
+    top_p: float = 0.95
+    max_tokens: int = 1024
+    # top_k、min_p、repetition_penalty等其他采样参数
+    sampling: Dict[str, Any] = {}
+    engine: str = "batch"
+    engine_kwargs: Dict[str, Any] = {}
+    local_config: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "vllm-local"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "engine": self.engine, "temperature": self.temperature, "top_p": self.top_p,
+                "max_tokens": self.max_tokens}
+
+    @property
+    def runner(self):
+        return get_local_engine(self.model, self.engine, self.engine_kwargs, self.local_config)
+
+    def bind_tools(self, tools, **kwargs):
+        logger.info(f"进程内vLLM模型不解析工具调用，忽略绑定的 {len(tools)} 个工具")
+        return self
+
+    def _format_prompt(self, messages: List[BaseMessage]) -> str:
+        conversation = [{"role": MESSAGE_ROLES.get(message.type, "user"), "content": message.content}
+                        for message in messages]
+        tokenizer = getattr(self.runner, "tokenizer", None)
+        if tokenizer is not None and getattr(tokenizer, "chat_template", None):
+            return tokenizer.apply_chat_template(conversation, tokenize=False, add_generation_prompt=True)
+        # 没有聊天模板的基础模型按角色逐行拼接
+        lines = [f"{turn['role']}: {turn['content']}" for turn in conversation]
+        return "\n".join(lines) + "\nassistant:"
+
+    def _sampling_params(self, stop: Optional[List[str]], **kwargs):
+        from vllm import SamplingParams
+
+        params = {"temperature": self.temperature, "top_p": self.top_p, "max_tokens": self.max_tokens}
+        params.update(self.sampling)
+        params.update({key: value for key, value in kwargs.items() if key in ("temperature", "top_p", "max_tokens")})
+        if stop:
+            params["stop"] = stop
+        return SamplingParams(**params)
+
+    def _usage(self, output) -> UsageMetadata:
+        input_tokens = len(output.prompt_token_ids or [])
+        output_tokens = len(output.outputs[0].token_ids)
+        return UsageMetadata(input_tokens=input_tokens, output_tokens=output_tokens,
+                             total_tokens=input_tokens + output_tokens)
+
+    def _to_result(self, output) -> ChatResult:
+        completion = output.outputs[0]
+        message = AIMessage(content=completion.text, usage_metadata=self._usage(output),
+                            response_metadata={"model_name": self.model, "finish_reason": completion.finish_reason})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs) -> ChatResult:
+        output = self.runner.generate(self._format_prompt(messages), self._sampling_params(stop, **kwargs))
+        return self._to_result(output)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs) -> ChatResult:
+        output = await self.runner.agenerate(self._format_prompt(messages), self._sampling_params(stop, **kwargs))
+        return self._to_result(output)
+
+    def _delta_chunk(self, output, sent: int) -> Tuple[Optional[ChatGenerationChunk], int]:
+        """引擎的输出是累计文本，取出新增部分；生成结束时附带token用量"""
+        completion = output.outputs[0]
+        delta = completion.text[sent:]
+        finished = completion.finish_reason is not None
+        if not delta and not finished:
+            return None, sent
+        chunk = AIMessageChunk(content=delta, usage_metadata=self._usage(output) if finished else None,
+                               response_metadata={"model_name": self.model, "finish_reason": completion.finish_reason}
+                               if finished else {})
+        return ChatGenerationChunk(message=chunk), len(completion.text)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs) -> Iterator[ChatGenerationChunk]:
+        sent = 0
+        for output in self.runner.stream(self._format_prompt(messages), self._sampling_params(stop, **kwargs)):
+            chunk, sent = self._delta_chunk(output, sent)
+            if chunk is not None:
+                if run_manager and chunk.text:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        sent = 0
+        async for output in self.runner.astream(self._format_prompt(messages), self._sampling_params(stop, **kwargs)):
+            chunk, sent = self._delta_chunk(output, sent)
+            if chunk is not None:
+                if run_manager and chunk.text:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+
+
+def create_vllm_local_chat_model(vllm_config: Dict[str, Any]) -> ChatVLLMLocal:
+    """按配置创建进程内vLLM聊天模型，并立即加载引擎，模型加载失败时抛出异常"""
+    local_config = vllm_config.get("local", {})
+    llm = ChatVLLMLocal(
+        model=vllm_config.get("model", "gpt2"),
+        temperature=vllm_config.get("temperature", 0.1),
+        top_p=vllm_config.get("top_p", 0.95),
+        max_tokens=vllm_config.get("max_tokens", 1024),
+        sampling=vllm_config.get("sampling", {}),
+        engine=local_config.get("engine", "batch"),
+        engine_kwargs=vllm_config.get("vllm_kwargs", {}),
+        local_config=local_config
+    )
+    # 创建时即加载模型，加载失败由调用方处理，而不是在首个请求时才暴露
+    get_local_engine(llm.model, llm.engine, llm.engine_kwargs, local_config)
+    return llm
@@ -10,7 +10,13 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.
 from hengline.agent.vllm.vllm_base_agent import VLLMBaseAgent
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from hengline.logger import warning, info, error
+from hengline.logger import warning, info, error, debug
+from hengline.tools.query_normalizer import query_normalizer
+from hengline.agent.request_context import set_request_value
+from hengline.agent.usage_accounting import get_request_usage
+
+# 回答缓存中的条目名，TTL按该名称配置
+ANSWER_CACHE_NAME = "vllm_answer"
 
 
 class VLLMMedicalAgent(VLLMBaseAgent):
@@ -49,28 +55,47 @@ class VLLMMedicalAgent(VLLMBaseAgent):
             # 回退到基类的实现
             return super()._create_retrieval_chain()
     
-    def run(self, question):
-        """运行智能体回答问题，针对VLLM模型进行优化"""
-        # 检查缓存
-        cache_key = question.strip().lower()
-        if cache_key in self.cache:
-            debug(f"从缓存中获取问题答案: {cache_key}")
-            return self.cache[cache_key]
-        
-        # 调用基类的run方法
-        result = super().run(question)
-        
-        # 将结果存入缓存
-        self.cache[cache_key] = result
-        
-        # 限制缓存大小
-        if len(self.cache) > 100:
-            # 移除最早的缓存项
-            first_key = next(iter(self.cache))
-            del self.cache[first_key]
-        
+    def run(self, question, session_id=None):
+        """运行智能体回答问题，相同问题的回答在结果缓存中复用"""
+        # 会话中的追问依赖上下文，不使用结果缓存；不合适的查询直接返回提示，不进入缓存
+        if session_id or not self.medical_tools.validate_medical_query(question)[0]:
+            return super().run(question, session_id)
+
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return super(VLLMMedicalAgent, self).run(question)
+
+        result = self.answer_cache.get_or_compute(ANSWER_CACHE_NAME, {"question": question}, compute,
+                                                  cacheable=self._is_cacheable_result)
+        if not computed:
+            self._record_cached_answer(question)
         return result
 
+    async def arun(self, question, session_id=None):
+        """异步运行智能体回答问题，与同步版本共用结果缓存"""
+        if session_id or not self.medical_tools.validate_medical_query(question)[0]:
+            return await super().arun(question, session_id)
+
+        computed = []
+
+        async def compute():
+            computed.append(True)
+            return await super(VLLMMedicalAgent, self).arun(question)
+
+        result = await self.answer_cache.aget_or_compute(ANSWER_CACHE_NAME, {"question": question}, compute,
+                                                         cacheable=self._is_cacheable_result)
+        if not computed:
+            self._record_cached_answer(question)
+        return result
+
+    def _record_cached_answer(self, question):
+        """缓存命中（或合并到进行中的相同问题）时没有模型调用，本次请求的预算消耗和token用量记为0"""
+        debug(f"从缓存中获取问题答案: {query_normalizer.cache_key(question)}")
+        set_request_value("budget", self.budget.new_tracker().to_dict())
+        get_request_usage()
+
 
 if __name__ == "__main__":
     # 创建基于VLLM的医疗智能体实例
@@ -16,7 +16,7 @@ if os.path.exists(dotenv_path):
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 # 导入日志模块
-from hengline.api.medical_api import register_routes, startup
+from hengline.api.medical_api import register_routes, startup, shutdown
 
 # 存储从命令行传递的智能体类型
 global_agent_type = None
@@ -35,6 +35,12 @@ def startup_event():
     startup(global_agent_type)
 
 
+# 停止时释放资源
+@app.on_event("shutdown")
+async def shutdown_event():
+    await shutdown()
+
+
 # 设置全局智能体类型的函数
 def set_global_agent_type(agent_type: str):
     """设置全局智能体类型"""
@@ -1,9 +1,11 @@
 import json
 import os
 import sys
+import time
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
@@ -12,24 +14,50 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'
 from hengline.logger import info, error
 
 # 导入配置读取器和智能体工厂
+from hengline.config import config_reader
 from hengline.agent.medical_agent import MedicalAgentFactory
+from hengline.agent.backend_pool import BackendPool
+from hengline.agent.http_clients import http_client_factory
+from hengline.agent.llm_hedging import llm_hedger
+from hengline.agent.metrics import metrics, HTTP_REQUESTS, HTTP_LATENCY
+from hengline.agent.request_context import request_scope
+from hengline.agent.tracing import get_request_timings
+from hengline.agent.usage_accounting import get_request_usage, coalesced_usage, usage_accountant
+from hengline.agent.vllm.vllm_local import get_local_engine_stats
+from hengline.agent.ollama.ollama_runtime import get_ollama_stats
+from hengline.agent.session_manager import session_manager
+from hengline.tools.tool_cache import tool_result_cache
+from hengline.tools.query_normalizer import query_normalizer
+from hengline.tools.web_search import web_search_service
+from hengline.api.request_coalescer import request_coalescer
 from hengline.api.medical_model import QueryRequest, QueryResponse, LLMConfig, ConfigResponse, GenerationRequest, GenerationResponse
 
 # 初始化配置读取器和医疗智能体
 medical_agent = None
 generative_agent = None
+# 启用后端池时，medical_agent和generative_agent为后端池的代理
+backend_pool = None
 
 
 def startup(agent_type: str = None):
     """应用启动时初始化医疗智能体"""
-    global medical_agent, generative_agent
+    global medical_agent, generative_agent, backend_pool
     try:
         info("正在初始化医疗智能体...")
         # 确定使用的智能体类型
         agent_type = agent_type if agent_type else config_reader.get_all_config().get("default_llm", "ollama")
         info(f"使用 {agent_type} 类型的智能体")
-        # 使用工厂创建相应类型的智能体
-        medical_agent, generative_agent = MedicalAgentFactory.create_agent(agent_type)
+
+        pool_config = config_reader.get_module_config("backend_pool")
+        if pool_config.get("enabled", False):
+            # 后端池：指定的类型优先，失败时按配置顺序转移到其他后端，其余后端在首次使用时创建
+            backend_pool = BackendPool(pool_config, MedicalAgentFactory.create_agent, primary=agent_type)
+            backend_pool.warm_up()
+            medical_agent, generative_agent = backend_pool.medical_agent, backend_pool.generative_agent
+            info(f"已启用模型后端池: {', '.join(backend_pool.backends)}")
+        else:
+            # 使用工厂创建相应类型的智能体
+            medical_agent, generative_agent = MedicalAgentFactory.create_agent(agent_type)
         info("医疗智能体初始化成功")
 
         # 对于生成式智能体，额外记录支持的功能
@@ -39,10 +67,95 @@ def startup(agent_type: str = None):
         # 即使初始化失败，API仍会启动，但调用时会返回错误
 
 
+async def shutdown():
+    """应用停止时释放会话存储的数据库连接、网络搜索和模型客户端的连接池"""
+    try:
+        await session_manager.aclose()
+    except Exception as e:
+        error(f"关闭会话存储时出错: {str(e)}")
+
+    try:
+        await web_search_service.aclose()
+    except Exception as e:
+        error(f"关闭网络搜索服务时出错: {str(e)}")
+
+    try:
+        await http_client_factory.aclose()
+    except Exception as e:
+        error(f"关闭HTTP连接池时出错: {str(e)}")
+
+
+def _format_sse(event: str, data) -> str:
+    """将事件格式化为SSE文本"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_event_stream(http_request: Request, events, request_id: str = None):
+    """将智能体事件流转换为SSE输出，客户端断开时关闭事件流以取消上游生成
+
+    事件流在请求上下文中消费，结束后以usage事件返回本次请求的token用量。
+    """
+    with request_scope(request_id) as context:
+        context.set("endpoint", http_request.url.path)
+        try:
+            async for event in events:
+                if await http_request.is_disconnected():
+                    info(f"客户端已断开连接，取消上游生成: {request_id}")
+                    return
+
+                data = dict(event["data"])
+                if request_id:
+                    data["request_id"] = request_id
+                yield _format_sse(event["event"], data)
+
+            usage = get_request_usage()
+            if request_id:
+                usage["request_id"] = request_id
+            yield _format_sse("usage", usage)
+        finally:
+            # 关闭生成器会向上游传播取消，终止仍在进行的流式生成
+            await events.aclose()
+
+
+def _sse_response(http_request: Request, events, request_id: str = None) -> StreamingResponse:
+    """创建SSE流式响应"""
+    return StreamingResponse(
+        _sse_event_stream(http_request, events, request_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # API路由
 def register_routes(app: FastAPI):
     """注册所有API路由"""
 
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        """记录各接口的请求数和端到端耗时，按路由模板归类避免路径参数产生过多标签"""
+        start_time = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(endpoint=endpoint, status=status_code)
+            HTTP_LATENCY.observe(time.perf_counter() - start_time, endpoint=endpoint)
+
+    @app.get("/api/metrics", summary="运行指标", description="以Prometheus文本格式输出各阶段耗时、模型调用和API请求的指标",
+             response_class=PlainTextResponse)
+    def get_metrics():
+        """以Prometheus文本格式输出指标，供Prometheus抓取"""
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get("/api/usage", summary="token用量", description="按接口、后端、模型和生成类型汇总的token用量、生成速度和估算费用")
+    def get_usage():
+        """返回进程启动以来的token用量汇总"""
+        return usage_accountant.get_stats()
+
     @app.get("/api/health", summary="健康检查", description="检查API和智能体的健康状态")
     def health_check():
         """检查API和智能体的健康状态"""
@@ -50,6 +163,61 @@ def register_routes(app: FastAPI):
             "api_status": "running",
             "agent_status": "initialized" if medical_agent is not None else "not initialized"
         }
+
+        # 查询路由统计：各路径的请求数和耗时
+        router = getattr(medical_agent, "router", None)
+        if router is not None:
+            status["routing"] = router.get_stats()
+
+        # 各模型后端的熔断器状态和健康度
+        if backend_pool is not None:
+            status["backends"] = backend_pool.get_stats()
+
+        # 检索预取的命中统计
+        prefetcher = getattr(medical_agent, "prefetcher", None)
+        if prefetcher is not None:
+            status["prefetch"] = prefetcher.get_stats()
+
+        # 各工具的并发、调用次数、错误率和耗时
+        tool_registry = getattr(medical_agent, "tool_registry", None)
+        if tool_registry is not None:
+            status["tools"] = tool_registry.get_stats()
+
+        # 工具结果缓存的命中统计
+        status["tool_cache"] = tool_result_cache.get_stats()
+
+        # 相同请求的合并统计
+        status["coalescing"] = request_coalescer.get_stats()
+
+        # 查询规范化的缓存命中情况
+        status["query_normalization"] = query_normalizer.get_stats()
+
+        # 网络搜索的缓存命中、重试和超时统计
+        status["web_search"] = web_search_service.get_stats()
+
+        # 进程内vLLM引擎的批次大小、排队长度和等待时间
+        local_engines = get_local_engine_stats()
+        if local_engines:
+            status["vllm_local"] = local_engines
+
+        # Ollama服务的就绪耗时、模型加载耗时和保活情况
+        ollama_runtimes = get_ollama_stats()
+        if ollama_runtimes:
+            status["ollama"] = ollama_runtimes
+
+        # 各模型服务连接池的请求数、新建连接数和连接复用率
+        status["http_pools"] = http_client_factory.get_stats()
+
+        # 对冲请求的次数和胜出率
+        status["hedging"] = llm_hedger.get_stats()
+
+        # 各提示链的调用次数和耗时
+        prompt_stats = {}
+        for name, agent in (("medical", medical_agent), ("generative", generative_agent)):
+            prompts = getattr(agent, "prompts", None)
+            if prompts is not None:
+                prompt_stats[name] = prompts.get_stats()
+        status["prompt_chains"] = prompt_stats
         return status
 
     @app.put("/api/config", response_model=ConfigResponse, summary="更新LLM配置", description="更新LLM的配置信息")
@@ -58,7 +226,7 @@ def register_routes(app: FastAPI):
         try:
             # 声明全局变量
             global config_reader
-            global medical_agent
+            global medical_agent, generative_agent
 
             # 从配置中读取默认的LLM类型
             default_llm = config_reader.get_value("default_llm", "ollama")
@@ -93,7 +261,11 @@ def register_routes(app: FastAPI):
             # 重新初始化医疗智能体
             try:
                 info("更新配置后，重新初始化医疗智能体...")
-                medical_agent = MedicalAgentFactory.create_agent(default_llm)
+                if backend_pool is not None:
+                    # 后端池中该后端的智能体在下次使用时按新配置重新创建
+                    backend_pool.reset(default_llm)
+                else:
+                    medical_agent, generative_agent = MedicalAgentFactory.create_agent(default_llm)
                 info("医疗智能体重新初始化成功")
             except Exception as e:
                 error(f"医疗智能体重新初始化失败: {str(e)}")
@@ -108,22 +280,50 @@ def register_routes(app: FastAPI):
             raise HTTPException(status_code=500, detail=f"更新配置文件时发生错误: {str(e)}")
 
     @app.post("/api/query", response_model=QueryResponse, summary="查询医疗智能体", description="向医疗智能体发送问题并获取回答")
-    def query_agent(request: QueryRequest):
-        """向医疗智能体发送问题并获取回答"""
+    async def query_agent(request: QueryRequest):
+        """向医疗智能体发送问题并获取回答
+
+        使用异步处理函数，等待LLM响应期间不占用线程池线程。
+        """
         if medical_agent is None:
             raise HTTPException(status_code=503, detail="医疗智能体未初始化，请稍后再试")
 
         if not request.question or request.question.strip() == "":
             raise HTTPException(status_code=400, detail="问题不能为空")
 
+        agent = medical_agent
+
+        async def answer():
+            # 异步调用医疗智能体回答问题，请求上下文用于收集预算消耗、各阶段耗时等附加信息
+            with request_scope(request.request_id) as context:
+                context.set("endpoint", "/api/query")
+                timings = get_request_timings()
+                answer_text = await agent.arun(request.question, session_id=request.session_id)
+                usage = get_request_usage()
+            return answer_text, context.get("budget"), timings.to_dict(), usage, request.request_id
+
         try:
-            # 调用医疗智能体回答问题
-            result = medical_agent.run(request.question)
+            if request.session_id:
+                # 会话请求依赖各自的对话历史，不与其他请求合并
+                result, budget, timings, usage, _ = await answer()
+            else:
+                # 相同问题的并发请求合并为一次智能体调用，被合并的请求返回实际执行的那次调用的耗时，
+                # 预算和token用量由实际执行的请求承担，被合并的请求不返回预算，用量计为0
+                key = request_coalescer.make_key("query", getattr(agent, "agent_type", None), request.question)
+                (result, budget, timings, usage, leader_request_id), coalesced = await request_coalescer.run_shared(
+                    "query", key, answer)
+                if coalesced:
+                    budget = None
+                    usage = coalesced_usage(leader_request_id)
 
             # 构建响应
             response = QueryResponse(
                 answer=result,
                 request_id=request.request_id,
+                session_id=request.session_id,
+                budget=budget,
+                timings=timings if request.include_timings else None,
+                usage=usage,
                 timestamp=datetime.now().isoformat()
             )
 
@@ -138,7 +338,7 @@ def register_routes(app: FastAPI):
             raise HTTPException(status_code=500, detail=f"处理请求时发生错误: {str(e)}")
 
     @app.post("/api/generate", response_model=GenerationResponse, summary="生成医疗内容", description="生成指定主题的医疗内容")
-    def generate_content(request: GenerationRequest):
+    async def generate_content(request: GenerationRequest):
         """生成指定主题的医疗内容"""
         if generative_agent is None:
             raise HTTPException(status_code=503, detail="医疗智能体未初始化，请稍后再试")
@@ -148,23 +348,34 @@ def register_routes(app: FastAPI):
 
         try:
             # 检查是否是生成式智能体
-            if not hasattr(generative_agent, "generate_content"):
+            if not hasattr(generative_agent, "agenerate_content"):
                 # 获取当前使用的智能体类型
                 agent_type = config_reader.get_all_config().get("default_llm", "ollama")
                 raise HTTPException(status_code=400,
                                     detail=f"当前使用的是{agent_type}类型智能体，不支持生成式功能。请切换到generative类型智能体。")
 
-            # 调用生成式智能体生成内容
-            result = generative_agent.generate_content(
-                topic=request.question,
-                generation_type=request.type
-            )
+            # 异步调用生成式智能体生成内容，相同主题和生成类型的并发请求合并为一次生成
+            agent = generative_agent
+
+            async def generate():
+                with request_scope(request.request_id) as context:
+                    context.set("endpoint", "/api/generate")
+                    content = await agent.agenerate_content(topic=request.question, generation_type=request.type)
+                    return content, get_request_usage(), request.request_id
+
+            key = request_coalescer.make_key("generate", getattr(agent, "agent_type", None),
+                                             request.question, request.type)
+            (result, usage, leader_request_id), coalesced = await request_coalescer.run_shared(
+                "generate", key, generate)
+            if coalesced:
+                usage = coalesced_usage(leader_request_id)
 
             # 构建响应
             response = GenerationResponse(
                 answer=result,
                 type=request.type,
                 request_id=request.request_id,
+                usage=usage,
                 timestamp=datetime.now().isoformat()
             )
 
@@ -174,3 +385,45 @@ def register_routes(app: FastAPI):
             raise e
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"生成内容时发生错误: {str(e)}")
+
+    @app.post("/api/query/stream", summary="流式查询医疗智能体", description="以SSE方式逐token返回医疗智能体的回答，工具调用进度和来源作为单独的事件发送")
+    async def query_agent_stream(request: QueryRequest, http_request: Request):
+        """以SSE方式向医疗智能体发送问题并流式获取回答"""
+        if medical_agent is None:
+            raise HTTPException(status_code=503, detail="医疗智能体未初始化，请稍后再试")
+
+        if not request.question or request.question.strip() == "":
+            raise HTTPException(status_code=400, detail="问题不能为空")
+
+        if not hasattr(medical_agent, "astream_run"):
+            raise HTTPException(status_code=400, detail="当前智能体不支持流式输出")
+
+        return _sse_response(http_request, medical_agent.astream_run(request.question, session_id=request.session_id),
+                             request.request_id)
+
+    @app.post("/api/generate/stream", summary="流式生成医疗内容", description="以SSE方式逐token返回指定主题的医疗内容")
+    async def generate_content_stream(request: GenerationRequest, http_request: Request):
+        """以SSE方式流式生成指定主题的医疗内容"""
+        if generative_agent is None:
+            raise HTTPException(status_code=503, detail="医疗智能体未初始化，请稍后再试")
+
+        if not request.question or request.question.strip() == "":
+            raise HTTPException(status_code=400, detail="问题不能为空")
+
+        if not hasattr(generative_agent, "astream_content"):
+            raise HTTPException(status_code=400, detail="当前智能体不支持流式生成")
+
+        return _sse_response(
+            http_request,
+            generative_agent.astream_content(topic=request.question, generation_type=request.type),
+            request.request_id
+        )
+
+    @app.delete("/api/sessions/{session_id}", summary="删除会话", description="删除指定会话保存的对话历史和摘要")
+    def delete_session(session_id: str):
+        """删除指定会话保存的对话历史和摘要"""
+        try:
+            session_manager.delete_session(session_id)
+            return {"session_id": session_id, "message": "会话已删除"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"删除会话时发生错误: {str(e)}")
@@ -2,7 +2,7 @@
 import os
 import sys
 
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Any
 
 from pydantic import BaseModel, Field, validator
 
@@ -15,13 +15,22 @@ class QueryRequest(BaseModel):
     """查询请求模型"""
     question: str
     request_id: Optional[str] = None
+    # 会话ID，相同会话的追问可以延续之前的对话上下文
+    session_id: Optional[str] = None
+    # 是否在响应中返回各阶段的耗时
+    include_timings: bool = False
 
 
 class QueryResponse(BaseModel):
     """查询响应模型"""
     answer: str
     request_id: Optional[str] = None
+    session_id: Optional[str] = None
     sources: Optional[str] = None
+    budget: Optional[Dict[str, Any]] = None
+    timings: Optional[Dict[str, Any]] = None
+    # 本次请求的token用量和估算费用
+    usage: Optional[Dict[str, Any]] = None
     timestamp: str
 
 
@@ -64,4 +73,6 @@ class GenerationResponse(BaseModel):
     answer: str
     type: str
     request_id: Optional[str] = None
+    # 本次请求的token用量和估算费用
+    usage: Optional[Dict[str, Any]] = None
     timestamp: str
@@ -0,0 +1,121 @@
+"""@FileName: request_coalescer.py
+@Description: API请求合并，相同问题的并发请求只执行一次智能体调用，其余请求等待同一结果
+@Author: HengLine
+@Time: 2025/10/12 14:50
+"""
+import asyncio
+import os
+import sys
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug
+from hengline.config import config_reader
+from hengline.tools.query_normalizer import query_normalizer
+
+
+class RequestCoalescer:
+    """进行中请求的合并（single-flight）
+
+    热点健康话题出现时，大量相同的 /api/query 或 /api/generate 请求会同时到达。
+    键由请求类型、智能体类型、生成类型和规范化后的问题组成，
+    第一个请求在独立的任务中执行计算，之后到达的相同请求直接等待该任务的结果。
+    计算任务不随某个请求被取消而中止，保证其他等待方仍能拿到结果。
+    """
+
+    def __init__(self, coalescing_config: Dict[str, Any] = None):
+        coalescing_config = coalescing_config or {}
+        self.enabled = coalescing_config.get("enabled", True)
+
+        # (事件循环ID, 键) -> 计算任务
+        self._inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """规范化问题：全角转半角、繁体转简体、去除多余空白和结尾标点，英文统一小写"""
+        return query_normalizer.cache_key(question)
+
+    def make_key(self, kind: str, backend: str, question: str, variant: Optional[str] = None) -> str:
+        return f"{kind}|{backend or ''}|{variant or ''}|{self.normalize(question)}"
+
+    async def run(self, kind: str, key: str, compute: Callable[[], Awaitable[Any]]):
+        """执行计算，相同键的计算正在进行时等待其结果
+
+        Args:
+            kind: 请求类型（query、generate），用于统计
+            key: 由make_key生成的合并键
+            compute: 返回可等待对象的计算函数
+        """
+        result, _ = await self.run_shared(kind, key, compute)
+        return result
+
+    async def run_shared(self, kind: str, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """与run相同，同时返回本次请求是否被合并（等待的是其他请求发起的计算）
+
+        Returns:
+            tuple: (计算结果, 是否被合并)
+        """
+        if not self.enabled:
+            return await compute(), False
+
+        loop = asyncio.get_running_loop()
+        inflight_key = (id(loop), key)
+        with self._lock:
+            task = self._inflight.get(inflight_key)
+            leader = task is None
+            if leader:
+                task = asyncio.ensure_future(compute())
+                self._inflight[inflight_key] = task
+                task.add_done_callback(lambda done: self._on_done(inflight_key, done))
+                self._count(kind, "executed")
+            else:
+                self._count(kind, "coalesced")
+
+        if not leader:
+            debug(f"合并相同的进行中请求: {key}")
+
+        try:
+            # shield保证等待方被取消时计算任务继续执行，其他等待方不受影响
+            return await asyncio.shield(task), not leader
+        except Exception:
+            if leader:
+                with self._lock:
+                    self._count(kind, "errors")
+            raise
+
+    def _on_done(self, inflight_key, task: asyncio.Task):
+        with self._lock:
+            if self._inflight.get(inflight_key) is task:
+                del self._inflight[inflight_key]
+        if not task.cancelled():
+            # 所有等待方都已取消时，避免"exception was never retrieved"警告
+            task.exception()
+
+    def _count(self, kind: str, field: str):
+        """累加统计项，调用方需持有锁"""
+        kind_stats = self._stats.setdefault(kind, {"executed": 0, "coalesced": 0, "errors": 0})
+        kind_stats[field] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各请求类型的实际执行次数、被合并的请求数和当前进行中的计算数"""
+        with self._lock:
+            kinds = {}
+            for kind, kind_stats in self._stats.items():
+                total = kind_stats["executed"] + kind_stats["coalesced"]
+                kinds[kind] = dict(kind_stats)
+                kinds[kind]["coalesced_rate"] = round(kind_stats["coalesced"] / total, 4) if total else 0.0
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._inflight),
+                "requests": kinds
+            }
+
+
+# 全局请求合并器
+request_coalescer = RequestCoalescer(config_reader.get_module_config("request_coalescing"))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查询规范化性能测试
+
+用法: python hengline/demo/query_normalizer_benchmark.py [--queries 200000]
+
+用常见问题生成繁体、全角、多余空白、重复标点等写法，比较：
+1. str.translate单表转换与逐字符查表的吞吐量；
+2. 完整规范化及缓存命中时的吞吐量；
+3. 原缓存键（strip().lower()）与规范化缓存键各产生多少个不同的键。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from hengline.tools.query_normalizer import QueryNormalizer, query_normalizer
+
+BASE_QUESTIONS = [
+    "高血压有哪些症状？",
+    "糖尿病患者饮食需要注意什么？",
+    "感冒发烧头痛应该吃什么药？",
+    "什么是冠心病？",
+    "如何预防流感？",
+    "孩子咳嗽晚上睡不着怎么办？",
+    "COVID-19疫苗有哪些副作用？",
+    "体温39度需要去医院吗？",
+    "颈椎病的治疗方法",
+    "胃痛和胃溃疡有什么区别？",
+]
+
+
+def make_variants(normalizer, count):
+    """生成带有繁体、全角、空白和重复标点等差异的问题写法"""
+    s2t = {}
+    for traditional, simplified in normalizer.t2s_map.items():
+        s2t.setdefault(simplified, traditional)
+    fullwidth = {chr(code): chr(code + 0xFEE0) for code in range(0x21, 0x7F)}
+
+    rng = random.Random(0)
+    variants = []
+    for _ in range(count):
+        text = rng.choice(BASE_QUESTIONS)
+        if rng.random() < 0.4:
+            text = "".join(s2t.get(char, char) for char in text)
+        if rng.random() < 0.3:
+            text = "".join(fullwidth.get(char, char) for char in text)
+        if rng.random() < 0.3:
+            text = text.replace("？", "？？？") if rng.random() < 0.5 else text.rstrip("？") + "?!"
+        if rng.random() < 0.3:
+            # 在中文字符旁插入空白或零宽字符
+            position = rng.choice([index for index, char in enumerate(text) if "\u4e00" <= char <= "\u9fff"])
+            text = text[:position] + rng.choice([" ", "　", "  ", "\u200b"]) + text[position:]
+        if rng.random() < 0.2:
+            text = "  " + text.upper() + " "
+        variants.append(text)
+    return variants
+
+
+def per_char_normalize(text, mapping):
+    """对照组：逐字符查表后再拼接"""
+    return "".join(mapping.get(char, char) for char in text)
+
+
+def timed(func, items):
+    start_time = time.perf_counter()
+    for item in items:
+        func(item)
+    return time.perf_counter() - start_time
+
+
+def run_benchmark(query_count):
+    normalizer = QueryNormalizer(query_normalizer.t2s_map, cache_size=4096)
+    queries = make_variants(normalizer, query_count)
+    char_mapping = {chr(code): value for code, value in normalizer._table.items() if value is not None}
+
+    # 预热
+    for query in queries[:1000]:
+        normalizer._normalize(query)
+
+    table = normalizer._table
+    rows = [
+        ("逐字符查表", timed(lambda query: per_char_normalize(query, char_mapping), queries)),
+        ("str.translate", timed(lambda query: query.translate(table), queries)),
+        ("完整规范化", timed(normalizer._normalize, queries)),
+        ("缓存命中", timed(normalizer.normalize, queries)),
+        ("缓存键", timed(normalizer.cache_key, queries)),
+    ]
+
+    print(f"测试问题: {len(queries)} 条（{len(BASE_QUESTIONS)} 个问题的不同写法），繁体映射 {len(normalizer.t2s_map)} 字")
+    print(f"{'方式':<14} | {'耗时(ms)':>9} | {'QPS':>10} | {'单条(μs)':>9}")
+    print("-" * 52)
+    for name, run_time in rows:
+        print(f"{name:<14} | {run_time * 1000:>9.1f} | {len(queries) / run_time:>10.0f} | "
+              f"{run_time / len(queries) * 1e6:>9.2f}")
+
+    old_keys = {query.strip().lower() for query in queries}
+    new_keys = {normalizer.cache_key(query) for query in queries}
+    print(f"\n{len(BASE_QUESTIONS)} 个问题产生的不同缓存键: strip().lower() {len(old_keys)} 个，规范化后 {len(new_keys)} 个")
+
+    print("\n示例:")
+    for query in queries[:6]:
+        print(f"  {query!r} -> {normalizer.cache_key(query)!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查询规范化性能测试")
+    parser.add_argument("--queries", type=int, default=200000, help="测试问题条数")
+    args = parser.parse_args()
+    run_benchmark(args.queries)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+症状抽取性能对比：Aho-Corasick自动机 vs 正则多选分支
+
+用法: python hengline/demo/symptom_extractor_benchmark.py [--patterns 5000 10000 20000] [--texts 2000]
+
+在真实词表的基础上补充随机生成的写法，得到不同规模的模式集合，
+分别比较构建耗时和抽取吞吐量，并校验两种方式的匹配结果一致。
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from hengline.tools.symptom_extractor import SymptomExtractor, PROJECT_ROOT
+
+# 随机写法使用的常用汉字
+COMMON_CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+
+
+def load_corpus(limit):
+    """从知识库文档中按句切分得到测试文本，并补充若干典型的患者描述"""
+    texts = [
+        "我发烧咳嗽，而且头痛，应该怎么办",
+        "无发热、咳嗽，有头痛和恶心想吐",
+        "最近总是拉肚子，肚子疼，没有胃口",
+        "患者否认胸痛，但有呼吸困难和心慌",
+        "腰酸背痛，腿抽筋，晚上睡不着",
+    ]
+    data_dir = os.path.join(PROJECT_ROOT, "data")
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith(".txt"):
+            continue
+        with open(os.path.join(data_dir, filename), encoding="utf-8") as f:
+            texts.extend(sentence.strip() for sentence in re.split(r"[。\n]", f.read()) if len(sentence.strip()) > 4)
+    random.Random(0).shuffle(texts)
+    return (texts * (limit // max(len(texts), 1) + 1))[:limit]
+
+
+def build_lexicon(base_lexicon, target_patterns):
+    """在真实词表的基础上补充随机写法，直到写法总数达到目标规模"""
+    lexicon = {canonical: list(variants) for canonical, variants in base_lexicon.items()}
+    total = sum(len(variants) + 1 for variants in lexicon.values())
+    rng = random.Random(42)
+    index = 0
+    while total < target_patterns:
+        variants = ["".join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(3, 6))) for _ in range(20)]
+        lexicon[f"合成症状{index}"] = variants
+        total += len(variants) + 1
+        index += 1
+    return lexicon
+
+
+class RegexExtractor:
+    """对照组：所有写法组成一个多选分支正则（长写法在前），匹配结果查表得到标准名称"""
+
+    def __init__(self, variant_to_canonical):
+        self.variant_to_canonical = variant_to_canonical
+        variants = sorted(variant_to_canonical, key=len, reverse=True)
+        self.regex = re.compile("|".join(re.escape(variant) for variant in variants))
+
+    def find(self, text):
+        return [(match.start(), match.end()) for match in self.regex.finditer(text)]
+
+    def extract(self, text):
+        symptoms = []
+        for match in self.regex.findall(text):
+            canonical = self.variant_to_canonical[match]
+            if canonical not in symptoms:
+                symptoms.append(canonical)
+        return symptoms
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def run_benchmark(pattern_sizes, text_count):
+    base_lexicon = SymptomExtractor.load_lexicon(os.path.join(PROJECT_ROOT, "data/lexicon/symptoms.tsv"))
+    texts = load_corpus(text_count)
+    chars = sum(len(text) for text in texts)
+    print(f"测试文本: {len(texts)} 条, {chars} 字")
+    print(f"{'写法数':>8} | {'方式':<14} | {'构建(ms)':>9} | {'抽取(ms)':>9} | {'条/秒':>10} | {'万字/秒':>8}")
+    print("-" * 74)
+
+    for size in pattern_sizes:
+        lexicon = build_lexicon(base_lexicon, size)
+        extractor, build_ac = timed(SymptomExtractor, lexicon)
+        regex_extractor, build_regex = timed(RegexExtractor, extractor.variant_to_canonical)
+        automaton = extractor._automaton
+
+        # 两种方式的匹配位置应一致（均为从左到右、取最长、不重叠）
+        for text in texts[:500]:
+            ac_spans = [(start, end) for start, end, _ in automaton.find_longest(text)]
+            assert ac_spans == regex_extractor.find(text), text
+
+        # 先各执行一遍预热
+        extractor.extract_batch(texts[:100])
+        [regex_extractor.extract(text) for text in texts[:100]]
+
+        rows = [
+            ("Aho-Corasick", build_ac, timed(lambda: [automaton.find_longest(text) for text in texts])[1]),
+            ("AC+否定识别", build_ac, timed(extractor.extract_batch, texts)[1]),
+            ("正则多选分支", build_regex, timed(lambda: [regex_extractor.extract(text) for text in texts])[1]),
+        ]
+        written = len(extractor.variant_to_canonical)
+        for name, build_time, run_time in rows:
+            print(f"{written:>8} | {name:<14} | {build_time * 1000:>9.1f} | {run_time * 1000:>9.1f} | "
+                  f"{len(texts) / run_time:>10.0f} | {chars / run_time / 10000:>8.1f}")
+        print("-" * 74)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="症状抽取性能对比")
+    parser.add_argument("--patterns", type=int, nargs="+", default=[5000, 10000, 20000], help="写法数量（不足时补充随机写法）")
+    parser.add_argument("--texts", type=int, default=2000, help="测试文本条数")
+    args = parser.parse_args()
+    run_benchmark(args.patterns, args.texts)
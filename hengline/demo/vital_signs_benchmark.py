@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生命体征抽取性能测试
+
+用法: python hengline/demo/vital_signs_benchmark.py [--texts 20000]
+
+分别测试不含数值的普通问题、含有生命体征的问题，以及抽取后交给分诊引擎的完整耗时。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from hengline.tools.vital_signs import vital_sign_parser
+from hengline.tools.triage_engine import triage_engine
+
+PLAIN_TEXTS = [
+    "高血压有哪些症状？",
+    "糖尿病患者饮食需要注意什么",
+    "我发烧咳嗽，而且头痛，应该怎么办",
+    "最近总是拉肚子，肚子疼，没有胃口",
+    "感冒了可以吃什么药",
+    "孩子晚上睡觉打呼噜正常吗",
+]
+
+VITAL_TEMPLATES = [
+    "体温{t}度，咳嗽两天",
+    "发烧到{tc}，头痛",
+    "血压{s}/{d}，头晕心慌",
+    "高压{s}低压{d}，需要吃药吗",
+    "心率{h}次/分，胸闷",
+    "脉搏{h}，血氧{o}%，呼吸{r}次/分",
+    "空腹血糖 {g} mmol/L 正常吗",
+    "体温３９．{f}℃，血压：{s}／{d}ｍｍＨｇ",
+]
+
+CHINESE_TEMPERATURES = ["三十八度五", "三十九度", "三十九度五", "四十度", "三十七点八度"]
+
+
+def build_texts(count, with_vitals):
+    rng = random.Random(0)
+    texts = []
+    for _ in range(count):
+        if not with_vitals:
+            texts.append(rng.choice(PLAIN_TEXTS))
+            continue
+        texts.append(rng.choice(VITAL_TEMPLATES).format(
+            t=round(rng.uniform(36.0, 41.5), 1), tc=rng.choice(CHINESE_TEMPERATURES),
+            s=rng.randint(90, 200), d=rng.randint(55, 125), h=rng.randint(45, 160),
+            o=rng.randint(85, 100), r=rng.randint(12, 35), g=round(rng.uniform(3.0, 25.0), 1), f=rng.randint(0, 9)))
+    return texts
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def run_benchmark(text_count):
+    plain_texts = build_texts(text_count, with_vitals=False)
+    vital_texts = build_texts(text_count, with_vitals=True)
+
+    # 预热
+    vital_sign_parser.parse_batch(vital_texts[:100])
+    triage_engine.assess_text_batch(vital_texts[:100])
+
+    rows = [
+        ("不含数值的问题", plain_texts, vital_sign_parser.parse_batch),
+        ("含生命体征的问题", vital_texts, vital_sign_parser.parse_batch),
+        ("抽取+分诊", vital_texts, triage_engine.assess_text_batch),
+    ]
+
+    print(f"测试文本: 每组 {text_count} 条")
+    print(f"{'场景':<14} | {'耗时(ms)':>9} | {'条/秒':>10} | {'单条(μs)':>9} | {'识别数值':>8}")
+    print("-" * 64)
+    for name, texts, func in rows:
+        results, run_time = timed(func, texts)
+        found = sum(len(result) if isinstance(result, list) else len(result.vitals) for result in results)
+        print(f"{name:<14} | {run_time * 1000:>9.1f} | {len(texts) / run_time:>10.0f} | "
+              f"{run_time / len(texts) * 1e6:>9.1f} | {found:>8}")
+
+    print("\n示例:")
+    for text in vital_texts[:len(VITAL_TEMPLATES)]:
+        print(f"  {text} -> {vital_sign_parser.extract(text)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生命体征抽取性能测试")
+    parser.add_argument("--texts", type=int, default=20000, help="每组测试文本条数")
+    args = parser.parse_args()
+    run_benchmark(args.texts)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+vLLM服务客户端性能测试（离线，使用本地模拟服务）
+
+用法: python hengline/demo/vllm_client_benchmark.py [--requests 64] [--latency 0.2] [--token-latency 0.002] [--port 8765]
+
+比较：
+1. 串行请求与共用连接池的并发请求：并发请求同时到达服务端，由vLLM的连续批处理合并生成；
+2. 流式输出的首token耗时，以及一次工具调用的往返。
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import httpx
+import uvicorn
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import tool
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from hengline.agent.vllm.vllm_client import VLLMServerClient, create_vllm_chat_model
+from hengline.demo.vllm_stub_server import create_app
+
+TOPICS = ["高血压的早期症状", "糖尿病饮食注意事项", "流感和感冒的区别", "发烧38度怎么办", "偏头痛的原因",
+          "胃溃疡如何治疗", "颈椎病锻炼方法", "长期失眠怎么办"]
+
+
+@tool
+def extract_symptoms(text: str) -> str:
+    """从用户描述中提取症状"""
+    return f"症状: {text}"
+
+
+def start_stub_server(port, latency, token_latency, max_model_len):
+    """在后台线程中启动模拟服务，等待健康检查通过后返回"""
+    server = uvicorn.Server(uvicorn.Config(create_app("stub-model", latency, token_latency, max_model_len),
+                                           host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    for _ in range(100):
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("模拟服务启动失败")
+
+
+async def run_benchmark_async(llm, prompts, stats_url):
+    rows = []
+
+    start_time = time.perf_counter()
+    for prompt in prompts[:8]:
+        await llm.ainvoke(prompt)
+    sequential = (time.perf_counter() - start_time) / 8 * len(prompts)
+    rows.append(("串行请求（按8个折算）", sequential))
+
+    start_time = time.perf_counter()
+    await llm.abatch(prompts, config={"max_concurrency": len(prompts)})
+    rows.append(("并发请求（共用连接池）", time.perf_counter() - start_time))
+    peak = httpx.get(stats_url).json()["peak_concurrency"]
+
+    # 流式输出的首token耗时
+    start_time = time.perf_counter()
+    first_token = None
+    async for chunk in llm.astream(prompts[0]):
+        if first_token is None and chunk.content:
+            first_token = time.perf_counter() - start_time
+    stream_total = time.perf_counter() - start_time
+
+    # 工具调用往返
+    message = await llm.bind_tools([extract_symptoms]).ainvoke([HumanMessage(content="我头痛发烧两天了")])
+    return rows, peak, first_token, stream_total, message
+
+
+def run_benchmark(request_count, latency, token_latency, port):
+    server = start_stub_server(port, latency, token_latency, max_model_len=4096)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    vllm_config = {"base_url": base_url, "model": "stub-model", "max_tokens": 32, "max_model_len": 4096,
+                   "sampling": {"top_k": 20, "repetition_penalty": 1.05},
+                   "server": {"max_connections": request_count, "max_keepalive_connections": request_count}}
+    llm = create_vllm_chat_model(vllm_config)
+    server_client = VLLMServerClient(base_url, "stub-model", server_config=vllm_config["server"])
+    prompts = [f"请介绍{TOPICS[index % len(TOPICS)]}（{index}）" for index in range(request_count)]
+
+    print(f"模型信息: max_model_len={server_client.get_model_info()['max_model_len']}，"
+          f"健康检查: {server_client.health()}")
+    print(f"请求数: {request_count}，模拟生成延迟: {latency * 1000:.0f}ms + {token_latency * 1000:.1f}ms/token")
+    print(f"{'方式':<22} | {'耗时(ms)':>9} | {'请求/秒':>9}")
+    print("-" * 48)
+
+    rows, peak, first_token, stream_total, message = asyncio.run(
+        run_benchmark_async(llm, prompts, f"http://127.0.0.1:{port}/stats"))
+    for name, run_time in rows:
+        print(f"{name:<22} | {run_time * 1000:>9.1f} | {request_count / run_time:>9.0f}")
+
+    print(f"\n并发请求时服务端的峰值并发数: {peak}")
+    print(f"流式输出: 首token {first_token * 1000:.0f}ms，总耗时 {stream_total * 1000:.0f}ms")
+    print(f"工具调用: {message.tool_calls}")
+
+    # 超长提示由服务端截断，而不是返回400
+    long_answer = llm.invoke("头痛" * 4000)
+    print(f"超长提示（8000字符，max_model_len 4096）: {long_answer.content[:20]}...")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="vLLM服务客户端性能测试")
+    parser.add_argument("--requests", type=int, default=64, help="请求数")
+    parser.add_argument("--latency", type=float, default=0.2, help="每次生成的固定延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="每个token的生成延迟（秒）")
+    parser.add_argument("--port", type=int, default=8765, help="模拟服务端口")
+    args = parser.parse_args()
+    run_benchmark(args.requests, args.latency, args.token_latency, args.port)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模拟vLLM OpenAI兼容服务，用于在没有GPU的环境中测试vLLM客户端
+
+用法: python hengline/demo/vllm_stub_server.py [--port 8001] [--latency 0.05] [--token-latency 0.005] [--max-model-len 4096]
+
+支持的接口：
+1. GET /health、GET /v1/models（返回max_model_len）；
+2. POST /v1/chat/completions：普通和流式（SSE）输出，请求带工具且最后一条是用户消息时返回工具调用；
+3. POST /v1/completions：prompt可以是列表，一次请求返回多个补全，echo为true时补全以提示开头；
+4. GET /stats：请求数和峰值并发数。
+
+延迟模型：每次生成先等待latency（模拟排队和预填充），再按token_latency逐token输出。
+提示超过max_model_len - max_tokens时，与vLLM一样返回400，除非请求设置了truncate_prompt_tokens。
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY = "根据您描述的情况，建议注意休息，多饮水，如症状持续或加重请及时就医。"
+
+
+def count_tokens(text):
+    """粗略的token计数：每个字符算一个token"""
+    return len(text)
+
+
+def create_app(model="stub-model", latency=0.05, token_latency=0.005, max_model_len=4096):
+    app = FastAPI(title="vLLM Stub Server")
+    stats = {"requests": 0, "active": 0, "peak_concurrency": 0, "completions": 0}
+
+    def error_response(message, status_code=400):
+        return JSONResponse(status_code=status_code,
+                            content={"object": "error", "message": message, "type": "BadRequestError",
+                                     "code": status_code})
+
+    def check_length(prompt_tokens, body):
+        """与vLLM一致的长度校验，返回错误信息；设置了truncate_prompt_tokens时截断提示"""
+        max_tokens = body.get("max_tokens") or 16
+        if max_tokens >= max_model_len:
+            return None, f"max_tokens {max_tokens} 超过模型最大长度 {max_model_len}"
+        truncate = body.get("truncate_prompt_tokens")
+        if truncate:
+            prompt_tokens = min(prompt_tokens, truncate)
+        if prompt_tokens + max_tokens > max_model_len:
+            return None, (f"This model's maximum context length is {max_model_len} tokens. However, you requested "
+                          f"{prompt_tokens + max_tokens} tokens ({prompt_tokens} in the messages, "
+                          f"{max_tokens} in the completion).")
+        return prompt_tokens, None
+
+    def reply_tokens(body):
+        max_tokens = body.get("max_tokens") or 16
+        return list(REPLY)[:max_tokens]
+
+    async def track(coroutine):
+        stats["requests"] += 1
+        stats["active"] += 1
+        stats["peak_concurrency"] = max(stats["peak_concurrency"], stats["active"])
+        try:
+            return await coroutine
+        finally:
+            stats["active"] -= 1
+
+    def tool_call_message(tools):
+        """对第一个工具发起调用，参数取自工具定义的必填字段"""
+        function = tools[0]["function"]
+        required = function.get("parameters", {}).get("required", [])
+        arguments = {name: "头痛" for name in required}
+        return {"id": f"chatcmpl-tool-{uuid.uuid4().hex[:16]}", "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)}}
+
+    @app.get("/health")
+    async def health():
+        return {}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list",
+                "data": [{"id": model, "object": "model", "created": int(time.time()), "owned_by": "vllm",
+                          "root": model, "max_model_len": max_model_len}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = "".join(str(message.get("content") or "") for message in messages)
+        prompt_tokens, message = check_length(count_tokens(prompt), body)
+        if message:
+            return error_response(message)
+
+        tools = body.get("tools") or []
+        use_tool = bool(tools) and body.get("tool_choice") != "none" and messages and messages[-1]["role"] == "user"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        tokens = [] if use_tool else reply_tokens(body)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens) or 1,
+                 "total_tokens": prompt_tokens + (len(tokens) or 1)}
+
+        def chunk(delta, finish_reason=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        if body.get("stream"):
+            async def events():
+                stats["active"] += 1
+                stats["requests"] += 1
+                stats["peak_concurrency"] = max(stats["peak_concurrency"], stats["active"])
+                try:
+                    await asyncio.sleep(latency)
+                    yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n"
+                    if use_tool:
+                        call = tool_call_message(tools)
+                        yield f"data: {json.dumps(chunk({'tool_calls': [dict(call, index=0)]}), ensure_ascii=False)}\n\n"
+                    for token in tokens:
+                        await asyncio.sleep(token_latency)
+                        yield f"data: {json.dumps(chunk({'content': token}), ensure_ascii=False)}\n\n"
+                    yield f"data: {json.dumps(chunk({}, 'tool_calls' if use_tool else 'stop'))}\n\n"
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        yield f"data: {json.dumps(dict(chunk({}), choices=[], usage=usage))}\n\n"
+                    yield "data: [DONE]\n\n"
+                finally:
+                    stats["active"] -= 1
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        async def generate():
+            await asyncio.sleep(latency + token_latency * len(tokens))
+            if use_tool:
+                reply = {"role": "assistant", "content": None, "tool_calls": [tool_call_message(tools)]}
+            else:
+                reply = {"role": "assistant", "content": "".join(tokens)}
+            return {"id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": reply,
+                                 "finish_reason": "tool_calls" if use_tool else "stop"}],
+                    "usage": usage}
+
+        return await track(generate())
+
+    @app.post("/v1/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        prompts = body.get("prompt", "")
+        prompts = prompts if isinstance(prompts, list) else [prompts]
+        prompt_token_counts = []
+        for prompt in prompts:
+            prompt_tokens, message = check_length(count_tokens(str(prompt)), body)
+            if message:
+                return error_response(message)
+            prompt_token_counts.append(prompt_tokens)
+        tokens = reply_tokens(body)
+
+        async def generate():
+            # 同一请求中的提示作为一个批次生成，耗时与单个提示相同
+            await asyncio.sleep(latency + token_latency * len(tokens))
+            stats["completions"] += len(prompts)
+            return {"id": f"cmpl-{uuid.uuid4().hex}", "object": "text_completion", "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": index, "text": (str(prompt) if body.get("echo") else "") + "".join(tokens),
+                                 "finish_reason": "length"}
+                                for index, prompt in enumerate(prompts)],
+                    "usage": {"prompt_tokens": sum(prompt_token_counts),
+                              "completion_tokens": len(tokens) * len(prompts),
+                              "total_tokens": sum(prompt_token_counts) + len(tokens) * len(prompts)}}
+
+        return await track(generate())
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="模拟vLLM OpenAI兼容服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8001, help="监听端口")
+    parser.add_argument("--model", default="stub-model", help="模型名")
+    parser.add_argument("--latency", type=float, default=0.05, help="每次生成的固定延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="每个token的生成延迟（秒）")
+    parser.add_argument("--max-model-len", type=int, default=4096, help="模型最大长度")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.model, args.latency, args.token_latency, args.max_model_len),
+                host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+网络搜索服务性能测试（离线，使用本地夹具提供方）
+
+用法: python hengline/demo/web_search_benchmark.py [--requests 200] [--workers 8] [--latency 0.2]
+
+比较：
+1. 原方式：每次搜索在工作线程中同步执行，线程在搜索期间被占用；
+2. 搜索服务：搜索在后台事件循环中并发执行，相同查询合并，结果缓存；
+3. 慢速提供方：延迟超过截止时间时，调用方在截止时间返回而不是一直等待。
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from hengline.tools.web_search import FixtureSearchProvider, WebSearchService, format_results
+
+QUERIES = [
+    "高血压的早期症状", "糖尿病饮食注意事项", "流感和感冒的区别", "发烧38度怎么办", "新冠疫苗副作用",
+    "冠心病胸痛的表现", "胃溃疡如何治疗", "颈椎病锻炼方法", "偏头痛的原因", "拉肚子吃什么", "长期失眠怎么办",
+    "高血壓的早期症狀", "糖尿病飲食注意事項",
+]
+
+
+def build_queries(count, distinct):
+    rng = random.Random(0)
+    pool = [f"{query}{index}" for index, query in enumerate(QUERIES * (distinct // len(QUERIES) + 1))][:distinct]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def run_blocking(provider, queries, workers):
+    """对照组：每个请求在线程中同步搜索，不缓存不合并"""
+    def search(query):
+        return format_results(asyncio.run(provider.asearch(query, 5)))
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(search, queries))
+    return time.perf_counter() - start_time
+
+
+def run_service(service, queries, workers):
+    """同步调用方通过搜索服务搜索"""
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(service.search, queries))
+    return time.perf_counter() - start_time
+
+
+async def run_service_async(service, queries):
+    """异步调用方通过搜索服务并发搜索"""
+    start_time = time.perf_counter()
+    await asyncio.gather(*[service.asearch(query) for query in queries])
+    return time.perf_counter() - start_time
+
+
+def run_benchmark(request_count, workers, latency):
+    provider = FixtureSearchProvider.from_file("data/search/fixtures.json", latency=latency)
+    queries = build_queries(request_count, distinct=max(1, request_count // 4))
+    distinct = len(set(queries))
+
+    print(f"请求数: {request_count}（不同查询 {distinct} 个），工作线程: {workers}，模拟搜索延迟: {latency * 1000:.0f}ms")
+    print(f"{'方式':<22} | {'耗时(ms)':>9} | {'请求/秒':>9}")
+    print("-" * 48)
+
+    rows = [("线程中同步搜索", run_blocking(provider, queries, workers))]
+
+    service = WebSearchService(provider, timeout=latency * 10 + 1, cache_ttl=300)
+    rows.append(("搜索服务（同步调用）", run_service(service, queries, workers)))
+    stats = service.get_stats()
+
+    service.clear_cache()
+    rows.append(("搜索服务（异步调用）", asyncio.run(run_service_async(service, queries))))
+    rows.append(("搜索服务（缓存命中）", run_service(service, queries, workers)))
+
+    for name, run_time in rows:
+        print(f"{name:<22} | {run_time * 1000:>9.1f} | {request_count / run_time:>9.0f}")
+    print(f"\n同步调用统计: 提供方请求 {stats['provider_calls']} 次，缓存命中 {stats['cache_hits']} 次，"
+          f"合并 {stats['coalesced']} 次")
+
+    # 慢速提供方：延迟远超截止时间
+    slow_service = WebSearchService(FixtureSearchProvider.from_file("data/search/fixtures.json", latency=5.0),
+                                    timeout=0.5, retries=0)
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        answers = list(executor.map(slow_service.search, QUERIES[:workers]))
+    print(f"\n慢速提供方（延迟5秒，截止时间0.5秒）: {len(answers)} 个请求在 "
+          f"{(time.perf_counter() - start_time) * 1000:.0f}ms 内全部返回，超时 {slow_service.get_stats()['timeouts']} 次")
+
+    print("\n示例:")
+    print(service.search("高血压有哪些症状")[:120])
+
+    asyncio.run(service.aclose())
+    asyncio.run(slow_service.aclose())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="网络搜索服务性能测试")
+    parser.add_argument("--requests", type=int, default=200, help="请求数")
+    parser.add_argument("--workers", type=int, default=8, help="同步调用的工作线程数")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟的搜索延迟（秒）")
+    args = parser.parse_args()
+    run_benchmark(args.requests, args.workers, args.latency)
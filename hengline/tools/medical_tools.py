@@ -1,37 +1,17 @@
 import re
 from datetime import datetime
 
+from hengline.tools.query_normalizer import query_normalizer
+from hengline.tools.symptom_extractor import symptom_extractor
+from hengline.tools.triage_engine import triage_engine
+from hengline.tools.vital_signs import vital_sign_parser
+
 class MedicalTools:
     # 预编译正则表达式以提高性能
-    _symptom_regex = None
     _inappropriate_regex = None
     
     # 静态初始化，只执行一次
-    if _symptom_regex is None:
-        # 症状模式映射表
-        symptom_map = {
-            '发热': ['发热', '发烧'],
-            '咳嗽': ['咳嗽'],
-            '头痛': ['头痛'],
-            '乏力': ['乏力', '疲劳'],
-            '恶心': ['恶心', '呕吐'],
-            '腹泻': ['腹泻'],
-            '腹痛': ['腹痛'],
-            '胸痛': ['胸痛'],
-            '呼吸困难': ['呼吸困难'],
-            '头晕': ['头晕'],
-            '关节痛': ['关节痛'],
-            '肌肉痛': ['肌肉痛'],
-            '喉咙痛': ['喉咙痛'],
-            '鼻塞': ['鼻塞', '流鼻涕'],
-            '皮疹': ['皮疹'],
-            '出血': ['出血']
-        }
-        
-        # 预编译症状正则表达式
-        symptom_patterns = '|'.join(['|'.join(v) for v in symptom_map.values()])
-        _symptom_regex = re.compile(symptom_patterns)
-        
+    if _inappropriate_regex is None:
         # 预编译不适当问题的正则表达式
         inappropriate_patterns = '|'.join([
             '安乐死', '自杀', '毒品', '违禁药物',
@@ -41,46 +21,60 @@ class MedicalTools:
     
     @staticmethod
     def extract_symptoms(text):
-        """从文本中提取症状信息 - 优化版"""
+        """从文本中提取症状信息，返回按出现顺序去重的标准症状名称，被否定的症状（如"无发热"）不计入"""
         if not text:
             return []
-        
-        # 使用预编译的正则表达式和集合去重
-        symptoms = set()
-        matches = MedicalTools._symptom_regex.findall(text)
-        
-        # 将匹配的症状映射到标准名称
-        for match in matches:
-            for standard_name, variants in MedicalTools.symptom_map.items():
-                if match in variants:
-                    symptoms.add(standard_name)
-                    break
-        
-        return list(symptoms)
-    
+
+        # 症状词表编译为Aho-Corasick自动机，匹配到的写法直接查表得到标准名称
+        return symptom_extractor.extract(text)
+
     @staticmethod
-    def assess_severity(symptoms):
-        """评估症状严重程度 - 优化版"""
-        if not symptoms:
-            return "无明显症状"
-        
-        # 转换为集合以加速查找
-        symptom_set = set(symptoms)
-        
-        # 严重症状集合
-        severe_symptoms = {'胸痛', '呼吸困难', '严重出血', '意识丧失', '高热(>40℃)'}
-        
-        # 中等严重症状集合
-        moderate_symptoms = {'持续高热(38.5-40℃)', '剧烈头痛', '严重呕吐', '严重腹泻'}
-        
-        # 使用集合交集快速判断
-        if severe_symptoms.intersection(symptom_set):
-            return "严重：建议立即就医"
-        elif moderate_symptoms.intersection(symptom_set):
-            return "中等：建议尽快就医"
-        
-        return "轻微：可以先观察，如症状加重请及时就医"
-    
+    def extract_symptoms_batch(texts):
+        """批量提取症状信息"""
+        return symptom_extractor.extract_batch(texts)
+
+    @staticmethod
+    def extract_vital_signs(text):
+        """从文本中提取体温、血压、心率、呼吸、血氧和血糖等数值，返回带单位和位置的列表"""
+        return [reading.to_dict() for reading in vital_sign_parser.parse(text)]
+
+    @staticmethod
+    def extract_vital_signs_batch(texts):
+        """批量提取生命体征，每条文本返回 {指标: 数值}"""
+        return vital_sign_parser.extract_batch(texts)
+
+    @staticmethod
+    def expand_synonyms(text):
+        """将文本中出现的症状补充为标准名称和同义词，用于提升检索召回"""
+        if not text:
+            return ""
+
+        # 没有可扩展的同义词时返回空字符串，避免产生重复的查询变体
+        return symptom_extractor.expand_synonyms(text)
+
+    @staticmethod
+    def assess_severity(symptoms, vitals=None):
+        """评估症状严重程度，返回等级、建议和判断依据
+
+        症状既可以是标准名称，也可以是"剧烈头痛"、"严重出血"、"体温39.8度"这类带修饰或数值的描述，
+        统一经症状和生命体征抽取后交给本地分诊引擎按权重、组合规则和生命体征阈值判断。
+        """
+        return MedicalTools.triage(symptoms, vitals).to_text()
+
+    @staticmethod
+    def triage(symptoms, vitals=None):
+        """评估症状严重程度，返回结构化的分诊结果"""
+        if isinstance(symptoms, str):
+            text = symptoms
+        else:
+            text = "，".join(str(symptom) for symptom in symptoms or [])
+        return triage_engine.assess_text(text, vitals)
+
+    @staticmethod
+    def assess_severity_batch(symptom_lists):
+        """批量评估症状严重程度"""
+        return [MedicalTools.assess_severity(symptoms) for symptoms in symptom_lists]
+
     @staticmethod
     def format_medical_response(answer, sources=None):
         """格式化医疗回答 - 简化版以提高速度"""
@@ -100,8 +94,8 @@ class MedicalTools:
         if not query:
             return True, None
         
-        # 使用预编译的正则表达式进行快速匹配
-        if MedicalTools._inappropriate_regex.search(query):
+        # 在规范化后的问题上匹配预编译的正则，繁体和全角写法同样能被识别
+        if MedicalTools._inappropriate_regex.search(query_normalizer.normalize(query)):
             return False, "抱歉，我无法回答这个问题。"
         
         return True, None
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""@FileName: query_normalizer.py
+@Description: 查询规范化，全角转半角、繁体转简体、去除零宽字符、合并空白和重复标点，规范化结果用于缓存、过滤、抽取和路由
+@Author: HengLine
+@Time: 2025/10/15 10:10
+"""
+import os
+import re
+import sys
+from functools import lru_cache
+from typing import Any, Dict
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import info, warning
+from hengline.config import config_reader
+
+# 项目根目录，映射表路径相对于该目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 零宽字符和BOM，直接删除
+ZERO_WIDTH_CHARS = "\u200b\u200c\u200d\u2060\ufeff\u00ad"
+
+# 各种空白字符（全角空格、不换行空格等）统一为普通空格
+SPACE_CHARS = "\u3000\u00a0\u2002\u2003\u2009\u202f\t\r\n\f\v"
+
+# 中文字符（含中文标点）两侧的空白没有意义
+_CJK = r"\u3000-\u303f\u4e00-\u9fff"
+_CJK_SPACE_REGEX = re.compile(rf"(?<=[{_CJK}])\s+|\s+(?=[{_CJK}])")
+_MULTI_SPACE_REGEX = re.compile(r"\s{2,}")
+# 连续重复的标点只保留一个，如"？？？"、"!!!"、"。。。"
+_REPEATED_PUNCTUATION_REGEX = re.compile(r"([?!.,;:~。、…])\1+")
+# 缓存键忽略结尾的标点和语气符号
+_TRAILING_PUNCTUATION_REGEX = re.compile(r"[\s?!.,;:~。、…]+$")
+
+
+def build_translate_table(t2s_map: Dict[str, str]) -> Dict[int, Any]:
+    """将全角转半角、英文小写、空白统一、零宽字符删除和繁体转简体合并为一张str.translate映射表"""
+    table: Dict[int, Any] = {}
+
+    # 全角ASCII（U+FF01-U+FF5E）对应半角（U+0021-U+007E）
+    for code in range(0xFF01, 0xFF5F):
+        table[code] = chr(code - 0xFEE0)
+    for char in SPACE_CHARS:
+        table[ord(char)] = " "
+    for char in ZERO_WIDTH_CHARS:
+        table[ord(char)] = None
+    for traditional, simplified in t2s_map.items():
+        table[ord(traditional)] = simplified
+
+    # 英文统一小写，全角字母先转半角再转小写
+    for code, value in list(table.items()):
+        if isinstance(value, str) and "A" <= value <= "Z":
+            table[code] = value.lower()
+    for code in range(ord("A"), ord("Z") + 1):
+        table[code] = chr(code).lower()
+    return table
+
+
+class QueryNormalizer:
+    """查询规范化流水线
+
+    一次str.translate完成全角转半角、英文小写、繁体转简体和零宽字符删除，
+    再用预编译的正则合并空白和重复标点。规范化结果按文本缓存，
+    同一请求在缓存键、内容过滤、症状抽取和路由等环节多次使用时只计算一次。
+    """
+
+    def __init__(self, t2s_map: Dict[str, str] = None, enabled: bool = True, cache_size: int = 4096):
+        self.enabled = enabled
+        self.t2s_map = t2s_map or {}
+        self._table = build_translate_table(self.t2s_map)
+        # 只包含一对一替换的映射表，转换后文本长度不变，抽取结果的位置可直接对应原文
+        self._fold_table = {code: value for code, value in self._table.items()
+                            if isinstance(value, str) and len(value) == 1}
+        self._cached_normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    @classmethod
+    def from_config(cls, normalization_config: Dict[str, Any] = None) -> "QueryNormalizer":
+        """按配置加载繁简映射表，映射表不可用时只做全角、空白和标点的规范化"""
+        normalization_config = normalization_config or {}
+        t2s_path = normalization_config.get("t2s_path", "data/lexicon/t2s.tsv")
+        if not os.path.isabs(t2s_path):
+            t2s_path = os.path.join(PROJECT_ROOT, t2s_path)
+
+        try:
+            t2s_map = cls.load_t2s_map(t2s_path)
+        except OSError as e:
+            warning(f"无法加载繁简映射表 {t2s_path}，将不做繁体转换: {str(e)}")
+            t2s_map = {}
+
+        normalizer = cls(t2s_map,
+                         enabled=normalization_config.get("enabled", True),
+                         cache_size=normalization_config.get("cache_size", 4096))
+        info(f"查询规范化已加载: {len(t2s_map)} 个繁体字映射")
+        return normalizer
+
+    @staticmethod
+    def load_t2s_map(path: str) -> Dict[str, str]:
+        """读取繁简映射表，每行格式为 繁体<TAB>简体"""
+        t2s_map = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                traditional, _, simplified = line.partition("\t")
+                if len(traditional) == 1 and simplified:
+                    t2s_map[traditional] = simplified.strip()
+        return t2s_map
+
+    def normalize(self, text: str) -> str:
+        """返回规范化后的文本，未启用时只去除首尾空白"""
+        if not text:
+            return ""
+        if not self.enabled:
+            return text.strip()
+        return self._cached_normalize(text)
+
+    def fold(self, text: str) -> str:
+        """逐字符规范化（全角转半角、英文小写、繁体转简体），不增删字符，用于需要保留原文位置的抽取"""
+        if not text or not self.enabled:
+            return text or ""
+        return text.translate(self._fold_table)
+
+    def cache_key(self, text: str) -> str:
+        """用作缓存和请求合并键的规范形式，在规范化的基础上忽略结尾的标点"""
+        return _TRAILING_PUNCTUATION_REGEX.sub("", self.normalize(text))
+
+    def _normalize(self, text: str) -> str:
+        text = text.translate(self._table)
+        # 多数问题不含空白，跳过两次空白替换
+        if " " in text:
+            text = _CJK_SPACE_REGEX.sub("", text)
+            text = _MULTI_SPACE_REGEX.sub(" ", text)
+        text = _REPEATED_PUNCTUATION_REGEX.sub(r"\1", text)
+        return text.strip()
+
+    def get_stats(self) -> Dict[str, Any]:
+        cache_info = self._cached_normalize.cache_info()
+        total = cache_info.hits + cache_info.misses
+        return {
+            "enabled": self.enabled,
+            "t2s_chars": len(self.t2s_map),
+            "cache_size": cache_info.currsize,
+            "cache_hits": cache_info.hits,
+            "cache_misses": cache_info.misses,
+            "cache_hit_rate": round(cache_info.hits / total, 4) if total else 0.0
+        }
+
+
+# 全局查询规范化器
+query_normalizer = QueryNormalizer.from_config(config_reader.get_module_config("query_normalization"))
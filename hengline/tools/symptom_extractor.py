@@ -0,0 +1,328 @@
+"""@FileName: symptom_extractor.py
+@Description: 基于Aho-Corasick自动机的症状抽取，从外部词表加载数千个症状写法，支持否定识别和批量抽取
+@Author: HengLine
+@Time: 2025/10/14 10:20
+"""
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, List, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import info, warning
+from hengline.config import config_reader
+from hengline.tools.query_normalizer import query_normalizer
+
+# 项目根目录，词表路径相对于该目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 词表文件不可用时使用的内置词表
+BUILTIN_LEXICON = {
+    '发热': ['发烧'],
+    '咳嗽': [],
+    '头痛': [],
+    '乏力': ['疲劳'],
+    '恶心': ['呕吐'],
+    '腹泻': [],
+    '腹痛': [],
+    '胸痛': [],
+    '呼吸困难': [],
+    '头晕': [],
+    '关节痛': [],
+    '肌肉痛': [],
+    '喉咙痛': [],
+    '鼻塞': ['流鼻涕'],
+    '皮疹': [],
+    '出血': []
+}
+
+# 否定词：出现在症状之前且位于同一分句内时，该症状视为被否定
+NEGATION_CUES = ("没有", "没", "无", "不", "未", "否认", "未见", "并无", "从未", "未曾", "不伴", "排除", "未出现",
+                 "没有出现", "没出现", "并未出现", "从未出现")
+
+# 作用范围较短的否定词及其与症状之间的最大距离：单字"不"只否定紧随其后的症状（如"不咳嗽"、"不怎么咳嗽"），
+# "不想吃饭头晕"中的头晕不受影响
+SHORT_SCOPE_CUES = {"不": 3}
+
+# 形似否定但不表示否定的短语
+PSEUDO_NEGATIONS = ("不仅", "不但", "不久", "不断", "不停", "不时", "不住", "不好", "不佳", "不稳", "不了", "不行",
+                    "不得不", "不知道", "不清楚", "不确定", "不排除", "不明原因", "无明显诱因", "无诱因", "无缘无故",
+                    "无法", "没法", "没办法", "无论", "不管", "没多久", "没过多久", "有没有", "是不是", "会不会", "要不要",
+                    # 表示身体不适而不是否定
+                    "不舒服", "不适", "不对劲", "不正常", "不太好",
+                    # 由症状之后的说法判断，不否定其后的症状
+                    "不明显", "不严重", "不厉害")
+
+# 分句分隔符，否定的作用范围不跨越分句
+CLAUSE_DELIMITERS = "，,。；;！!？?\n"
+
+# 转折词和表示先后、新出现的词，否定的作用范围到此结束（如"排除发热后出现咳嗽"中的咳嗽不被否定）
+SCOPE_TERMINATORS = ("但是", "但", "不过", "然而", "却", "可是", "只是", "后来", "现在",
+                     "之后", "以后", "然后", "后", "出现", "伴有", "还有")
+
+# 症状之后表示已消失或并不明显的说法，如"发热已退了"、"咳嗽不明显"
+POST_NEGATION_PATTERN = (r"(?:已经|已|都|也)?(?:消失|退了|好了|没有了|没了)"
+                         r"|(?:并|也|都)?(?:不太|不怎么|不)(?:明显|严重|厉害)")
+
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机
+
+    所有模式编译为一棵带失败链接的字典树，一次扫描文本即可找出全部模式的出现位置，
+    耗时与文本长度和匹配数成正比，与模式数量基本无关。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        # 各状态的转移表、失败链接和在该状态结束的模式编号（由长到短）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        if not self._output[state]:
+            self._output[state] = (len(self.patterns),)
+            self.patterns.append(pattern)
+
+    def _build(self):
+        """按广度优先计算失败链接，并把失败链接上的输出合并到当前状态"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail if fail != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str):
+        """返回所有匹配 (开始位置, 结束位置, 模式编号)，同一结束位置的匹配由长到短排列"""
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = index + 1
+                for pattern_id in output[state]:
+                    yield end - len(patterns[pattern_id]), end, pattern_id
+
+    def find_longest(self, text: str) -> List[Tuple[int, int, int]]:
+        """返回从左到右、不重叠、同一起点取最长的匹配"""
+        matches = sorted(self.iter_matches(text), key=lambda match: (match[0], -match[1]))
+        selected = []
+        last_end = 0
+        for match in matches:
+            if match[0] >= last_end:
+                selected.append(match)
+                last_end = match[1]
+        return selected
+
+
+class SymptomMention:
+    """文本中的一处症状"""
+
+    __slots__ = ("canonical", "text", "start", "end", "negated")
+
+    def __init__(self, canonical: str, text: str, start: int, end: int, negated: bool = False):
+        self.canonical = canonical
+        self.text = text
+        self.start = start
+        self.end = end
+        self.negated = negated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"canonical": self.canonical, "text": self.text, "start": self.start, "end": self.end,
+                "negated": self.negated}
+
+    def __repr__(self):
+        return f"SymptomMention({self.canonical!r}, {self.text!r}, {self.start}, {self.end}, negated={self.negated})"
+
+
+class SymptomExtractor:
+    """症状抽取器
+
+    词表中的全部写法编译为一个Aho-Corasick自动机，匹配结果通过"写法 -> 标准名称"表直接映射，
+    不再逐个遍历标准症状。否定识别采用轻量规则：同一分句内、症状之前一定距离内出现否定词，
+    且否定词与症状之间没有转折词时视为否定（如"无发热"、"没有咳嗽、咳痰"），
+    症状之后紧跟"消失"、"退了"等说法时同样视为否定。
+    """
+
+    def __init__(self, lexicon: Dict[str, List[str]], negation_window: int = 10, max_synonyms: int = 3):
+        """
+        Args:
+            lexicon: 标准名称 -> 同义写法列表
+            negation_window: 否定词与症状之间的最大距离（字符数）
+            max_synonyms: expand_synonyms为每个症状补充的最多同义词数
+        """
+        self.negation_window = negation_window
+        self.max_synonyms = max_synonyms
+
+        self.synonyms: Dict[str, List[str]] = {}
+        self.variant_to_canonical: Dict[str, str] = {}
+        for canonical, variants in lexicon.items():
+            synonyms = self.synonyms.setdefault(canonical, [])
+            for variant in [canonical] + list(variants):
+                # 同一写法以先出现的标准名称为准
+                if variant and variant not in self.variant_to_canonical:
+                    self.variant_to_canonical[variant] = canonical
+                    if variant != canonical:
+                        synonyms.append(variant)
+
+        self._automaton = AhoCorasick(self.variant_to_canonical)
+        self._canonical_by_id = [self.variant_to_canonical[pattern] for pattern in self._automaton.patterns]
+
+        self._negation_regex = re.compile("|".join(sorted(NEGATION_CUES, key=len, reverse=True)))
+        self._pseudo_regex = re.compile("|".join(sorted(PSEUDO_NEGATIONS, key=len, reverse=True)))
+        self._terminator_regex = re.compile("|".join(sorted(SCOPE_TERMINATORS, key=len, reverse=True)))
+        self._post_negation_regex = re.compile(POST_NEGATION_PATTERN)
+
+    @classmethod
+    def from_config(cls, extraction_config: Dict[str, Any] = None) -> "SymptomExtractor":
+        """按配置加载词表，词表文件不可用时使用内置词表"""
+        extraction_config = extraction_config or {}
+        lexicon_path = extraction_config.get("lexicon_path", "data/lexicon/symptoms.tsv")
+        if not os.path.isabs(lexicon_path):
+            lexicon_path = os.path.join(PROJECT_ROOT, lexicon_path)
+
+        try:
+            lexicon = cls.load_lexicon(lexicon_path)
+        except OSError as e:
+            warning(f"无法加载症状词表 {lexicon_path}，使用内置词表: {str(e)}")
+            lexicon = BUILTIN_LEXICON
+
+        extractor = cls(lexicon,
+                        negation_window=extraction_config.get("negation_window", 10),
+                        max_synonyms=extraction_config.get("max_synonyms", 3))
+        info(f"症状词表已加载: {len(extractor.synonyms)} 个标准症状，{len(extractor.variant_to_canonical)} 种写法")
+        return extractor
+
+    @staticmethod
+    def load_lexicon(path: str) -> Dict[str, List[str]]:
+        """读取词表文件，每行格式为 标准名称<TAB>同义词1|同义词2|...，同一标准名称的多行合并"""
+        lexicon: Dict[str, List[str]] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                canonical, _, variants = line.partition("\t")
+                lexicon.setdefault(canonical.strip(), []).extend(
+                    variant.strip() for variant in variants.split("|") if variant.strip())
+        return lexicon
+
+    def find_mentions(self, text: str) -> List[SymptomMention]:
+        """找出文本中的全部症状及其否定状态"""
+        if not text:
+            return []
+
+        # 繁体、全角写法逐字符转换后再匹配，转换不改变文本长度，位置仍对应原文
+        folded = query_normalizer.fold(text)
+        mentions = [SymptomMention(self._canonical_by_id[pattern_id], text[start:end], start, end)
+                    for start, end, pattern_id in self._automaton.find_longest(folded)]
+        if mentions:
+            self._mark_negations(folded, mentions)
+        return mentions
+
+    def extract(self, text: str, include_negated: bool = False) -> List[str]:
+        """按出现顺序返回去重后的标准症状名称，默认不包含被否定的症状"""
+        symptoms = []
+        for mention in self.find_mentions(text):
+            if (include_negated or not mention.negated) and mention.canonical not in symptoms:
+                symptoms.append(mention.canonical)
+        return symptoms
+
+    def extract_negated(self, text: str) -> List[str]:
+        """返回文本中被否定的标准症状名称（如"无发热"中的发热）"""
+        symptoms = []
+        for mention in self.find_mentions(text):
+            if mention.negated and mention.canonical not in symptoms:
+                symptoms.append(mention.canonical)
+        return symptoms
+
+    def extract_batch(self, texts: Iterable[str], include_negated: bool = False) -> List[List[str]]:
+        """批量抽取，共享同一个自动机，适合对病历、知识库文档等大量文本离线处理"""
+        return [self.extract(text, include_negated) for text in texts]
+
+    def expand_synonyms(self, text: str) -> str:
+        """在文本后补充其中症状的标准名称和常用同义词，用于提升检索召回；没有可补充的内容时返回空字符串"""
+        if not text:
+            return ""
+
+        expansions = []
+        for canonical in self.extract(text):
+            added = 0
+            for synonym in [canonical] + self.synonyms.get(canonical, []):
+                if added >= self.max_synonyms:
+                    break
+                if synonym not in text and synonym not in expansions:
+                    expansions.append(synonym)
+                    added += 1
+
+        if not expansions:
+            return ""
+        return f"{text} {' '.join(expansions)}"
+
+    def _mark_negations(self, text: str, mentions: List[SymptomMention]):
+        """标记被否定的症状"""
+        symptom_spans = [(mention.start, mention.end) for mention in mentions]
+        pseudo_spans = [match.span() for match in self._pseudo_regex.finditer(text)]
+
+        # 否定词：不属于某个症状写法（如"无力"中的"无"），也不属于伪否定短语
+        cues = []
+        for match in self._negation_regex.finditer(text):
+            start, end = match.span()
+            if any(s < end and start < e for s, e in symptom_spans) or any(s <= start and end <= e for s, e in pseudo_spans):
+                continue
+            cues.append((start, end))
+
+        for mention in mentions:
+            if self._post_negation_regex.match(text, mention.end):
+                mention.negated = True
+                continue
+            if cues:
+                mention.negated = self._has_negation_before(text, mention.start, cues)
+
+    def _has_negation_before(self, text: str, position: int, cues: List[Tuple[int, int]]) -> bool:
+        window_start = max(0, position - self.negation_window)
+        for cue_start, cue_end in reversed(cues):
+            if cue_end > position:
+                continue
+            if cue_start < window_start:
+                return False
+            max_distance = SHORT_SCOPE_CUES.get(text[cue_start:cue_end])
+            if max_distance is not None and position - cue_end > max_distance:
+                return False
+            scope = text[cue_end:position]
+            if any(char in CLAUSE_DELIMITERS for char in scope) or self._terminator_regex.search(scope):
+                return False
+            return True
+        return False
+
+
+# 全局症状抽取器
+symptom_extractor = SymptomExtractor.from_config(config_reader.get_module_config("symptom_extraction"))
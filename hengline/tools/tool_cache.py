@@ -0,0 +1,237 @@
+"""@FileName: tool_cache.py
+@Description: 工具结果缓存，按工具名和规范化参数缓存结果，支持按工具设置TTL、LRU淘汰和并发请求合并
+@Author: HengLine
+@Time: 2025/10/10 15:30
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import debug
+from hengline.config import config_reader
+from hengline.tools.query_normalizer import query_normalizer
+
+# 发起计算的调用被取消时交给等待方的标记，等待方收到后重新查找缓存，第一个等待方接手计算
+_OWNER_CANCELLED = object()
+
+
+class ToolResultCache:
+    """跨请求共享的工具结果缓存
+
+    - 键由工具名、版本（如知识库索引版本）和规范化后的参数组成；
+    - 每个工具可单独设置TTL，TTL为0表示不缓存该工具；
+    - 条目总数有上限，超出时淘汰最久未使用的条目；
+    - 相同参数的并发调用只执行一次，其余调用等待同一结果。
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 600, tool_ttls: Dict[str, float] = None,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self.tool_ttls = tool_ttls or {}
+
+        # 键 -> (结果, 过期时间)，按最近使用顺序排列
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 正在计算中的调用：同步调用使用Future，异步调用按事件循环区分
+        self._inflight = {}
+        self._ainflight = {}
+
+        self._stats = {}
+
+    def get_ttl(self, tool_name: str) -> float:
+        return self.tool_ttls.get(tool_name, self.default_ttl)
+
+    @staticmethod
+    def _normalize(value):
+        """规范化参数：字符串经查询规范化（全角、繁体、空白和重复标点），字符串列表排序去重"""
+        if isinstance(value, str):
+            return query_normalizer.normalize(value)
+        if isinstance(value, dict):
+            return {k: ToolResultCache._normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple, set)):
+            items = [ToolResultCache._normalize(v) for v in value]
+            if all(isinstance(item, str) for item in items):
+                return sorted(set(items))
+            return items
+        return value
+
+    def make_key(self, tool_name: str, args: Dict[str, Any], version: Optional[str] = None) -> str:
+        normalized = json.dumps(self._normalize(args), ensure_ascii=False, sort_keys=True, default=str)
+        return f"{tool_name}|{version or ''}|{normalized}"
+
+    def _lookup(self, tool_name: str, key: str):
+        """查找未过期的缓存条目，返回(是否命中, 结果)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+
+            result, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._count(tool_name, "expirations")
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._count(tool_name, "hits")
+            return True, result
+
+    def _store(self, tool_name: str, key: str, result: Any):
+        with self._lock:
+            self._entries[key] = (result, time.monotonic() + self.get_ttl(tool_name))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count(tool_name, "evictions")
+
+    def get_or_compute(self, tool_name: str, args: Dict[str, Any], compute: Callable[[], Any],
+                       version: Optional[str] = None, cacheable: Callable[[Any], bool] = None):
+        """同步获取缓存结果，未命中时执行compute，并发的相同调用等待同一结果"""
+        if not self.enabled or self.get_ttl(tool_name) <= 0:
+            return compute()
+
+        key = self.make_key(tool_name, args, version)
+        hit, result = self._lookup(tool_name, key)
+        if hit:
+            return result
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self._count(tool_name, "misses")
+            else:
+                self._count(tool_name, "coalesced")
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+            if cacheable is None or cacheable(result):
+                self._store(tool_name, key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_compute(self, tool_name: str, args: Dict[str, Any], compute: Callable[[], Any],
+                              version: Optional[str] = None, cacheable: Callable[[Any], bool] = None):
+        """异步获取缓存结果，compute返回可等待对象，并发的相同调用等待同一结果"""
+        if not self.enabled or self.get_ttl(tool_name) <= 0:
+            return await compute()
+
+        key = self.make_key(tool_name, args, version)
+        hit, result = self._lookup(tool_name, key)
+        if hit:
+            return result
+
+        loop = asyncio.get_running_loop()
+        inflight_key = (id(loop), key)
+        while True:
+            with self._lock:
+                future = self._ainflight.get(inflight_key)
+                owner = future is None
+                if owner:
+                    future = loop.create_future()
+                    self._ainflight[inflight_key] = future
+                    self._count(tool_name, "misses")
+                else:
+                    self._count(tool_name, "coalesced")
+
+            if owner:
+                break
+            # shield保证等待方被取消时不影响正在执行的调用
+            result = await asyncio.shield(future)
+            if result is not _OWNER_CANCELLED:
+                return result
+            hit, result = self._lookup(tool_name, key)
+            if hit:
+                return result
+
+        try:
+            result = await compute()
+            if cacheable is None or cacheable(result):
+                self._store(tool_name, key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # 等待方可能来自其他请求，不取消共享的future，而是通知等待方由其中一个接手计算
+            with self._lock:
+                self._ainflight.pop(inflight_key, None)
+            future.set_result(_OWNER_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待方时避免"exception was never retrieved"警告
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                if self._ainflight.get(inflight_key) is future:
+                    del self._ainflight[inflight_key]
+
+    def invalidate(self, tool_name: Optional[str] = None):
+        """清除指定工具（或全部工具）的缓存"""
+        with self._lock:
+            if tool_name is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key.startswith(f"{tool_name}|")]:
+                    del self._entries[key]
+        debug(f"已清除工具缓存: {tool_name or '全部'}")
+
+    def _count(self, tool_name: str, field: str):
+        """累加统计项，调用方需持有锁"""
+        tool_stats = self._stats.setdefault(tool_name, {
+            "hits": 0, "misses": 0, "coalesced": 0, "expirations": 0, "evictions": 0
+        })
+        tool_stats[field] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存条目数和各工具的命中统计"""
+        with self._lock:
+            tools = {}
+            for tool_name, tool_stats in self._stats.items():
+                lookups = tool_stats["hits"] + tool_stats["misses"] + tool_stats["coalesced"]
+                tools[tool_name] = dict(tool_stats)
+                tools[tool_name]["hit_rate"] = round(
+                    (tool_stats["hits"] + tool_stats["coalesced"]) / lookups, 4) if lookups else 0.0
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "tools": tools
+            }
+
+
+def _create_tool_result_cache() -> ToolResultCache:
+    cache_config = config_reader.get_module_config("tool_cache")
+    return ToolResultCache(
+        max_entries=cache_config.get("max_entries", 1024),
+        default_ttl=cache_config.get("default_ttl", 600),
+        tool_ttls=cache_config.get("tool_ttls", {}),
+        enabled=cache_config.get("enabled", True)
+    )
+
+
+# 全局工具结果缓存，所有智能体实例共享
+tool_result_cache = _create_tool_result_cache()
@@ -0,0 +1,303 @@
+"""@FileName: triage_engine.py
+@Description: 本地确定性分诊引擎，按症状权重、症状组合规则和生命体征阈值评估病情严重程度，无需调用大模型
+@Author: HengLine
+@Time: 2025/10/14 16:40
+"""
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from hengline.config import config_reader
+from hengline.tools.query_normalizer import query_normalizer
+from hengline.tools.symptom_extractor import symptom_extractor
+from hengline.tools.vital_signs import vital_sign_parser
+
+# 严重程度等级，由低到高
+SEVERITY_LEVELS = ("无", "轻微", "中等", "严重", "紧急")
+NONE, MILD, MODERATE, SEVERE, CRITICAL = range(len(SEVERITY_LEVELS))
+
+# 各等级的处理建议
+SEVERITY_ADVICE = {
+    NONE: "无明显症状",
+    MILD: "轻微：可以先观察，如症状加重请及时就医",
+    MODERATE: "中等：建议尽快就医",
+    SEVERE: "严重：建议立即就医",
+    CRITICAL: "紧急：请立即拨打120或前往最近的急诊"
+}
+
+# 症状权重，未列出的症状权重为1，按总分划分轻微/中等/严重
+SYMPTOM_WEIGHTS = {
+    '发热': 2, '寒战': 2, '呕吐': 2, '腹泻': 2, '腹痛': 2, '头痛': 2, '头晕': 2, '胸闷': 3, '心悸': 3,
+    '气短': 3, '喘息': 3, '水肿': 2, '少尿': 3, '血尿': 3, '便血': 3, '阴道出血': 3, '出血': 3,
+    '黄疸': 3, '脱水': 3, '颈部僵硬': 3, '视物模糊': 2, '复视': 3, '麻木': 2, '肢体无力': 3,
+    '吞咽困难': 3, '嗜睡': 3, '意识混乱': 5, '晕厥': 5, '抽搐': 5, '胸痛': 5, '呼吸困难': 5,
+    '咯血': 5, '呕血': 5, '黑便': 4, '发绀': 5, '意识丧失': 6, '口角歪斜': 5, '言语不清': 4,
+    '血压下降': 4, '血压升高': 2, '冷汗': 2, '拒奶': 2, '骨折': 4
+}
+
+# 单独出现即达到相应等级的症状
+RED_FLAG_SYMPTOMS = {
+    '意识丧失': (CRITICAL, "意识丧失"),
+    '发绀': (CRITICAL, "口唇发绀，提示缺氧"),
+    '抽搐': (SEVERE, "抽搐"),
+    '胸痛': (SEVERE, "胸痛需排除心血管急症"),
+    '呼吸困难': (SEVERE, "呼吸困难"),
+    '咯血': (SEVERE, "咯血"),
+    '呕血': (SEVERE, "呕血，提示上消化道出血"),
+    '黑便': (SEVERE, "黑便，提示消化道出血"),
+    '晕厥': (SEVERE, "晕厥"),
+    '意识混乱': (SEVERE, "意识混乱"),
+    '口角歪斜': (SEVERE, "口角歪斜需排除脑卒中"),
+    '血压下降': (SEVERE, "血压下降"),
+    '骨折': (SEVERE, "疑似骨折"),
+}
+
+# 症状组合规则：全部症状同时出现时达到相应等级
+COMBINATION_RULES = [
+    (('胸痛', '冷汗'), CRITICAL, "疑似急性冠脉综合征"),
+    (('胸痛', '呼吸困难'), CRITICAL, "疑似急性冠脉综合征或肺栓塞"),
+    (('胸痛', '气短'), CRITICAL, "疑似急性冠脉综合征或肺栓塞"),
+    (('胸闷', '冷汗'), SEVERE, "疑似急性冠脉综合征"),
+    (('口角歪斜', '言语不清'), CRITICAL, "疑似脑卒中"),
+    (('口角歪斜', '肢体无力'), CRITICAL, "疑似脑卒中"),
+    (('言语不清', '肢体无力'), CRITICAL, "疑似脑卒中"),
+    (('发热', '颈部僵硬'), CRITICAL, "疑似脑膜炎"),
+    (('头痛', '呕吐', '意识混乱'), CRITICAL, "疑似颅内压增高"),
+    (('发热', '意识混乱'), CRITICAL, "疑似严重感染"),
+    (('心悸', '晕厥'), CRITICAL, "疑似恶性心律失常"),
+    (('呼吸困难', '喘息'), SEVERE, "疑似哮喘急性发作"),
+    (('腹痛', '呕血'), SEVERE, "疑似上消化道出血"),
+    (('腹痛', '发热', '黄疸'), SEVERE, "疑似胆道感染"),
+    (('呕吐', '腹泻', '少尿'), SEVERE, "疑似脱水"),
+    (('头痛', '视物模糊', '血压升高'), SEVERE, "疑似高血压急症"),
+    (('发热', '寒战'), MODERATE, "发热伴寒战，提示感染"),
+    (('发热', '皮疹'), MODERATE, "发热伴皮疹"),
+    (('多尿', '口渴', '消瘦'), MODERATE, "疑似血糖异常"),
+]
+
+# 生命体征阈值：(指标, 比较方式, 阈值, 等级, 说明)，同一指标按顺序取第一条命中的规则
+VITAL_THRESHOLDS = [
+    ("temperature", ">=", 41.0, CRITICAL, "超高热"),
+    ("temperature", ">=", 40.0, SEVERE, "高热"),
+    ("temperature", ">=", 38.5, MODERATE, "中度发热"),
+    ("temperature", "<=", 35.0, SEVERE, "体温过低"),
+    ("systolic_bp", ">=", 180, SEVERE, "收缩压过高，疑似高血压危象"),
+    ("systolic_bp", ">=", 160, MODERATE, "收缩压明显升高"),
+    ("systolic_bp", "<", 90, SEVERE, "收缩压过低"),
+    ("diastolic_bp", ">=", 120, CRITICAL, "舒张压过高，疑似高血压危象"),
+    ("diastolic_bp", ">=", 100, MODERATE, "舒张压明显升高"),
+    ("heart_rate", ">=", 150, CRITICAL, "心动过速"),
+    ("heart_rate", ">=", 120, SEVERE, "心动过速"),
+    ("heart_rate", ">=", 100, MODERATE, "心率偏快"),
+    ("heart_rate", "<", 40, SEVERE, "心动过缓"),
+    ("heart_rate", "<", 50, MODERATE, "心率偏慢"),
+    ("respiratory_rate", ">=", 30, SEVERE, "呼吸急促"),
+    ("respiratory_rate", ">=", 24, MODERATE, "呼吸偏快"),
+    ("respiratory_rate", "<", 10, SEVERE, "呼吸过慢"),
+    ("spo2", "<", 90, CRITICAL, "血氧饱和度过低"),
+    ("spo2", "<", 94, SEVERE, "血氧饱和度偏低"),
+    ("blood_glucose", ">=", 16.7, SEVERE, "血糖过高，疑似高血糖危象"),
+    ("blood_glucose", ">=", 11.1, MODERATE, "血糖偏高"),
+    ("blood_glucose", "<", 3.9, SEVERE, "低血糖"),
+]
+
+# 生命体征的显示单位
+VITAL_UNITS = {
+    "temperature": "℃", "systolic_bp": "mmHg", "diastolic_bp": "mmHg", "heart_rate": "次/分",
+    "respiratory_rate": "次/分", "spo2": "%", "blood_glucose": "mmol/L"
+}
+
+# 症状前的程度修饰词，修饰后的症状权重加倍，等级至少为中等，权重不低于3的症状至少为严重
+INTENSITY_MODIFIERS = ("剧烈", "严重", "大量", "持续", "反复", "明显", "剧")
+
+# 本身带有程度信息的症状写法（如"高烧"、"烧得厉害"）
+INTENSE_VARIANT_MARKERS = ("高热", "高烧", "剧", "厉害", "持续", "反复", "大量")
+
+_COMPARATORS = {
+    ">=": lambda value, threshold: value >= threshold,
+    ">": lambda value, threshold: value > threshold,
+    "<=": lambda value, threshold: value <= threshold,
+    "<": lambda value, threshold: value < threshold,
+}
+
+
+class TriageResult:
+    """分诊结果：严重程度等级、总分和判断依据"""
+
+    __slots__ = ("level", "score", "reasons", "symptoms", "vitals")
+
+    def __init__(self, level: int, score: int, reasons: List[str], symptoms: List[str], vitals: Dict[str, float]):
+        self.level = level
+        self.score = score
+        self.reasons = reasons
+        self.symptoms = symptoms
+        self.vitals = vitals
+
+    @property
+    def severity(self) -> str:
+        return SEVERITY_LEVELS[self.level]
+
+    @property
+    def advice(self) -> str:
+        return SEVERITY_ADVICE[self.level]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "severity": self.severity,
+            "level": self.level,
+            "score": self.score,
+            "advice": self.advice,
+            "reasons": self.reasons,
+            "symptoms": self.symptoms,
+            "vitals": self.vitals
+        }
+
+    def to_text(self) -> str:
+        """工具返回给模型的文本，第一行为等级和建议，之后为判断依据"""
+        if not self.reasons:
+            return self.advice
+        return f"{self.advice}\n依据：{'；'.join(self.reasons)}"
+
+    def __repr__(self):
+        return f"TriageResult({self.severity}, score={self.score}, reasons={self.reasons})"
+
+
+class TriageEngine:
+    """确定性分诊引擎
+
+    规则在初始化时编译：每个症状对应一个二进制位，组合规则编译为位掩码，
+    评估时只需一次按位与判断组合是否满足；生命体征阈值按指标分组。
+    等级取症状总分、单一危险症状、组合规则和生命体征四者中的最高者。
+    """
+
+    def __init__(self, moderate_score: int = 6, severe_score: int = 12):
+        self.moderate_score = moderate_score
+        self.severe_score = severe_score
+
+        # 症状 -> 二进制位
+        self._bits: Dict[str, int] = {}
+        self._combinations: List[Tuple[int, int, str, Tuple[str, ...]]] = []
+        for symptoms, level, reason in COMBINATION_RULES:
+            mask = 0
+            for symptom in symptoms:
+                mask |= self._bit(symptom)
+            self._combinations.append((mask, level, reason, symptoms))
+        # 等级高的组合在前，同一组症状只报告最高等级的规则
+        self._combinations.sort(key=lambda rule: -rule[1])
+
+        self._thresholds: Dict[str, List[Tuple[Any, float, int, str]]] = {}
+        for vital, comparator, threshold, level, reason in VITAL_THRESHOLDS:
+            self._thresholds.setdefault(vital, []).append((_COMPARATORS[comparator], threshold, level, reason))
+
+    @classmethod
+    def from_config(cls, triage_config: Dict[str, Any] = None) -> "TriageEngine":
+        triage_config = triage_config or {}
+        return cls(moderate_score=triage_config.get("moderate_score", 6),
+                   severe_score=triage_config.get("severe_score", 12))
+
+    def _bit(self, symptom: str) -> int:
+        bit = self._bits.get(symptom)
+        if bit is None:
+            bit = self._bits[symptom] = 1 << len(self._bits)
+        return bit
+
+    def assess(self, symptoms: Iterable[str] = None, vitals: Dict[str, float] = None,
+               intensified: Iterable[str] = ()) -> TriageResult:
+        """评估症状和生命体征
+
+        Args:
+            symptoms: 标准症状名称列表
+            vitals: 生命体征，如 {"temperature": 39.8, "systolic_bp": 170}
+            intensified: 带有程度修饰（如"剧烈头痛"）的症状
+
+        Returns:
+            TriageResult: 分诊结果
+        """
+        symptoms = list(dict.fromkeys(symptoms or []))
+        vitals = {name: value for name, value in (vitals or {}).items() if value is not None}
+        intensified = set(intensified)
+        level = NONE
+        reasons = []
+
+        # 症状总分
+        score = 0
+        mask = 0
+        for symptom in symptoms:
+            weight = SYMPTOM_WEIGHTS.get(symptom, 1)
+            if symptom in intensified:
+                level = max(level, SEVERE if weight >= 3 else MODERATE)
+                weight *= 2
+                reasons.append(f"{symptom}程度较重")
+            score += weight
+            mask |= self._bits.get(symptom, 0)
+
+            red_flag = RED_FLAG_SYMPTOMS.get(symptom)
+            if red_flag is not None:
+                level = max(level, red_flag[0])
+                reasons.append(red_flag[1])
+
+        if score >= self.severe_score:
+            level = max(level, SEVERE)
+            reasons.append(f"症状综合评分{score}")
+        elif score >= self.moderate_score:
+            level = max(level, MODERATE)
+            reasons.append(f"症状综合评分{score}")
+        elif symptoms:
+            level = max(level, MILD)
+
+        # 症状组合
+        matched = 0
+        for rule_mask, rule_level, reason, rule_symptoms in self._combinations:
+            if mask & rule_mask == rule_mask and matched & rule_mask != rule_mask:
+                matched |= rule_mask
+                level = max(level, rule_level)
+                reasons.append(f"{'+'.join(rule_symptoms)}：{reason}")
+
+        # 生命体征
+        for vital, value in vitals.items():
+            for compare, threshold, rule_level, reason in self._thresholds.get(vital, ()):
+                if compare(value, threshold):
+                    level = max(level, rule_level)
+                    reasons.append(f"{reason}（{value:g}{VITAL_UNITS.get(vital, '')}）")
+                    break
+
+        return TriageResult(level, score, reasons, symptoms, vitals)
+
+    def assess_text(self, text: str, vitals: Dict[str, float] = None) -> TriageResult:
+        """从文本中抽取症状和生命体征后评估，被否定的症状不计入，带程度修饰词的症状加重
+
+        文本中的数值（如"体温39.8度"、"血压170/110"）按生命体征阈值判断，
+        显式传入的vitals优先于文本中抽取的同名指标。
+        """
+        # 繁体、全角写法先逐字符转换，程度修饰词（如"嚴重"）按简体匹配
+        text = query_normalizer.fold(text or "")
+        parsed_vitals = vital_sign_parser.extract(text)
+        if vitals:
+            parsed_vitals.update(vitals)
+        symptoms = []
+        intensified = []
+        for mention in symptom_extractor.find_mentions(text or ""):
+            if mention.negated:
+                continue
+            if mention.canonical not in symptoms:
+                symptoms.append(mention.canonical)
+            prefix = text[max(0, mention.start - 3):mention.start]
+            if any(modifier in prefix for modifier in INTENSITY_MODIFIERS) or \
+                    any(marker in mention.text for marker in INTENSE_VARIANT_MARKERS):
+                intensified.append(mention.canonical)
+        return self.assess(symptoms, parsed_vitals, intensified)
+
+    def assess_batch(self, symptom_lists: Iterable[Iterable[str]]) -> List[TriageResult]:
+        """批量评估症状列表"""
+        return [self.assess(symptoms) for symptoms in symptom_lists]
+
+    def assess_text_batch(self, texts: Iterable[str]) -> List[TriageResult]:
+        """批量评估文本"""
+        return [self.assess_text(text) for text in texts]
+
+
+# 全局分诊引擎
+triage_engine = TriageEngine.from_config(config_reader.get_module_config("triage"))
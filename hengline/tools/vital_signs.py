@@ -0,0 +1,237 @@
+"""@FileName: vital_signs.py
+@Description: 生命体征和化验数值抽取，识别体温、血压、心率、呼吸、血氧和血糖，支持中文数字、全角数字和常见单位
+@Author: HengLine
+@Time: 2025/10/14 20:30
+"""
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from hengline.tools.query_normalizer import query_normalizer
+
+CHINESE_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+CHINESE_UNITS = {"十": 10, "百": 100}
+
+# 数值：阿拉伯数字或中文数字（如"三十九点五"、"一百二"）
+NUMBER = r"(?:\d+(?:\.\d+)?|[零〇一二两三四五六七八九十百]+(?:点[零〇一二三四五六七八九]+)?)"
+# 关键词与数值之间允许出现的连接词，如"体温最高到39.8度"、"血压：170/110"
+GAP = r"[\s:是为有在到达约了高最测量得]{0,5}"
+
+# 各指标的合理取值范围，超出范围的数值视为误识别
+PLAUSIBLE_RANGES = {
+    "temperature": (30.0, 45.0),
+    "systolic_bp": (50, 300),
+    "diastolic_bp": (20, 200),
+    "heart_rate": (20, 300),
+    "respiratory_rate": (4, 80),
+    "spo2": (50, 100),
+    "blood_glucose": (1.0, 50.0)
+}
+
+# 指标的标准单位
+VITAL_UNITS = {
+    "temperature": "℃", "systolic_bp": "mmHg", "diastolic_bp": "mmHg", "heart_rate": "次/分",
+    "respiratory_rate": "次/分", "spo2": "%", "blood_glucose": "mmol/L"
+}
+
+# 血糖mg/dL换算为mmol/L的系数
+GLUCOSE_MG_PER_MMOL = 18.0
+
+
+def parse_number(text: str) -> Optional[float]:
+    """将阿拉伯数字或中文数字转换为数值，如"三十九点五" -> 39.5，"一百二" -> 120"""
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+
+    integer_part, _, decimal_part = text.partition("点")
+    total = 0
+    current = None
+    last_unit = None
+    after_zero = False
+    for char in integer_part:
+        if char in CHINESE_DIGITS:
+            after_zero = after_zero or CHINESE_DIGITS[char] == 0
+            current = CHINESE_DIGITS[char]
+        elif char in CHINESE_UNITS:
+            unit = CHINESE_UNITS[char]
+            total += (1 if current is None else current) * unit
+            current = None
+            last_unit = unit
+            after_zero = False
+        else:
+            return None
+    if current is not None:
+        # "一百二"中末尾的"二"表示二十，"一百零五"中的"五"表示五
+        if last_unit and last_unit > 10 and not after_zero:
+            current *= last_unit // 10
+        total += current
+
+    if decimal_part:
+        digits = "".join(str(CHINESE_DIGITS[char]) for char in decimal_part if char in CHINESE_DIGITS)
+        total += float(f"0.{digits}") if digits else 0
+    return float(total)
+
+
+class VitalSign:
+    """抽取出的一项生命体征或化验数值"""
+
+    __slots__ = ("name", "value", "unit", "text", "start", "end")
+
+    def __init__(self, name: str, value: float, unit: str, text: str, start: int, end: int):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.text = text
+        self.start = start
+        self.end = end
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "value": self.value, "unit": self.unit, "text": self.text,
+                "start": self.start, "end": self.end}
+
+    def __repr__(self):
+        return f"VitalSign({self.name}={self.value:g}{self.unit}, {self.start}:{self.end})"
+
+
+class VitalSignParser:
+    """生命体征和化验数值抽取器
+
+    所有模式在初始化时编译；先用一个关键词正则判断文本中是否提到了体温、血压等指标，
+    没有提到时直接返回，绝大多数不带生命体征的问题只需一次扫描。
+    """
+
+    def __init__(self):
+        self._prefilter = re.compile(
+            r"体温|烧|热|血压|高压|低压|收缩压|舒张压|心率|脉搏|心跳|脉率|呼吸|血氧|氧饱和|血糖|HR|RR|SpO2|SaO2|GLU"
+            r"|℃|°C|mmHg|毫米汞柱", re.IGNORECASE)
+        self._patterns = [
+            # 体温：体温39.8度、发烧到三十九度五、烧到40℃、39.5°C
+            ("temperature", re.compile(
+                rf"(?:体温|发烧|发热|高烧|低烧|烧){GAP}(?P<value>{NUMBER})\s*(?P<unit>摄氏度|度|℃|°C|°)?"
+                rf"(?P<fraction>(?:[零一二三四五六七八九]|\d)(?![\d.天日周月年个多小次分]))?"
+                rf"|(?P<value2>\d{{2}}(?:\.\d+)?)\s*(?P<unit2>℃|°C|摄氏度)")),
+            # 血压：血压170/110、血压 170/110mmHg、高压170低压110
+            ("blood_pressure", re.compile(
+                rf"血压{GAP}(?P<systolic>{NUMBER})\s*[/／]\s*(?P<diastolic>{NUMBER})\s*(?:mmHg|毫米汞柱)?"
+                rf"|(?:高压|收缩压){GAP}(?P<systolic2>{NUMBER})(?:\s*(?:mmHg|毫米汞柱))?[\s,，、]*"
+                rf"(?:(?:低压|舒张压){GAP}(?P<diastolic2>{NUMBER})\s*(?:mmHg|毫米汞柱)?)?"
+                rf"|(?:低压|舒张压){GAP}(?P<diastolic3>{NUMBER})\s*(?:mmHg|毫米汞柱)?"
+                rf"|(?P<systolic4>\d{{2,3}})\s*/\s*(?P<diastolic4>\d{{2,3}})\s*(?:mmHg|毫米汞柱)", re.IGNORECASE)),
+            # 心率：心率120、脉搏120次/分、心跳一百二
+            ("heart_rate", re.compile(
+                rf"(?:心率|脉搏|心跳|脉率|HR){GAP}(?P<value>{NUMBER})\s*(?:次/分钟?|次每分钟?|次|bpm|下)?", re.IGNORECASE)),
+            # 呼吸频率：呼吸30次/分、呼吸频率二十八
+            ("respiratory_rate", re.compile(
+                rf"(?:呼吸频率|呼吸|RR){GAP}(?P<value>{NUMBER})\s*(?:次/分钟?|次每分钟?|次)", re.IGNORECASE)),
+            # 血氧：血氧88%、血氧饱和度 92、SpO2 90%
+            ("spo2", re.compile(
+                rf"(?:血氧饱和度|血氧|氧饱和度|SpO2|SaO2){GAP}(?P<value>{NUMBER})\s*%?", re.IGNORECASE)),
+            # 血糖：血糖 15 mmol/L、空腹血糖7.0、血糖270mg/dL
+            ("blood_glucose", re.compile(
+                rf"(?:血糖|GLU){GAP}(?P<value>{NUMBER})\s*(?P<unit>mmol/?L|mmol|毫摩尔(?:每升)?|mg/dL|mg/dl|毫克每分升)?",
+                re.IGNORECASE)),
+        ]
+
+    def parse(self, text: str) -> List[VitalSign]:
+        """抽取文本中的生命体征，按出现位置排序"""
+        if not text:
+            return []
+
+        # 全角转半角、繁体转简体均为一对一替换，不改变文本长度，抽取结果的位置可直接对应原文
+        normalized = query_normalizer.fold(text)
+        if not self._prefilter.search(normalized):
+            return []
+
+        readings: List[VitalSign] = []
+        for name, pattern in self._patterns:
+            for match in pattern.finditer(normalized):
+                if name == "temperature":
+                    self._add_temperature(readings, text, match)
+                elif name == "blood_pressure":
+                    self._add_blood_pressure(readings, text, match)
+                elif name == "blood_glucose":
+                    self._add_glucose(readings, text, match)
+                else:
+                    self._add(readings, name, parse_number(match.group("value")), text, match)
+
+        readings.sort(key=lambda reading: reading.start)
+        return readings
+
+    def parse_batch(self, texts: Iterable[str]) -> List[List[VitalSign]]:
+        """批量抽取"""
+        return [self.parse(text) for text in texts]
+
+    def extract(self, text: str) -> Dict[str, float]:
+        """返回 {指标: 数值}，同一指标出现多次时取最后一次（通常是最近的测量值），可直接交给分诊引擎"""
+        return {reading.name: reading.value for reading in self.parse(text)}
+
+    def extract_batch(self, texts: Iterable[str]) -> List[Dict[str, float]]:
+        return [self.extract(text) for text in texts]
+
+    @staticmethod
+    def _add(readings: List[VitalSign], name: str, value: Optional[float], text: str, match,
+             span=None) -> bool:
+        if value is None:
+            return False
+        low, high = PLAUSIBLE_RANGES[name]
+        if not low <= value <= high:
+            return False
+        start, end = span or match.span()
+        readings.append(VitalSign(name, round(value, 2), VITAL_UNITS[name], text[start:end], start, end))
+        return True
+
+    def _add_temperature(self, readings, text, match):
+        if match.group("value2"):
+            self._add(readings, "temperature", parse_number(match.group("value2")), text, match)
+            return
+
+        value = parse_number(match.group("value"))
+        if value is None:
+            return
+        fraction = match.group("fraction")
+        end = match.end()
+        if fraction:
+            # "三十九度五"、"39度5"中度后面的数字为小数位
+            if match.group("unit") == "度" and float(value).is_integer():
+                value += parse_number(fraction) / 10
+            else:
+                end = match.start("fraction")
+        # 不带单位的数值只在合理的体温范围内才认为是体温，如"发烧三天"不会被误识别
+        if not match.group("unit") and not 35 <= value <= 43:
+            return
+        self._add(readings, "temperature", value, text, match, (match.start(), end))
+
+    def _add_blood_pressure(self, readings, text, match):
+        for systolic_group, diastolic_group in (("systolic", "diastolic"), ("systolic2", "diastolic2"),
+                                                (None, "diastolic3"), ("systolic4", "diastolic4")):
+            systolic = match.group(systolic_group) if systolic_group else None
+            diastolic = match.group(diastolic_group)
+            if systolic is None and diastolic is None:
+                continue
+            if systolic is not None:
+                self._add(readings, "systolic_bp", parse_number(systolic), text, match)
+            if diastolic is not None:
+                self._add(readings, "diastolic_bp", parse_number(diastolic), text, match)
+            return
+
+    def _add_glucose(self, readings, text, match):
+        value = parse_number(match.group("value"))
+        if value is None:
+            return
+        unit = (match.group("unit") or "").lower()
+        # 以mg/dL为单位，或未写单位但数值明显超出mmol/L范围时换算
+        if unit in ("mg/dl", "毫克每分升") or (not unit and value > PLAUSIBLE_RANGES["blood_glucose"][1]):
+            value /= GLUCOSE_MG_PER_MMOL
+        self._add(readings, "blood_glucose", value, text, match)
+
+
+# 全局生命体征抽取器
+vital_sign_parser = VitalSignParser()
@@ -0,0 +1,421 @@
+"""@FileName: web_search.py
+@Description: 网络搜索子系统，可插拔的搜索提供方、连接池化的异步HTTP客户端、单次调用截止时间、失败重试和TTL结果缓存
+@Author: HengLine
+@Time: 2025/10/15 16:20
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Type
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 导入日志模块
+from hengline.logger import info, warning, debug
+from hengline.config import config_reader
+from hengline.tools.query_normalizer import query_normalizer
+from hengline.agent.http_clients import http_client_factory
+
+# 项目根目录，夹具文件路径相对于该目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 返回给智能体的提示文本，含"不可用"、"无法"的结果不会被缓存
+SEARCH_UNAVAILABLE = "网络搜索功能不可用"
+SEARCH_FAILED = "网络搜索暂时无法完成，请稍后重试"
+NO_RESULTS = "未找到相关的网络搜索结果"
+
+
+class SearchResult:
+    """一条搜索结果"""
+
+    __slots__ = ("title", "url", "snippet")
+
+    def __init__(self, title: str, url: str, snippet: str):
+        self.title = title
+        self.url = url
+        self.snippet = snippet
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"title": self.title, "url": self.url, "snippet": self.snippet}
+
+    def __repr__(self):
+        return f"SearchResult({self.title!r}, {self.url!r})"
+
+
+class SearchError(Exception):
+    """搜索提供方返回的错误，retryable表示是否值得在截止时间内重试"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SearchProvider(ABC):
+    """搜索提供方接口
+
+    子类实现asearch，在搜索服务的事件循环中执行；requires_http为True时，服务按endpoint
+    从http_client_factory获取共享连接池并传入异步HTTP客户端，提供方不应自行创建客户端。
+    """
+
+    name = "base"
+    requires_http = True
+    endpoint: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, search_config: Dict[str, Any]) -> "SearchProvider":
+        return cls()
+
+    @abstractmethod
+    async def asearch(self, query: str, max_results: int, client=None) -> List[SearchResult]:
+        """返回最多max_results条结果，可重试的错误抛出SearchError"""
+
+
+class DuckDuckGoProvider(SearchProvider):
+    """DuckDuckGo搜索，使用维护中的ddgs库
+
+    ddgs是同步库，搜索在线程中执行，不阻塞搜索服务的事件循环；截止时间和重试仍由搜索服务控制。
+    """
+
+    name = "duckduckgo"
+    requires_http = False
+
+    def __init__(self, region: str = "cn-zh", timeout: float = 8.0):
+        # 未安装ddgs时初始化失败，搜索服务记录警告并停用网络搜索
+        from ddgs import DDGS
+
+        self._ddgs_cls = DDGS
+        self.region = region
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, search_config: Dict[str, Any]) -> "DuckDuckGoProvider":
+        duckduckgo_config = search_config.get("duckduckgo", {})
+        return cls(region=duckduckgo_config.get("region", "cn-zh"), timeout=search_config.get("timeout", 8.0))
+
+    async def asearch(self, query: str, max_results: int, client=None) -> List[SearchResult]:
+        return await asyncio.to_thread(self._search, query, max_results)
+
+    def _search(self, query: str, max_results: int) -> List[SearchResult]:
+        from ddgs.exceptions import DDGSException, RatelimitException, TimeoutException
+
+        try:
+            rows = self._ddgs_cls(timeout=self.timeout).text(query, region=self.region, max_results=max_results)
+        except (RatelimitException, TimeoutException) as e:
+            raise SearchError(f"DuckDuckGo搜索失败: {str(e)}")
+        except DDGSException as e:
+            # 没有结果时ddgs抛出异常，按空结果处理
+            if "no results" in str(e).lower():
+                return []
+            raise SearchError(f"DuckDuckGo搜索失败: {str(e)}", retryable=False)
+
+        return [SearchResult(row.get("title", ""), row.get("href", ""), row.get("body", ""))
+                for row in (rows or [])[:max_results]]
+
+
+class FixtureSearchProvider(SearchProvider):
+    """基于本地夹具文件的搜索提供方，按关键词匹配返回预置结果，可模拟网络延迟，用于离线运行和性能测试"""
+
+    name = "fixture"
+    requires_http = False
+
+    def __init__(self, fixtures: List[Dict[str, Any]], latency: float = 0.0):
+        self.latency = latency
+        # [(规范化后的关键词, 结果)]，关键词与查询使用同一规范化，繁体和全角写法同样能命中
+        self._entries = []
+        for entry in fixtures:
+            keywords = [query_normalizer.normalize(keyword) for keyword in entry.get("keywords", [])]
+            results = [SearchResult(result.get("title", ""), result.get("url", ""), result.get("snippet", ""))
+                       for result in entry.get("results", [])]
+            self._entries.append((keywords, results))
+
+    @classmethod
+    def from_config(cls, search_config: Dict[str, Any]) -> "FixtureSearchProvider":
+        fixture_config = search_config.get("fixture", {})
+        return cls.from_file(fixture_config.get("path", "data/search/fixtures.json"),
+                             latency=fixture_config.get("latency", 0.0))
+
+    @classmethod
+    def from_file(cls, path: str, latency: float = 0.0) -> "FixtureSearchProvider":
+        if not os.path.isabs(path):
+            path = os.path.join(PROJECT_ROOT, path)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), latency=latency)
+
+    async def asearch(self, query: str, max_results: int, client=None) -> List[SearchResult]:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        # 按命中关键词的总长度排序，命中越具体的条目越靠前
+        normalized = query_normalizer.normalize(query)
+        scored = []
+        for index, (keywords, results) in enumerate(self._entries):
+            score = sum(len(keyword) for keyword in keywords if keyword and keyword in normalized)
+            if score:
+                scored.append((-score, index, results))
+        scored.sort(key=lambda item: item[:2])
+
+        matched = []
+        for _, _, results in scored:
+            matched.extend(results)
+        return matched[:max_results]
+
+
+# 可用的搜索提供方，按配置中的provider名称选择
+SEARCH_PROVIDERS: Dict[str, Type[SearchProvider]] = {
+    DuckDuckGoProvider.name: DuckDuckGoProvider,
+    FixtureSearchProvider.name: FixtureSearchProvider,
+}
+
+
+def register_search_provider(provider_cls: Type[SearchProvider]):
+    """注册自定义搜索提供方，之后可在配置中通过provider_cls.name选择"""
+    SEARCH_PROVIDERS[provider_cls.name] = provider_cls
+    return provider_cls
+
+
+def format_results(results: List[SearchResult]) -> str:
+    """将搜索结果格式化为交给模型的文本"""
+    if not results:
+        return NO_RESULTS
+    return "\n\n".join(f"{index}. {result.title}\n{result.snippet}\n来源: {result.url}"
+                       for index, result in enumerate(results, 1))
+
+
+class WebSearchService:
+    """网络搜索服务
+
+    所有搜索都在一个专用的后台事件循环中执行，需要HTTP的提供方使用http_client_factory的共享连接池：
+    - 同步调用方（工具线程）最多等待截止时间，慢速的搜索提供方不会长时间占用工作线程；
+    - 异步调用方在自己的事件循环中等待，不占用线程；
+    - 每次调用有截止时间，截止时间内对可重试的错误按指数退避重试；
+    - 结果按规范化后的查询缓存一段时间，相同查询的并发调用只请求一次。
+    """
+
+    def __init__(self, provider: Optional[SearchProvider], enabled: bool = True, max_results: int = 5,
+                 timeout: float = 8.0, retries: int = 1, retry_backoff: float = 0.3, cache_ttl: float = 300,
+                 cache_size: int = 512, http_config: Dict[str, Any] = None):
+        self.provider = provider
+        self.enabled = enabled and provider is not None
+        self.max_results = max_results
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self.cache_ttl = cache_ttl
+        self.cache_size = max(1, cache_size)
+        self.http_config = http_config or {}
+
+        # 缓存键 -> (结果文本, 过期时间)，按最近使用顺序排列
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 后台事件循环及其上的HTTP客户端、进行中的搜索，均在首次搜索时创建
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        self._stats = {"calls": 0, "cache_hits": 0, "coalesced": 0, "provider_calls": 0, "retries": 0,
+                       "timeouts": 0, "errors": 0, "total_latency": 0.0, "fetches": 0}
+
+    @classmethod
+    def from_config(cls, search_config: Dict[str, Any] = None) -> "WebSearchService":
+        search_config = search_config or {}
+        provider_name = search_config.get("provider", DuckDuckGoProvider.name)
+        provider = None
+        provider_cls = SEARCH_PROVIDERS.get(provider_name)
+        if provider_cls is None:
+            warning(f"未知的网络搜索提供方: {provider_name}，网络搜索功能将不可用")
+        else:
+            try:
+                provider = provider_cls.from_config(search_config)
+            except Exception as e:
+                warning(f"网络搜索提供方 {provider_name} 初始化失败，网络搜索功能将不可用: {str(e)}")
+
+        service = cls(provider,
+                      enabled=search_config.get("enabled", True),
+                      max_results=search_config.get("max_results", 5),
+                      timeout=search_config.get("timeout", 8.0),
+                      retries=search_config.get("retries", 1),
+                      retry_backoff=search_config.get("retry_backoff", 0.3),
+                      cache_ttl=search_config.get("cache_ttl", 300),
+                      cache_size=search_config.get("cache_size", 512),
+                      http_config=search_config.get("http", {}))
+        if service.enabled:
+            info(f"网络搜索已启用: 提供方 {provider_name}，截止时间 {service.timeout}秒，缓存 {service.cache_ttl}秒")
+        return service
+
+    def search(self, query: str) -> str:
+        """同步搜索，最多等待截止时间，超时后返回提示文本，后台的请求仍会按截止时间结束"""
+        if not self.enabled:
+            return SEARCH_UNAVAILABLE
+        self._count("calls")
+        cached = self._lookup(query_normalizer.cache_key(query))
+        if cached is not None:
+            return cached
+
+        future = asyncio.run_coroutine_threadsafe(self._search(query), self._ensure_loop())
+        try:
+            # _search自身按截止时间结束，这里多留一点余量给线程切换
+            return future.result(timeout=self.timeout + 1)
+        except FutureTimeoutError:
+            future.cancel()
+            return SEARCH_FAILED
+
+    async def asearch(self, query: str) -> str:
+        """异步搜索，在后台事件循环中执行，调用方的事件循环不会被阻塞"""
+        if not self.enabled:
+            return SEARCH_UNAVAILABLE
+        self._count("calls")
+        cached = self._lookup(query_normalizer.cache_key(query))
+        if cached is not None:
+            return cached
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._search(query), self._ensure_loop()))
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="web-search", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _get_client(self):
+        """在后台事件循环中创建异步HTTP客户端，连接使用http_client_factory中按endpoint共享的连接池"""
+        if self._client is None and self.provider.requires_http:
+            import httpx
+
+            http_config = self.http_config
+            pool_config = dict(http_config, timeout=self.timeout)
+            _, transport = http_client_factory.get_transports(self.provider.endpoint, pool_config)
+            self._client = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(self.timeout, connect=http_config.get("connect_timeout", 3)),
+                headers={"User-Agent": http_config.get("user_agent", "Mozilla/5.0 (compatible; HengLineMedicalAgent)")},
+                follow_redirects=True)
+        return self._client
+
+    async def _search(self, query: str) -> str:
+        """在后台事件循环中执行：查缓存，相同查询共用一次请求"""
+        key = query_normalizer.cache_key(query)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(query, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._count("coalesced")
+        # shield保证某个调用方超时取消时，不影响其他等待同一结果的调用方
+        return await asyncio.shield(task)
+
+    async def _fetch(self, query: str, key: str) -> str:
+        """在截止时间内请求搜索提供方，可重试的错误按指数退避重试"""
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        deadline = start_time + self.timeout
+        client = self._get_client()
+
+        attempt = 0
+        while True:
+            self._count("provider_calls")
+            try:
+                results = await asyncio.wait_for(self.provider.asearch(query, self.max_results, client),
+                                                 deadline - loop.time())
+                break
+            except asyncio.TimeoutError:
+                self._count("timeouts")
+                warning(f"网络搜索超时（{self.timeout}秒）: {query}")
+                return SEARCH_FAILED
+            except Exception as e:
+                retryable = getattr(e, "retryable", True)
+                delay = self.retry_backoff * (2 ** attempt)
+                if not retryable or attempt >= self.retries or loop.time() + delay >= deadline:
+                    self._count("errors")
+                    warning(f"网络搜索失败: {query}，{type(e).__name__}: {str(e)}")
+                    return SEARCH_FAILED
+                attempt += 1
+                self._count("retries")
+                debug(f"网络搜索第{attempt}次重试: {query}，{type(e).__name__}: {str(e)}")
+                await asyncio.sleep(delay)
+
+        text = format_results(results)
+        self._store(key, text)
+        with self._lock:
+            self._stats["fetches"] += 1
+            self._stats["total_latency"] += loop.time() - start_time
+        return text
+
+    def _lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            text, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            self._stats["cache_hits"] += 1
+            return text
+
+    def _store(self, key: str, text: str):
+        if self.cache_ttl <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (text, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _count(self, field: str):
+        with self._lock:
+            self._stats[field] += 1
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    async def aclose(self):
+        """关闭HTTP客户端（不关闭共享的连接池）并停止后台事件循环"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def close_client():
+            if self._client is not None:
+                await self._client.aclose()
+                self._client = None
+
+        try:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(close_client(), loop))
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {key: value for key, value in self._stats.items() if key not in ("total_latency", "fetches")}
+            fetches = self._stats["fetches"]
+            stats.update({
+                "enabled": self.enabled,
+                "provider": self.provider.name if self.provider else None,
+                "cache_entries": len(self._cache),
+                "cache_hit_rate": round(self._stats["cache_hits"] / self._stats["calls"], 4)
+                if self._stats["calls"] else 0.0,
+                "avg_fetch_latency_ms": round(self._stats["total_latency"] / fetches * 1000, 2) if fetches else 0.0,
+                "inflight": len(self._inflight)
+            })
+            return stats
+
+
+# 全局网络搜索服务，所有智能体实例共享同一个连接池和结果缓存
+web_search_service = WebSearchService.from_config(config_reader.get_module_config("web_search"))
@@ -0,0 +1,53 @@
+"""@FileName: test_agent_budget.py
+@Description: 智能体预算测试，验证同步路径在模型调用返回时检查截止时间，超时后不再执行请求的工具调用
+@Author: HengLine
+@Time: 2025/10/19 19:40
+"""
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from hengline.agent.agent_budget import AgentBudget, REASON_DEADLINE
+from hengline.agent.base_agent import BaseMedicalAgent
+from hengline.agent.session_manager import SessionManager
+
+
+class SlowAgentPrompt:
+    """模型调用耗时超过截止时间，且仍请求工具调用"""
+
+    def invoke(self, inputs, config=None):
+        time.sleep(0.05)
+        return AIMessage(content="", tool_calls=[
+            {"name": "query_medical_knowledge_tool", "args": {"query": "头痛"}, "id": "call-2"}])
+
+
+class Prompts:
+    def get(self, name):
+        return SlowAgentPrompt()
+
+
+class StubAgent(BaseMedicalAgent):
+    def _initialize_llm(self):
+        return None
+
+
+def test_sync_node_drops_tool_calls_after_deadline():
+    agent = object.__new__(StubAgent)
+    agent.prompts = Prompts()
+    agent.session_manager = SessionManager({})
+    tracker = AgentBudget({"timeout_seconds": 0.03}).new_tracker()
+    state = {"messages": [HumanMessage(content="头痛怎么办"),
+                          AIMessage(content="", tool_calls=[
+                              {"name": "query_medical_knowledge_tool", "args": {"query": "头痛"}, "id": "call-1"}]),
+                          ToolMessage(content="多休息", tool_call_id="call-1")]}
+
+    result = agent._budgeted_agent_node(state, {"configurable": {"budget_tracker": tracker}})
+    response = result["messages"][-1]
+    assert not response.tool_calls
+    assert "多休息" in response.content
+    assert tracker.exhausted_reason == REASON_DEADLINE
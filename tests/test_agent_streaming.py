@@ -0,0 +1,88 @@
+"""@FileName: test_agent_streaming.py
+@Description: 智能体流式事件转换测试，验证token随模型输出即时发送，以工具调用结束的一轮发送thinking或discard
+@Author: HengLine
+@Time: 2025/10/19 18:30
+"""
+import asyncio
+import itertools
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from hengline.agent.base_agent import BaseMedicalAgent
+
+AGENT = {"langgraph_node": "agent"}
+
+
+def model_turn(chunks, output, log):
+    """一轮模型调用的事件，结束事件被读取时记录到log"""
+    yield {"event": "on_chat_model_start", "name": "model", "metadata": AGENT, "data": {}}
+    for chunk in chunks:
+        yield {"event": "on_chat_model_stream", "name": "model", "metadata": AGENT, "data": {"chunk": chunk}}
+    log.append("on_chat_model_end")
+    yield {"event": "on_chat_model_end", "name": "model", "metadata": AGENT, "data": {"output": output}}
+
+
+def tool_call_chunk():
+    return AIMessageChunk(content="", tool_call_chunks=[
+        {"name": "query_medical_knowledge_tool", "args": '{"query": "头痛"}', "id": "call-1", "index": 0}])
+
+
+def tool_events():
+    yield {"event": "on_tool_start", "name": "query_medical_knowledge_tool", "metadata": {},
+           "data": {"input": {"query": "头痛"}}}
+    yield {"event": "on_tool_end", "name": "query_medical_knowledge_tool", "metadata": {},
+           "data": {"output": ToolMessage(content="知识\n\n信息来源: a.txt", tool_call_id="call-1")}}
+
+
+async def collect(events, log):
+    """逐个读取事件进行转换，不预先读取后续事件"""
+    async def source():
+        for event in events:
+            yield event
+
+    results = []
+    async for event in BaseMedicalAgent._convert_agent_events(source()):
+        log.append(event["event"])
+        results.append(event)
+    return results
+
+
+def test_tokens_are_sent_before_model_end():
+    log = []
+    chunks = [AIMessageChunk(content=text) for text in ("多", "喝", "水")]
+    events = model_turn(chunks, AIMessage(content="多喝水"), log)
+
+    results = asyncio.run(collect(events, log))
+    assert log.index("token") < log.index("on_chat_model_end")
+    assert [event["data"]["content"] for event in results if event["event"] == "token"] == ["多", "喝", "水"]
+    assert results[-1] == {"event": "done", "data": {"answer": "多喝水"}}
+
+
+def test_text_before_tool_call_is_discarded():
+    log = []
+    tool_call = {"name": "query_medical_knowledge_tool", "args": {"query": "头痛"}, "id": "call-1"}
+    first_turn = model_turn([AIMessageChunk(content="让我查一下"), tool_call_chunk()],
+                            AIMessage(content="让我查一下", tool_calls=[tool_call]), log)
+    final_turn = model_turn([AIMessageChunk(content="注意休息")], AIMessage(content="注意休息"), log)
+
+    results = asyncio.run(collect(itertools.chain(first_turn, tool_events(), final_turn), log))
+    kinds = [event["event"] for event in results]
+    assert kinds == ["token", "discard", "tool_start", "tool_end", "token", "sources", "done"]
+    assert results[1]["data"]["content"] == "让我查一下"
+    assert results[-1]["data"]["answer"] == "注意休息"
+
+
+def test_text_after_tool_call_chunk_is_thinking():
+    log = []
+    tool_call = {"name": "query_medical_knowledge_tool", "args": {"query": "头痛"}, "id": "call-1"}
+    turn = model_turn([tool_call_chunk(), AIMessageChunk(content="查询知识库")],
+                      AIMessage(content="查询知识库", tool_calls=[tool_call]), log)
+
+    results = asyncio.run(collect(turn, log))
+    assert [event["event"] for event in results] == ["thinking", "done"]
+    assert results[-1]["data"]["answer"] == ""
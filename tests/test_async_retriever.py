@@ -0,0 +1,38 @@
+"""@FileName: test_async_retriever.py
+@Description: 异步多查询检索器测试，验证融合排序后按最高相关度确认快速路径，以及线程池按各检索器的配置创建
+@Author: HengLine
+@Time: 2025/10/19 20:00
+"""
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain_core.documents import Document
+
+from hengline.agent.async_retriever import AsyncMultiQueryRetriever, top_relevance_score
+
+
+def doc(name):
+    return Document(page_content=name, metadata={"source": f"{name}.txt"})
+
+
+def test_router_score_is_max_relevance_after_rrf():
+    # 两个变体都命中的文档融合得分最高，但相关度低于只被一个变体命中的文档
+    queries = ["头痛怎么办", "头痛"]
+    results = [[(doc("common"), 0.4), (doc("best"), 0.9)],
+               [(doc("common"), 0.45)]]
+    merged = AsyncMultiQueryRetriever._merge_results(queries, results, k=3)
+
+    assert merged[0][0].page_content == "common"
+    assert top_relevance_score(merged) == 0.9
+    assert top_relevance_score([]) is None
+
+
+def test_executor_is_sized_per_retriever():
+    small = AsyncMultiQueryRetriever(None, max_workers=1)
+    large = AsyncMultiQueryRetriever(None, max_workers=8)
+    assert small._executor is not large._executor
+    assert small._executor._max_workers == 1
+    assert large._executor._max_workers == 8
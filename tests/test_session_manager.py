@@ -0,0 +1,57 @@
+"""@FileName: test_session_manager.py
+@Description: 会话管理测试，验证会话摘要并入唯一的系统消息，以及SQLite中之前运行保存的会话在启动时按空闲时间过期
+@Author: HengLine
+@Time: 2025/10/19 19:10
+"""
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langgraph.graph import START, MessagesState, StateGraph
+
+from hengline.agent import session_manager as session_module
+from hengline.agent.base_agent import AGENT_PROMPT, FINALIZE_PROMPT
+from hengline.agent.session_manager import SessionManager
+
+
+def test_summary_is_merged_into_single_system_message():
+    state = {"messages": [HumanMessage(content="还需要吃药吗")], "summary": "用户发热三天，已服用布洛芬"}
+    for prompt in (AGENT_PROMPT, FINALIZE_PROMPT):
+        messages = prompt.invoke({"messages": state["messages"],
+                                  "summary": SessionManager.summary_prompt(state)}).to_messages()
+        system_messages = [message for message in messages if isinstance(message, SystemMessage)]
+        assert len(system_messages) == 1
+        assert messages[0] is system_messages[0]
+        assert "布洛芬" in system_messages[0].content
+
+    messages = AGENT_PROMPT.invoke({"messages": state["messages"]}).to_messages()
+    assert isinstance(messages[0], SystemMessage) and "摘要" not in messages[0].content
+
+
+def _save_session(manager, session_id):
+    graph = StateGraph(MessagesState)
+    graph.add_node("echo", lambda state: {"messages": []})
+    graph.add_edge(START, "echo")
+    graph.compile(checkpointer=manager.checkpointer).invoke(
+        {"messages": [HumanMessage(content="头痛")]}, {"configurable": manager.thread_config(session_id)})
+
+
+def test_sqlite_sessions_from_previous_run_expire(tmp_path, monkeypatch):
+    config = {"backend": "sqlite", "sqlite_path": str(tmp_path / "sessions.db"), "ttl_seconds": 3600}
+    _save_session(SessionManager(config), "old-session")
+
+    # 未超过空闲时间的会话在重新启动后保留
+    restarted = SessionManager(config)
+    assert restarted.checkpointer.get_tuple({"configurable": {"thread_id": "old-session"}}) is not None
+    assert "old-session" in restarted._last_used
+
+    # 超过空闲时间后重新启动，会话在创建检查点时被删除
+    now = time.time()
+    monkeypatch.setattr(session_module.time, "time", lambda: now + 7200)
+    restarted = SessionManager(config)
+    assert restarted.checkpointer.get_tuple({"configurable": {"thread_id": "old-session"}}) is None
+    assert "old-session" not in restarted._last_used
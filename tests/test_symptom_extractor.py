@@ -0,0 +1,60 @@
+"""@FileName: test_symptom_extractor.py
+@Description: 症状抽取测试，验证否定识别的作用范围、伪否定短语和同义词扩展数量
+@Author: HengLine
+@Time: 2025/10/19 17:20
+"""
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from hengline.tools.symptom_extractor import BUILTIN_LEXICON, SymptomExtractor, symptom_extractor
+from hengline.tools.triage_engine import triage_engine
+
+
+@pytest.mark.parametrize("text, symptom", [
+    ("心里不舒服胸痛", "胸痛"),
+    ("最近身体不舒服头晕", "头晕"),
+    ("排除发热后出现咳嗽", "咳嗽"),
+    ("不想吃饭头晕", "头晕"),
+    ("没有发热但咳嗽", "咳嗽"),
+    ("身体不适，发热", "发热"),
+])
+def test_symptom_after_unrelated_negation_is_kept(text, symptom):
+    assert symptom in symptom_extractor.extract(text)
+
+
+@pytest.mark.parametrize("text, symptom", [
+    ("不咳嗽", "咳嗽"),
+    ("不怎么咳嗽", "咳嗽"),
+    ("没有发热、咳嗽", "咳嗽"),
+    ("没有出现咳嗽", "咳嗽"),
+    ("未出现发热", "发热"),
+    ("否认胸痛", "胸痛"),
+    ("排除发热后出现咳嗽", "发热"),
+    ("发热不明显", "发热"),
+    ("发热已经退了", "发热"),
+])
+def test_negated_symptom(text, symptom):
+    assert symptom in symptom_extractor.extract_negated(text)
+    assert symptom not in symptom_extractor.extract(text)
+
+
+def test_discomfort_before_chest_pain_is_not_triaged_as_no_symptoms():
+    result = triage_engine.assess_text("心里不舒服胸痛")
+    assert "胸痛" in result.symptoms
+    assert result.severity != "无明显症状"
+
+
+def test_expand_synonyms_respects_max_synonyms():
+    extractor = SymptomExtractor({"发热": ["发烧", "高烧", "低烧", "身上烫", "体温高"]}, max_synonyms=3)
+    assert extractor.expand_synonyms("发热") == "发热 发烧 高烧 低烧"
+
+
+def test_builtin_lexicon_extraction():
+    extractor = SymptomExtractor(BUILTIN_LEXICON)
+    assert extractor.extract("发烧三天，咳嗽，无腹泻") == ["发热", "咳嗽"]
+    assert extractor.extract_negated("发烧三天，咳嗽，无腹泻") == ["腹泻"]
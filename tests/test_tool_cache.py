@@ -0,0 +1,71 @@
+"""@FileName: test_tool_cache.py
+@Description: 工具结果缓存测试，验证并发调用合并，以及发起计算的请求被取消时其他请求的等待方接手计算
+@Author: HengLine
+@Time: 2025/10/19 17:50
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from hengline.tools.tool_cache import ToolResultCache
+
+
+def test_concurrent_calls_are_coalesced():
+    cache = ToolResultCache(default_ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "结果"
+
+    async def main():
+        return await asyncio.gather(*[cache.aget_or_compute("tool", {"query": "头痛"}, compute) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["结果"] * 5
+    assert len(calls) == 1
+
+
+def test_follower_takes_over_when_owner_is_cancelled():
+    cache = ToolResultCache(default_ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "结果"
+
+    async def main():
+        owner = asyncio.create_task(cache.aget_or_compute("tool", {"query": "头痛"}, compute))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(cache.aget_or_compute("tool", {"query": "头痛"}, compute))
+                     for _ in range(3)]
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == ["结果"] * 3
+    # 发起请求的计算被取消，第一个等待方重新计算一次，其余等待方合并到该计算
+    assert len(calls) == 2
+
+
+def test_owner_error_is_shared_with_followers():
+    cache = ToolResultCache(default_ttl=60)
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        raise ValueError("工具出错")
+
+    async def main():
+        return await asyncio.gather(*[cache.aget_or_compute("tool", {"query": "头痛"}, compute) for _ in range(3)],
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
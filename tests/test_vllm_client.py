@@ -0,0 +1,122 @@
+"""@FileName: test_vllm_client.py
+@Description: vLLM服务客户端测试，在本地端口启动模拟vLLM服务，验证普通和流式输出、工具调用、模型信息和max_model_len限制
+@Author: HengLine
+@Time: 2025/10/19 16:30
+"""
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+import uvicorn
+from langchain_core.tools import tool
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from hengline.agent.vllm.vllm_client import ChatVLLM, VLLMServerClient, create_vllm_chat_model
+from hengline.demo.vllm_stub_server import REPLY, create_app
+
+MODEL = "stub-model"
+MAX_MODEL_LEN = 256
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    """在后台线程中启动模拟vLLM服务，返回OpenAI兼容接口地址"""
+    port = _free_port()
+    app = create_app(model=MODEL, latency=0.001, token_latency=0.001, max_model_len=MAX_MODEL_LEN)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            pytest.fail("模拟vLLM服务启动超时")
+        time.sleep(0.01)
+
+    yield f"http://127.0.0.1:{port}/v1"
+
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def llm(base_url):
+    return create_vllm_chat_model({"base_url": base_url, "served_model_name": MODEL, "max_tokens": 32,
+                                   "temperature": 0, "max_model_len": MAX_MODEL_LEN,
+                                   "server": {"max_retries": 0}})
+
+
+@tool
+def query_medical_knowledge_tool(query: str) -> str:
+    """查询医疗知识库"""
+    return query
+
+
+def test_invoke_returns_text(llm):
+    response = llm.invoke("我头痛怎么办")
+    assert response.content == REPLY[:32]
+
+
+def test_ainvoke_returns_text(llm):
+    response = asyncio.run(llm.ainvoke("我头痛怎么办"))
+    assert response.content == REPLY[:32]
+
+
+def test_stream_yields_multiple_chunks(llm):
+    chunks = [chunk.content for chunk in llm.stream("我头痛怎么办") if chunk.content]
+    assert len(chunks) > 1
+    assert "".join(chunks) == REPLY[:32]
+
+
+def test_bind_tools_returns_tool_calls(llm):
+    response = llm.bind_tools([query_medical_knowledge_tool]).invoke("我头痛怎么办")
+    assert response.tool_calls
+    assert response.tool_calls[0]["name"] == "query_medical_knowledge_tool"
+    assert response.tool_calls[0]["args"] == {"query": "头痛"}
+
+
+def test_server_client_model_info_and_health(base_url):
+    client = VLLMServerClient(base_url, model=MODEL)
+    assert client.get_model_info()["max_model_len"] == MAX_MODEL_LEN
+    assert client.health()
+
+
+def test_max_tokens_clamped_to_max_model_len(base_url):
+    llm = ChatVLLM(model=MODEL, api_key="EMPTY", base_url=base_url, max_tokens=1024, max_retries=0,
+                   max_model_len=MAX_MODEL_LEN)
+    payload = llm._get_request_payload("你好")
+    # 为提示保留min_prompt_tokens，最多保留上下文的一半
+    assert payload["max_tokens"] == MAX_MODEL_LEN // 2
+    assert payload["extra_body"]["truncate_prompt_tokens"] == MAX_MODEL_LEN // 2
+    # 限制后的请求不再因max_tokens超过模型长度被服务端拒绝
+    assert llm.invoke("你好").content == REPLY
+
+    llm = ChatVLLM(model=MODEL, api_key="EMPTY", base_url=base_url, max_tokens=1024, max_retries=0,
+                   max_model_len=MAX_MODEL_LEN, min_prompt_tokens=64)
+    payload = llm._get_request_payload("你好")
+    assert payload["max_tokens"] == MAX_MODEL_LEN - 64
+    assert payload["extra_body"]["truncate_prompt_tokens"] == 64
+
+
+def test_long_prompt_truncated_instead_of_rejected(llm, base_url):
+    prompt = "头痛" * MAX_MODEL_LEN
+    payload = llm._get_request_payload(prompt)
+    assert payload["max_tokens"] == 32
+    assert payload["extra_body"]["truncate_prompt_tokens"] == MAX_MODEL_LEN - 32
+    assert llm.invoke(prompt).content == REPLY[:32]
+
+    # 未设置max_model_len时，服务端拒绝超长的提示
+    unbounded = ChatVLLM(model=MODEL, api_key="EMPTY", base_url=base_url, max_tokens=32, max_retries=0)
+    with pytest.raises(Exception, match="maximum context length"):
+        unbounded.invoke(prompt)